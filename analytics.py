@@ -0,0 +1,145 @@
+"""
+Item analytics for the Bestellungen tab: top and least ordered items and the
+quarterly pivot of the seasonal analysis.
+
+The figures count the deliveries up to today: one grouped query sums the
+order items of past (not is_future) plain orders and of subscription
+overrides delivered by today, bucketed by year and quarter of the delivery
+date with strftime, and the occurrences of the subscription rules up to today
+(expand_subscriptions) are added to the same buckets. The buckets are cached
+per year. An OrderChanged with dates only drops the years of its dates, so
+editing this week's order re-reads one year instead of the whole history;
+rule changes (OrderChanged without dates) and a new day re-read everything.
+"""
+from collections import namedtuple
+from datetime import date
+from peewee import fn
+from models import db, Item, Order, OrderItem, Subscription
+from database import expand_subscriptions
+from events import bus, OrderChanged, ItemChanged
+
+# Quarterly figures are lists of four values, Q1 first
+ItemStats = namedtuple('ItemStats', ['item_id', 'name', 'total_amount', 'order_count', 'total_revenue', 'quarters'])
+
+class ItemAnalytics:
+    def __init__(self):
+        self.years = None  # year -> {item_id: [(amount, order count, revenue) per quarter]}, None if not loaded
+        self.stale = set()  # Years to re-read on the next access
+        self.names = {}
+        self.loaded_on = None  # Day the buckets were read, later subscription occurrences weren't delivered yet
+
+    def invalidate(self, events=None):
+        """Bus handler: drop the years the events can affect"""
+        for event in events or [None]:
+            if isinstance(event, OrderChanged) and event.dates is not None and self.years is not None:
+                self.stale.update(day.year for day in event.dates)
+            else:
+                # Subscription rules, item prices and names can change every year
+                self.years = None
+                self.stale.clear()
+
+    def _load(self, years=None):
+        """Read the buckets of the given years (all if None), deliveries up to today"""
+        today = date.today()
+        year = fn.strftime('%Y', Order.delivery_date).cast('INTEGER')
+        quarter = (fn.strftime('%m', Order.delivery_date).cast('INTEGER') + 2) / 3
+        query = (OrderItem
+                 .select(Item.id, Item.name, year.alias('year'), quarter.alias('quarter'),
+                         fn.SUM(OrderItem.amount), fn.COUNT(OrderItem.id),
+                         fn.SUM(OrderItem.amount * Item.price))
+                 .join(Order)
+                 .switch(OrderItem)
+                 .join(Item)
+                 .where(((Order.is_future == False) & Order.subscription.is_null()) |
+                        (Order.subscription.is_null(False) & (Order.delivery_date <= today)))
+                 .group_by(Item.id, year, quarter))
+        if years is not None:
+            # Date ranges instead of strftime keep the delivery_date index usable
+            ranges = [(Order.delivery_date >= date(y, 1, 1)) & (Order.delivery_date <= date(y, 12, 31))
+                      for y in years]
+            condition = ranges[0]
+            for other in ranges[1:]:
+                condition |= other
+            query = query.where(condition)
+
+        buckets = {}
+        with db.reporting():
+            rows = list(query.tuples())
+            occurrences = self._occurrences(years, today)
+        for item_id, name, row_year, row_quarter, amount, count, revenue in rows:
+            self.names[item_id] = name
+            quarters = buckets.setdefault(row_year, {}).setdefault(item_id, [(0.0, 0, 0.0)] * 4)
+            quarters[row_quarter - 1] = (amount or 0.0, count, revenue or 0.0)
+        for occurrence in occurrences:
+            delivery = occurrence['delivery_date']
+            for line in occurrence['items']:
+                self.names[line.item_id] = line.item.name
+                quarters = buckets.setdefault(delivery.year, {}).setdefault(line.item_id, [(0.0, 0, 0.0)] * 4)
+                amount, count, revenue = quarters[(delivery.month - 1) // 3]
+                quarters[(delivery.month - 1) // 3] = (amount + line.amount, count + 1,
+                                                       revenue + line.amount * line.item.price)
+        return buckets
+
+    def _occurrences(self, years, today):
+        """Occurrences of the subscription rules delivered up to today, in the given years (all if None)"""
+        first = Subscription.select(fn.MIN(Subscription.from_date)).scalar()
+        if first is None:
+            return []
+        if years is not None:
+            first = max(first, date(min(years), 1, 1))
+            today = min(today, date(max(years), 12, 31))
+        if first > today:
+            return []
+        return [occurrence for occurrence in expand_subscriptions(first, today)
+                if years is None or occurrence['delivery_date'].year in years]
+
+    def buckets(self):
+        """The per year buckets, reading only what is missing or stale"""
+        if self.years is None or self.loaded_on != date.today():
+            self.loaded_on = date.today()
+            self.years = self._load()
+            self.stale.clear()
+        elif self.stale:
+            stale, self.stale = sorted(self.stale), set()
+            fresh = self._load(stale)
+            for year in stale:
+                self.years.pop(year, None)
+            self.years.update(fresh)
+        return self.years
+
+    def available_years(self):
+        return sorted(self.buckets(), reverse=True)
+
+    def item_stats(self, year=None):
+        """ItemStats of every ordered item, of one year or all years, most ordered first"""
+        buckets = self.buckets()
+        years = [buckets.get(year, {})] if year is not None else list(buckets.values())
+        totals = {}
+        for items in years:
+            for item_id, quarters in items.items():
+                total = totals.setdefault(item_id, [[0.0, 0, 0.0] for _ in range(4)])
+                for index, (amount, count, revenue) in enumerate(quarters):
+                    total[index][0] += amount
+                    total[index][1] += count
+                    total[index][2] += revenue
+        stats = [
+            ItemStats(item_id, self.names[item_id],
+                      sum(q[0] for q in quarters), sum(q[1] for q in quarters), sum(q[2] for q in quarters),
+                      [q[0] for q in quarters])
+            for item_id, quarters in totals.items()
+        ]
+        return sorted(stats, key=lambda s: (-s.total_amount, s.name))
+
+    def top_items(self, limit=5, year=None):
+        return self.item_stats(year)[:limit]
+
+    def least_items(self, limit=5, year=None):
+        ordered = [s for s in self.item_stats(year) if s.total_amount > 0]
+        return sorted(ordered, key=lambda s: (s.total_amount, s.name))[:limit]
+
+    def seasonal(self, limit=10, year=None):
+        """Quarterly amounts of the most ordered items"""
+        return self.item_stats(year)[:limit]
+
+item_analytics = ItemAnalytics()
+bus.subscribe(item_analytics.invalidate, OrderChanged, ItemChanged)
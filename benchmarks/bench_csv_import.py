@@ -0,0 +1,86 @@
+"""
+Benchmark: importing a synthetic export in the Orders.csv format.
+
+Writes a CSV with the given number of rows (default one million: 200
+customers, weekly orders of four to six items over the years, every tenth
+customer on a subscription) and imports it with several batch sizes into a
+fresh database each, every run in its own process. Reports rows per second
+and the peak resident memory of the importing process, which stays flat as
+the file grows, and the time of importing the same file again, which writes
+nothing.
+
+Usage:
+    python benchmarks/bench_csv_import.py [rows] [batch sizes, comma separated]
+"""
+import csv
+import os
+import sys
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from common import setup_database, create_catalog, ITEM_SPECS
+from models import db
+from importer import COLUMNS, OrderImporter
+
+CUSTOMERS = 200
+
+def write_export(path, rows):
+    """Write rows order lines, grouped by order like the old system exports them"""
+    start = date(2015, 1, 5)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csvfile:
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+        writer.writerow(COLUMNS)
+        written = 0
+        order = 0
+        while written < rows:
+            customer = order % CUSTOMERS
+            delivery = start + timedelta(days=7 * (order // CUSTOMERS) + customer % 5)
+            subscription = customer % 10 == 0
+            for line in range(min(4 + order % 3, rows - written)):
+                name = ITEM_SPECS[(order + line) % len(ITEM_SPECS)][0]
+                writer.writerow([
+                    f"Kunde {customer:03d}", name, f"{1 + line * 0.5:.1f}".replace('.', ','),
+                    delivery.strftime('%d.%m.%y'), "",
+                    "1" if subscription else "0",
+                    delivery.strftime('%d.%m.%y') if subscription else "",
+                    (delivery + timedelta(weeks=52)).strftime('%d.%m.%y') if subscription else "",
+                    "4,5",
+                ])
+            written += line + 1
+            order += 1
+
+def import_once(directory, path, batch_size):
+    setup_database(os.path.join(directory, f'import-{batch_size}.db'))
+    create_catalog(customer_count=CUSTOMERS)
+    began = time.perf_counter()
+    stats = OrderImporter(batch_size=batch_size).run(path)
+    elapsed = time.perf_counter() - began
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    began = time.perf_counter()
+    OrderImporter(batch_size=batch_size).run(path)
+    again = time.perf_counter() - began
+    db.close()
+    return elapsed, peak, again, stats
+
+def run(rows, batch_sizes):
+    directory = tempfile.mkdtemp(prefix='kleinblatt-bench-')
+    path = os.path.join(directory, 'Orders.csv')
+    write_export(path, rows)
+    print(f"{rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    for batch_size in batch_sizes:
+        # A fresh process per run, so the peak memory is that run's
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            elapsed, peak, again, stats = pool.submit(import_once, directory, path, batch_size).result()
+        print(f"batch {batch_size:>6} | {elapsed:7.1f} s | {rows / elapsed:9.0f} rows/s | "
+              f"peak RSS {peak:6.1f} MB | again {again:6.1f} s | "
+              f"{stats['orders']} orders, {stats['subscriptions']} subscriptions")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    batch_sizes = [int(size) for size in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1000, 5000, 20000]
+    run(rows, batch_sizes)
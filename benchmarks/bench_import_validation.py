@@ -0,0 +1,62 @@
+"""
+Benchmark: the validation stage of the order import.
+
+Parses the dates of a synthetic Orders.csv export with and without the
+memoized parse_date, then runs dry-run imports (validate, stage and diff,
+nothing written) with one to the given number of worker processes.
+
+Usage:
+    python benchmarks/bench_import_validation.py [rows] [max workers]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from common import setup_database, create_catalog
+from bench_csv_import import write_export, CUSTOMERS
+from models import db
+import importer
+from importer import OrderImporter, read_rows
+
+def uncached_parse_date(value):
+    """parse_date as it was before the memo"""
+    value = value.strip()
+    parsed = datetime.strptime(value, '%d.%m.%Y' if len(value) == 10 else '%d.%m.%y').date()
+    if parsed.year < 2000:
+        parsed = parsed.replace(year=parsed.year + 100)
+    return parsed
+
+def time_dates(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as csvfile:
+        dates = [row[3] for _, row in read_rows(csvfile)]
+    for name, parse in [("strptime", uncached_parse_date), ("memoized", importer.parse_date)]:
+        importer._parse_date.cache_clear()
+        began = time.perf_counter()
+        for value in dates:
+            parse(value)
+        elapsed = time.perf_counter() - began
+        print(f"{name:>9} | {len(dates)} dates | {elapsed:6.2f} s | {len(dates) / elapsed:10.0f} dates/s")
+
+def run(rows, max_workers):
+    directory = tempfile.mkdtemp(prefix='kleinblatt-bench-')
+    path = os.path.join(directory, 'Orders.csv')
+    write_export(path, rows)
+    print(f"{rows} rows, {os.cpu_count()} CPUs")
+    time_dates(path)
+
+    setup_database(os.path.join(directory, 'validate.db'))
+    create_catalog(customer_count=CUSTOMERS)
+    for workers in range(1, max_workers + 1):
+        began = time.perf_counter()
+        stats = OrderImporter(workers=workers).run(path, dry_run=True)
+        elapsed = time.perf_counter() - began
+        print(f"{workers:>2} workers | dry run {elapsed:6.1f} s | {rows / elapsed:9.0f} rows/s | "
+              f"{stats['inserted']} rows to insert")
+    db.close()
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(2, os.cpu_count() or 1)
+    run(rows, max_workers)
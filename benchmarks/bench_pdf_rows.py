@@ -0,0 +1,77 @@
+"""
+Benchmark: rendering the delivery schedule of a week with 200 deliveries.
+
+Compares the row height measurement of SchedulePrinter._add_table with a
+throwaway FPDF per row (the previous implementation, simulated multi_cell)
+against TextLayout (get_string_width on the real document), once with an
+empty memo and once with the memo of an earlier print. Times are per page
+of the resulting PDF.
+
+Usage:
+    python benchmarks/bench_pdf_rows.py [deliveries]
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+from common import setup_database, create_catalog, populate_history, measure
+from fpdf import FPDF
+from models import db
+from database import get_delivery_week
+from print_schedules import SchedulePrinter, TextLayout
+
+class ThrowawayLayout:
+    """The previous measurement: a new FPDF per row to simulate multi_cell"""
+    def line_count(self, pdf, text, width):
+        temp_pdf = FPDF()
+        temp_pdf.add_page()
+        temp_pdf.set_font('Arial', '', 10)
+        start_y = temp_pdf.get_y()
+        temp_pdf.multi_cell(width, 4, text, 0, 'L')
+        return round((temp_pdf.get_y() - start_y) / 4)
+
+def render(printer, schedule_data, monday):
+    pdf = FPDF()
+    pdf.add_page('L')
+    printer._create_header(pdf, "Wöchentlicher Lieferplan", monday)
+    for date_str, deliveries in schedule_data["daily_data"].items():
+        pdf.set_font('Arial', 'B', 12)
+        pdf.cell(0, 10, f'Datum: {date_str}', 0, 1, 'L')
+        printer._add_table(pdf, schedule_data["headers"], deliveries)
+    pdf.output(dest='S')
+    return pdf.page_no()
+
+def run(deliveries):
+    setup_database()
+    # 40 customers with one delivery on 5 days each
+    customers, items = create_catalog(customer_count=deliveries // 5)
+    monday = date(2024, 1, 1)
+    populate_history(customers, items, monday, weeks=1, orders_per_customer_week=5, items_per_order=8)
+    os.chdir(tempfile.mkdtemp(prefix='kleinblatt-bench-'))
+    printer = SchedulePrinter()
+    schedule_data = printer.format_delivery_data(get_delivery_week(monday))
+    rows = sum(len(day) for day in schedule_data["daily_data"].values())
+
+    def throwaway():
+        printer.layout = ThrowawayLayout()
+        return render(printer, schedule_data, monday)
+
+    def measured():
+        printer.layout = TextLayout()
+        return render(printer, schedule_data, monday)
+
+    warm = TextLayout()
+    def memoized():
+        printer.layout = warm
+        return render(printer, schedule_data, monday)
+
+    pages = measured()
+    print(f"{rows} deliveries, {pages} pages")
+    for label, func in [("throwaway FPDF", throwaway), ("TextLayout", measured), ("memoized", memoized)]:
+        best, mean = measure(func, repeat=10)
+        print(f"{label:<15} | best {best / pages:7.2f} ms/page | mean {mean / pages:7.2f} ms/page")
+    db.close()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,64 @@
+"""
+Benchmark: save_order and weekly refresh latency per SQLite pragma profile.
+
+Each profile gets its own database file with the same synthetic history.
+"none" is the old setup without pragmas (rollback journal, 2 MB cache,
+synchronous=FULL). readonly-report is the profile of the db.reporting()
+connections: it can't save orders and only reports the refresh.
+
+Usage:
+    python benchmarks/bench_pragma_profiles.py [weeks of history]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import setup_database, create_catalog, populate_history, measure
+from models import db, PRAGMA_PROFILES, REPORTING_PROFILE, configure_database, describe_database
+from database import SubscriptionWriter, get_delivery_week, get_production_week, get_transfer_schedule
+
+def save_order(customer, items, delivery_date):
+    """Same writes as ProductionApp.save_order for a single order with four items"""
+    writer = SubscriptionWriter()
+    writer.add_order(customer, delivery_date, [(item, 2.0) for item in items[:4]])
+    writer.write()
+
+def refresh_week(monday):
+    """Reads of the three weekly views"""
+    get_delivery_week(monday)
+    get_production_week(monday)
+    get_transfer_schedule(monday, monday + timedelta(days=6))
+
+def run(profile, weeks):
+    if profile == 'none':
+        db.init(db.database, pragmas={})
+    else:
+        # The read-only profile is no main profile, its reports run on db.reporting() below
+        configure_database('fast' if profile == REPORTING_PROFILE else profile)
+    path = setup_database()
+    customers, items = create_catalog()
+    start = date(2024, 1, 1)
+    populate_history(customers, items, start, weeks=weeks)
+    monday = start + timedelta(weeks=weeks // 2)
+
+    mode = describe_database()['journal_mode']
+    if profile == REPORTING_PROFILE:
+        save = None
+
+        def report():
+            with db.reporting():
+                refresh_week(monday)
+        refresh = measure(report)
+        db.close_reporting()
+    else:
+        save = measure(lambda: save_order(customers[0], items, monday + timedelta(days=2)), repeat=50)
+        refresh = measure(lambda: refresh_week(monday))
+
+    save_text = f"best {save[0]:6.2f} ms | mean {save[1]:6.2f} ms" if save else f"{'-':^31}"
+    print(f"{profile:>15} | {mode:>8} | save_order {save_text} | "
+          f"refresh best {refresh[0]:6.2f} ms | mean {refresh[1]:6.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    weeks = int(sys.argv[1]) if len(sys.argv) > 1 else 104
+    for profile in ['none', *PRAGMA_PROFILES]:
+        run(profile, weeks)
@@ -0,0 +1,63 @@
+"""
+Benchmark: creating a year of weekly deliveries with 10 items each.
+
+Compares the old per-row Order.create/OrderItem.create loop with the bulk
+SubscriptionWriter (for materialized series, e.g. imports) and with storing
+the subscription as a single rule.
+
+Usage:
+    python benchmarks/bench_subscription_writer.py [weeks]
+"""
+import sys
+import uuid
+from datetime import date, timedelta
+
+from common import setup_database, create_catalog, measure
+from models import db, Order, OrderItem, Subscription
+from database import SubscriptionWriter, create_subscription, generate_subscription_orders
+
+def base_order(customer, items, weeks):
+    """Unsaved first order of the series, generate_subscription_orders expands it"""
+    start = date(2024, 1, 3)
+    return Order(customer=customer, delivery_date=start, production_date=start - timedelta(days=12),
+                 from_date=start, to_date=start + timedelta(weeks=weeks - 1), subscription_type=1,
+                 halbe_channel=False, order_id=uuid.uuid4())
+
+def per_row(customer, items, weeks):
+    order = base_order(customer, items, weeks)
+    lines = [OrderItem(item=item, amount=1.0) for item in items]
+    with db.atomic():
+        for future in generate_subscription_orders(order, lines):
+            created = Order.create(**future, order_id=uuid.uuid4())
+            for line in lines:
+                OrderItem.create(order=created, item=line.item, amount=line.amount)
+
+def bulk(customer, items, weeks):
+    writer = SubscriptionWriter()
+    writer.add_subscription_orders(base_order(customer, items, weeks), [(item, 1.0) for item in items])
+    writer.write()
+
+def rule(customer, items, weeks):
+    order = base_order(customer, items, weeks)
+    create_subscription(customer, 1, order.delivery_date, order.from_date, order.to_date,
+                        [(item, 1.0) for item in items])
+
+def clear():
+    OrderItem.delete().execute()
+    Order.delete().execute()
+
+def run(weeks):
+    setup_database()
+    customers, items = create_catalog(customer_count=1)
+    customer = customers[0]
+
+    for name, func in [("per row", per_row), ("writer", bulk), ("rule", rule)]:
+        def once():
+            func(customer, items, weeks)
+            clear()
+        best, mean = measure(once, repeat=10)
+        print(f"{name:>8} | {weeks} weeks x {len(items)} items | best {best:8.2f} ms | mean {mean:8.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 52)
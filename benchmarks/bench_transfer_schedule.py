@@ -0,0 +1,38 @@
+"""
+Benchmark: one week of the transfer schedule against growing order histories.
+
+get_transfer_schedule only reads the production_rollup rows whose production
+date can land in the requested week, so the time per week should stay flat
+while the history grows.
+
+Usage:
+    python benchmarks/bench_transfer_schedule.py [years ...]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import setup_database, create_catalog, populate_history, measure
+from models import db, OrderItem
+from database import get_transfer_schedule
+
+def run(years):
+    setup_database()
+    customers, items = create_catalog()
+    start = date(2024, 1, 1)
+    populate_history(customers, items, start, weeks=52 * years)
+
+    # A week in the middle of the history
+    monday = start + timedelta(weeks=26 * years)
+    monday -= timedelta(days=monday.weekday())
+    sunday = monday + timedelta(days=6)
+
+    rows = len(get_transfer_schedule(monday, sunday))
+    best, mean = measure(lambda: get_transfer_schedule(monday, sunday))
+    print(f"{years:>3} years | {OrderItem.select().count():>8} order items | "
+          f"{rows:>4} rows | best {best:7.2f} ms | mean {mean:7.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    history = [int(arg) for arg in sys.argv[1:]] or [1, 4, 16]
+    for years in history:
+        run(years)
@@ -0,0 +1,48 @@
+"""
+Benchmark: paging to a week with and without the WeekCache.
+
+Measures the queries of the three weekly views for one week against the
+cache lookup that replaces them once the week was shown or prefetched (the
+lookup still reads the change journal versions of the week to validate it).
+
+Usage:
+    python benchmarks/bench_week_cache.py [weeks of history]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import setup_database, create_catalog, populate_history, measure
+from models import db
+from database import get_delivery_week
+from weekly_view import WeekCache, WeeklyProductionView, WeeklyTransferView
+
+VIEWS = [('delivery', get_delivery_week),
+         ('production', WeeklyProductionView.fetch_week),
+         ('transfer', WeeklyTransferView.fetch_week)]
+
+def run(weeks):
+    setup_database()
+    customers, items = create_catalog()
+    start = date(2024, 1, 1)
+    populate_history(customers, items, start, weeks=weeks)
+    monday = start + timedelta(weeks=weeks // 2)
+
+    def queries():
+        for kind, fetch in VIEWS:
+            fetch(monday)
+
+    cache = WeekCache()
+    for kind, fetch in VIEWS:
+        cache.load(kind, monday, fetch)
+
+    def lookups():
+        for kind, fetch in VIEWS:
+            assert cache.get(kind, monday) is not None
+
+    for label, func in [("queries", queries), ("cache hit", lookups)]:
+        best, mean = measure(func)
+        print(f"{label:<10} | best {best:7.2f} ms | mean {mean:7.2f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 104)
@@ -0,0 +1,104 @@
+"""
+Benchmark: Tk widgets created and destroyed per delivery view refresh.
+
+Runs WeeklyDeliveryView against counting stand-ins for the tk/ttk widget
+classes, so it needs no display. A busy week is drawn once, then redrawn
+after one order changed, and then after one order was added.
+
+Usage:
+    python benchmarks/bench_widget_pool.py [orders per day]
+"""
+import sys
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from common import create_catalog
+from models import db, Customer, Item, Order, OrderItem
+from migrations import migrate
+import weekly_view
+
+class Counter:
+    created = 0
+    destroyed = 0
+
+class FakeWidget:
+    """Accepts every Tk call, keeps the widget tree and counts creation/destruction"""
+    def __init__(self, master=None, *args, **kwargs):
+        Counter.created += 1
+        self.master = master
+        self.children = []
+        self.options = dict(kwargs)
+        if isinstance(master, FakeWidget):
+            master.children.append(self)
+
+    def winfo_children(self):
+        return list(self.children)
+
+    def destroy(self):
+        for child in list(self.children):
+            child.destroy()
+        if isinstance(self.master, FakeWidget) and self in self.master.children:
+            self.master.children.remove(self)
+        Counter.destroyed += 1
+
+    def configure(self, *args, **kwargs):
+        self.options.update(kwargs)
+
+    config = configure
+
+    def cget(self, name):
+        return self.options.get(name)
+
+    def bbox(self, *args):
+        return (0, 0, 0, 0)
+
+    def after(self, ms, callback, *args):
+        callback(*args)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+fake_tk = SimpleNamespace(Canvas=FakeWidget, Frame=FakeWidget, Label=FakeWidget,
+                          BooleanVar=FakeWidget, StringVar=FakeWidget, IntVar=FakeWidget, END='end')
+fake_ttk = SimpleNamespace(**{name: FakeWidget for name in
+                              ['Frame', 'LabelFrame', 'Label', 'Button', 'Scrollbar', 'Separator', 'Entry']})
+
+def measure(view, monday, label):
+    Counter.created = Counter.destroyed = 0
+    view.refresh()
+    print(f"{label:<28} | created {Counter.created:>5} | destroyed {Counter.destroyed:>5}")
+
+def run(orders_per_day):
+    # In memory, so the view loads the week inline instead of on the loader thread
+    db.init(':memory:')
+    db.connect()
+    db.create_tables([Customer, Item, Order, OrderItem])
+    migrate(db)
+    customers, items = create_catalog(customer_count=orders_per_day)
+    monday = date(2024, 3, 4)
+    orders = []
+    for day in range(6):
+        for customer in customers:
+            order = Order.create(customer=customer, delivery_date=monday + timedelta(days=day),
+                                 production_date=monday - timedelta(days=12), order_id=uuid.uuid4())
+            OrderItem.insert_many([{'order': order, 'item': item, 'amount': 1.0} for item in items[:4]]).execute()
+            orders.append(order)
+
+    weekly_view.tk, weekly_view.ttk, weekly_view.ttkb = fake_tk, fake_ttk, SimpleNamespace(Style=FakeWidget)
+    app = SimpleNamespace(after=lambda *args: None)
+    view = weekly_view.WeeklyDeliveryView(FakeWidget(), app, db)
+    view.current_week = monday
+
+    measure(view, monday, "first draw")
+    measure(view, monday, "unchanged week")
+    OrderItem.update(amount=3.0).where(OrderItem.order == orders[0]).execute()
+    measure(view, monday, "one order changed")
+    order = Order.create(customer=customers[0], delivery_date=monday, production_date=monday - timedelta(days=12),
+                         order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=items[0], amount=1.0)
+    measure(view, monday, "one order added")
+    print(f"{len(orders) + 1} orders in the week")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
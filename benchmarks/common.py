@@ -0,0 +1,100 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The benchmarks never touch production.db: each run builds a synthetic database
+in a temporary directory. Run them from the project root, e.g.:
+    python benchmarks/bench_transfer_schedule.py
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Customer, Item, Order, OrderItem
+from migrations import migrate
+from importer import bulk_load
+
+ITEM_SPECS = [
+    # name, soaking, germination, growth
+    ("Erbse", 1, 2, 7),
+    ("Sonnenblume", 1, 3, 6),
+    ("Rettich", 0, 3, 5),
+    ("Koriander", 1, 5, 10),
+    ("Mais", 1, 3, 4),
+    ("Brokkoli", 0, 3, 6),
+    ("Senf", 0, 2, 5),
+    ("Kresse", 0, 2, 4),
+    ("Rotkohl", 0, 3, 6),
+    ("Amaranth", 0, 4, 8),
+]
+
+def setup_database(path=None):
+    """Initialise db on a fresh file (in a temp dir by default) with the current schema"""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='kleinblatt-bench-'), 'bench.db')
+    if not db.is_closed():
+        db.close()
+    db.init(path)
+    db.connect()
+    db.create_tables([Customer, Item, Order, OrderItem])
+    migrate(db)
+    return path
+
+def create_catalog(customer_count=20):
+    """Create the benchmark items and customers"""
+    items = [
+        Item.create(name=name, seed_quantity=20.0, soaking_days=soaking,
+                    germination_days=germination, growth_days=growth,
+                    price=4.5, substrate="Hanf")
+        for name, soaking, germination, growth in ITEM_SPECS
+    ]
+    customers = [Customer.create(name=f"Kunde {i:03d}") for i in range(customer_count)]
+    return customers, items
+
+def populate_history(customers, items, start, weeks, orders_per_customer_week=1, items_per_order=4):
+    """
+    Bulk-insert single orders spread over the given number of weeks.
+
+    The rollup, change journal and customer statistics triggers are dropped
+    during the load and the tables are rebuilt once afterwards, which keeps
+    setting up years of history fast.
+    """
+    with db.atomic(), bulk_load(db):
+        for week in range(weeks):
+            orders = []
+            for c_index, customer in enumerate(customers):
+                for n in range(orders_per_customer_week):
+                    delivery_date = start + timedelta(days=7 * week + (c_index + n) % 6)
+                    orders.append({
+                        'customer': customer,
+                        'delivery_date': delivery_date,
+                        'production_date': delivery_date - timedelta(days=10),
+                        'order_id': uuid.uuid4(),
+                    })
+            Order.insert_many(orders).execute()
+            created = (Order.select(Order.id)
+                       .where((Order.delivery_date >= start + timedelta(days=7 * week)) &
+                              (Order.delivery_date < start + timedelta(days=7 * week + 7)))
+                       .tuples())
+            rows = []
+            for (order_id,) in created:
+                for i in range(items_per_order):
+                    rows.append({'order': order_id,
+                                 'item': items[(order_id + i) % len(items)],
+                                 'amount': 1.0 + i * 0.5})
+            for i in range(0, len(rows), 500):
+                OrderItem.insert_many(rows[i:i + 500]).execute()
+
+def measure(func, repeat=20):
+    """Return (best, mean) wall time of func() in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), sum(timings) / len(timings)
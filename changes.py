@@ -0,0 +1,130 @@
+"""
+Per-date change journal for the weekly views.
+
+change_journal holds a version per (kind, day) for the delivery, production
+and transfer dates. SQLite triggers on the order, orderitem, subscription,
+item and customer tables bump the versions of the dates a write touches, inside
+the same transaction, so writes made outside the views (the order dialogs,
+undo, the CSV import) are noticed as well as their own.
+
+A weekly view remembers the versions of the days it drew and redraws only the
+days whose version moved. Changes that can affect any date (subscription rules
+and their overrides, item or customer edits) bump the ALL_DAYS row instead.
+"""
+from datetime import date
+from models import db, ChangeJournal, create_triggers
+
+KINDS = ('delivery', 'production', 'transfer')
+
+# Day of the journal row whose version covers every day
+ALL_DAYS = date(1, 1, 1)
+_ALL_DAYS = f"'{ALL_DAYS.isoformat()}'"
+
+def _bump(kind, day_expr):
+    return f'''
+        INSERT INTO change_journal (kind, day, version) VALUES ('{kind}', {day_expr}, 1)
+        ON CONFLICT (kind, day) DO UPDATE SET version = version + 1;'''
+
+def _bump_transfers(production_expr, where):
+    """Transfer dates (production date + soaking + germination) of the matching order items"""
+    return f'''
+        INSERT INTO change_journal (kind, day, version)
+        SELECT 'transfer', date({production_expr}, '+' || (i.soaking_days + i.germination_days) || ' days'), 1
+        FROM orderitem AS oi JOIN item AS i ON i.id = oi.item_id
+        WHERE {where}
+        ON CONFLICT (kind, day) DO UPDATE SET version = version + 1;'''
+
+def _bump_all():
+    return _bump('all', _ALL_DAYS)
+
+def _order_item(row):
+    """Bumps for one order item row (NEW or OLD) of an order"""
+    order = f'(SELECT {{}} FROM "order" WHERE id = {row}.order_id)'
+    return (
+        _bump('delivery', order.format('delivery_date')) +
+        _bump('production', order.format('production_date')) +
+        _bump_transfers(order.format('production_date'), f'oi.id = {row}.id')
+    )
+
+def _order(row):
+    """Bumps for one order row (NEW or OLD) including the transfers of its items"""
+    return (
+        _bump('delivery', f'{row}.delivery_date') +
+        _bump('production', f'{row}.production_date') +
+        _bump_transfers(f'{row}.production_date', f'oi.order_id = {row}.id')
+    )
+
+# An override replaces a computed occurrence whose dates the triggers don't know
+_OVERRIDE = 'WHEN {}.subscription_id IS NOT NULL'
+_PLAIN = 'WHEN {}.subscription_id IS NULL'
+
+TRIGGERS = {
+    'change_journal_orderitem_insert': ('AFTER INSERT ON orderitem', _order_item('NEW')),
+    # Deleting the items of an order first, as all delete paths do, keeps the dates known
+    'change_journal_orderitem_delete': ('AFTER DELETE ON orderitem', _order_item('OLD')),
+    'change_journal_orderitem_update': ('AFTER UPDATE ON orderitem', _order_item('OLD') + _order_item('NEW')),
+    'change_journal_order_insert': ('AFTER INSERT ON "order" ' + _PLAIN.format('NEW'), _order('NEW')),
+    'change_journal_order_delete': ('AFTER DELETE ON "order" ' + _PLAIN.format('OLD'), _order('OLD')),
+    'change_journal_order_update': (
+        'AFTER UPDATE ON "order" WHEN OLD.subscription_id IS NULL AND NEW.subscription_id IS NULL',
+        _order('OLD') + _order('NEW')
+    ),
+    'change_journal_override_insert': ('AFTER INSERT ON "order" ' + _OVERRIDE.format('NEW'), _bump_all()),
+    'change_journal_override_delete': ('AFTER DELETE ON "order" ' + _OVERRIDE.format('OLD'), _bump_all()),
+    'change_journal_override_update': (
+        'AFTER UPDATE ON "order" WHEN OLD.subscription_id IS NOT NULL OR NEW.subscription_id IS NOT NULL',
+        _bump_all()
+    ),
+    'change_journal_subscription_insert': ('AFTER INSERT ON subscription', _bump_all()),
+    'change_journal_subscription_delete': ('AFTER DELETE ON subscription', _bump_all()),
+    'change_journal_subscription_update': ('AFTER UPDATE ON subscription', _bump_all()),
+    'change_journal_subscriptionitem_insert': ('AFTER INSERT ON subscriptionitem', _bump_all()),
+    'change_journal_subscriptionitem_delete': ('AFTER DELETE ON subscriptionitem', _bump_all()),
+    'change_journal_subscriptionitem_update': ('AFTER UPDATE ON subscriptionitem', _bump_all()),
+    # Names and growth periods show up on every day
+    'change_journal_item_update': ('AFTER UPDATE ON item', _bump_all()),
+    'change_journal_customer_update': ('AFTER UPDATE ON customer', _bump_all()),
+}
+
+def install_triggers(database=db):
+    """(Re)create the triggers that maintain change_journal"""
+    create_triggers(TRIGGERS, database)
+
+def bump_all(database=db):
+    """Mark every day as changed, after writes made without the triggers"""
+    database.execute_sql(_bump_all())
+
+def day_versions(kind, start_date, end_date):
+    """
+    Journal versions of the days of one kind between start_date and end_date.
+
+    Returns:
+    - Dict of date -> version, with the version of every day under ALL_DAYS.
+      Days that were never changed are missing.
+    """
+    query = (ChangeJournal
+             .select(ChangeJournal.day, ChangeJournal.version)
+             .where(((ChangeJournal.kind == kind) &
+                     (ChangeJournal.day >= start_date) &
+                     (ChangeJournal.day <= end_date)) |
+                    (ChangeJournal.kind == 'all')))
+    return dict(query.tuples())
+
+def dirty_days(drawn, versions, days):
+    """
+    The days that must be redrawn.
+
+    Parameters:
+    - drawn: Versions the view last drew, as stamped by stamp_days
+    - versions: Current versions from day_versions
+    - days: Dates shown by the view
+    """
+    if drawn.get(ALL_DAYS) != versions.get(ALL_DAYS, 0):
+        return list(days)
+    return [day for day in days if drawn.get(day) != versions.get(day, 0)]
+
+def stamp_days(versions, days):
+    """Versions to remember after drawing the given days"""
+    drawn = {day: versions.get(day, 0) for day in days}
+    drawn[ALL_DAYS] = versions.get(ALL_DAYS, 0)
+    return drawn
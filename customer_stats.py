@@ -0,0 +1,215 @@
+"""
+Customer statistics of the Bestellungen tab: number of past deliveries,
+their revenue (amount * item price) and the last delivery date per customer.
+
+They come from two sources, combined by customer_overview:
+- Plain orders (no subscription rule) that are not marked is_future are
+  summed up in the customer_stats table. SQLite triggers on the customer,
+  order, orderitem and item tables recompute the row of every customer a
+  write touches, in the same transaction, so the list is read with one
+  index scan instead of aggregating the whole order history on every save.
+- Subscription deliveries up to today are counted when the list is read
+  (subscription_stats): the occurrences of the rules from
+  expand_subscriptions and the override orders that still have items. Which
+  of them lie in the past changes every day without any write, so they
+  can't be kept in the table.
+
+Run `python customer_stats.py --check` to compare the table against the
+order data and `python customer_stats.py --rebuild` to recompute it from scratch.
+"""
+import sys
+from datetime import date
+from peewee import fn, JOIN
+from models import db, Customer, Item, Order, OrderItem, Subscription, CustomerStats, create_triggers
+from database import expand_subscriptions
+
+# Past plain orders; overrides of subscription occurrences are counted by subscription_stats
+_COUNTED = 'o.customer_id = c.id AND o.is_future = 0 AND o.subscription_id IS NULL'
+
+def _recompute(customers_expr):
+    """SQL recomputing the rows of the given customer ids"""
+    return f'''
+        INSERT OR REPLACE INTO customer_stats (customer_id, order_count, revenue, last_delivery)
+        SELECT c.id,
+               (SELECT COUNT(*) FROM "order" AS o WHERE {_COUNTED}),
+               (SELECT COALESCE(SUM(oi.amount * i.price), 0)
+                FROM "order" AS o
+                JOIN orderitem AS oi ON oi.order_id = o.id
+                JOIN item AS i ON i.id = oi.item_id
+                WHERE {_COUNTED}),
+               (SELECT MAX(o.delivery_date) FROM "order" AS o WHERE {_COUNTED})
+        FROM customer AS c
+        WHERE c.id IN ({customers_expr});'''
+
+_ORDER_CUSTOMER = 'SELECT customer_id FROM "order" WHERE id = {}.order_id'
+
+TRIGGERS = {
+    # Every customer has a row, also before the first order
+    'customer_stats_customer_insert': ('AFTER INSERT ON customer', _recompute('NEW.id')),
+    'customer_stats_order_insert': ('AFTER INSERT ON "order"', _recompute('NEW.customer_id')),
+    'customer_stats_order_delete': ('AFTER DELETE ON "order"', _recompute('OLD.customer_id')),
+    'customer_stats_order_update': (
+        'AFTER UPDATE OF customer_id, is_future, delivery_date, subscription_id ON "order"',
+        _recompute('OLD.customer_id, NEW.customer_id')
+    ),
+    'customer_stats_orderitem_insert': ('AFTER INSERT ON orderitem', _recompute(_ORDER_CUSTOMER.format('NEW'))),
+    'customer_stats_orderitem_delete': ('AFTER DELETE ON orderitem', _recompute(_ORDER_CUSTOMER.format('OLD'))),
+    'customer_stats_orderitem_update': (
+        'AFTER UPDATE OF order_id, item_id, amount ON orderitem',
+        _recompute(f"{_ORDER_CUSTOMER.format('OLD')} UNION {_ORDER_CUSTOMER.format('NEW')}")
+    ),
+    'customer_stats_item_price': (
+        'AFTER UPDATE OF price ON item WHEN OLD.price IS NOT NEW.price',
+        _recompute('SELECT o.customer_id FROM orderitem AS oi JOIN "order" AS o ON o.id = oi.order_id '
+                   'WHERE oi.item_id = NEW.id')
+    ),
+}
+
+def install_triggers(database=db):
+    """(Re)create the triggers that keep customer_stats current"""
+    create_triggers(TRIGGERS, database)
+
+def _source_query():
+    """(customer_id, order_count, revenue, last_delivery) of every customer from the order data"""
+    past = (Order.is_future == False) & Order.subscription.is_null()
+    orders = (Order
+              .select(Order.customer, fn.COUNT(Order.id).alias('order_count'),
+                      fn.MAX(Order.delivery_date).alias('last_delivery'))
+              .where(past)
+              .group_by(Order.customer)
+              .alias('orders'))
+    revenue = (OrderItem
+               .select(Order.customer, fn.SUM(OrderItem.amount * Item.price).alias('revenue'))
+               .join(Order)
+               .switch(OrderItem)
+               .join(Item)
+               .where(past)
+               .group_by(Order.customer)
+               .alias('revenue'))
+    # Aggregated separately: joining the items first would count orders once per item
+    return (Customer
+            .select(Customer.id,
+                    fn.COALESCE(orders.c.order_count, 0),
+                    fn.COALESCE(revenue.c.revenue, 0),
+                    orders.c.last_delivery)
+            .join(orders, JOIN.LEFT_OUTER, on=(orders.c.customer_id == Customer.id))
+            .switch(Customer)
+            .join(revenue, JOIN.LEFT_OUTER, on=(revenue.c.customer_id == Customer.id)))
+
+def subscription_stats(until=None):
+    """
+    Deliveries of subscriptions up to until (default today) per customer.
+
+    Counts the occurrences of the rules and the override orders with items
+    (an override without items cancels its occurrence).
+
+    Returns:
+    - Dict of customer id -> [delivery count, revenue, last delivery date]
+    """
+    until = until or date.today()
+    stats = {}
+
+    def add(customer_id, delivery_date, revenue):
+        entry = stats.setdefault(customer_id, [0, 0.0, None])
+        entry[0] += 1
+        entry[1] += revenue
+        if entry[2] is None or delivery_date > entry[2]:
+            entry[2] = delivery_date
+
+    first = Subscription.select(fn.MIN(Subscription.from_date)).scalar()
+    if first is not None and first <= until:
+        for occurrence in expand_subscriptions(first, until):
+            add(occurrence['subscription'].customer_id, occurrence['delivery_date'],
+                sum(line.amount * line.item.price for line in occurrence['items']))
+
+    overrides = (OrderItem
+                 .select(Order.customer, Order.delivery_date, fn.SUM(OrderItem.amount * Item.price))
+                 .join(Order)
+                 .switch(OrderItem)
+                 .join(Item)
+                 .where(Order.subscription.is_null(False) & (Order.delivery_date <= until))
+                 .group_by(Order.id)
+                 .tuples())
+    for customer_id, delivery_date, revenue in overrides:
+        add(customer_id, delivery_date, revenue or 0.0)
+    return stats
+
+def customer_overview(until=None):
+    """
+    (name, delivery count, revenue, last delivery) of every customer: the
+    customer_stats row plus the subscription deliveries up to until (default
+    today), most deliveries first.
+    """
+    rows = (CustomerStats
+            .select(Customer.id, Customer.name, CustomerStats.order_count, CustomerStats.revenue,
+                    CustomerStats.last_delivery)
+            .join(Customer)
+            .tuples())
+    subscriptions = subscription_stats(until)
+    overview = []
+    for customer_id, name, order_count, revenue, last_delivery in rows:
+        count, subscription_revenue, last_subscription = subscriptions.get(customer_id, (0, 0.0, None))
+        if last_subscription is not None and (last_delivery is None or last_subscription > last_delivery):
+            last_delivery = last_subscription
+        overview.append((name, order_count + count, revenue + subscription_revenue, last_delivery))
+    return sorted(overview, key=lambda row: -row[1])
+
+def rebuild_customer_stats(database=db):
+    """
+    Recompute customer_stats from the order data.
+
+    Returns:
+    - Number of rows written
+    """
+    with database.bind_ctx([Customer, Item, Order, OrderItem, CustomerStats]):
+        with database.atomic():
+            CustomerStats.delete().execute()
+            CustomerStats.insert_from(
+                _source_query(),
+                [CustomerStats.customer, CustomerStats.order_count, CustomerStats.revenue,
+                 CustomerStats.last_delivery]
+            ).execute()
+            return CustomerStats.select().count()
+
+def check_customer_stats(database=db, tolerance=1e-6):
+    """
+    Compare customer_stats with the order data.
+
+    Returns:
+    - List of (customer_id, expected, actual) for every mismatching customer,
+      with (order_count, revenue, last_delivery) tuples; a missing row is
+      reported with None. Empty when consistent.
+    """
+    with database.bind_ctx([Customer, Item, Order, OrderItem, CustomerStats]):
+        expected = {row[0]: row[1:] for row in _source_query().tuples()}
+        actual = {
+            row[0]: row[1:]
+            for row in CustomerStats
+                .select(CustomerStats.customer, CustomerStats.order_count, CustomerStats.revenue,
+                        CustomerStats.last_delivery)
+                .tuples()
+        }
+
+    def same(want, have):
+        return (want[0] == have[0] and abs(want[1] - have[1]) <= tolerance
+                and str(want[2] or '') == str(have[2] or ''))
+
+    mismatches = []
+    for customer_id in sorted(set(expected) | set(actual)):
+        want = expected.get(customer_id)
+        have = actual.get(customer_id)
+        if want is None or have is None or not same(want, have):
+            mismatches.append((customer_id, want, have))
+    return mismatches
+
+if __name__ == "__main__":
+    if '--rebuild' in sys.argv:
+        print(f"Rebuilt customer statistics: {rebuild_customer_stats()} rows")
+    else:
+        mismatches = check_customer_stats()
+        for customer_id, want, have in mismatches:
+            print(f"  customer {customer_id}: expected {want}, found {have}")
+        if mismatches:
+            print(f"❌ {len(mismatches)} inconsistent customer rows. Run with --rebuild to repair.")
+            sys.exit(1)
+        print("✅ Customer statistics are consistent")
@@ -3,18 +3,25 @@ from tkinter import messagebox, ttk
 import tkinter as tk
 from widgets import AutocompleteCombobox
 from database import Customer
-from models import Order, OrderItem, Item, db
+from models import Order, OrderItem, Item, Subscription, db
 from peewee import fn, JOIN
 from datetime import datetime
+from events import bus, CustomerChanged
+from undo import undo_log
 
 class CustomerView:
     def __init__(self, parent, app=None):
         self.parent = parent
-        self.app = app  # Store reference to main app for undo system
+        self.app = app  # Store reference to main app
         self.edit_mode = False
         self.current_customer = None
         self.create_widgets()
         self.refresh_customer_list()
+        bus.subscribe(self.on_change, CustomerChanged)
+
+    def on_change(self, events):
+        """Bus handler for customer writes, including undo and the other tabs"""
+        self.refresh_customer_list()
 
     def create_widgets(self):
         # Input frame
@@ -78,44 +85,23 @@ class CustomerView:
 
         try:
             if self.edit_mode and self.current_customer:
-                # Store original data for undo
-                original_data = {
-                    'customer_id': self.current_customer.id,
-                    'name': self.current_customer.name,
-                    'created_at': self.current_customer.created_at
-                }
-                
                 # Update existing customer
-                self.current_customer.name = name
-                self.current_customer.save()
-                
-                # Record action for undo if app reference exists
-                if self.app:
-                    self.app.record_action(
-                        "edit_customer",
-                        original_data,
-                        {'customer_id': self.current_customer.id},
-                        f"Änderung von Kunde: {name}"
-                    )
+                with undo_log.step(f"Änderung von Kunde: {name}"):
+                    self.current_customer.name = name
+                    self.current_customer.save()
                 
+                changed = CustomerChanged(frozenset({self.current_customer.id}))
                 messagebox.showinfo("Success", "Customer updated successfully")
             else:
                 # Create new customer
-                customer = Customer.create(name=name)
-                
-                # Record action for undo if app reference exists
-                if self.app:
-                    self.app.record_action(
-                        "create_customer",
-                        None,  # No old data for creation
-                        {'customer_id': customer.id},
-                        f"Erstellung von Kunde: {name}"
-                    )
+                with undo_log.step(f"Erstellung von Kunde: {name}"):
+                    customer = Customer.create(name=name)
                 
+                changed = CustomerChanged(frozenset({customer.id}))
                 messagebox.showinfo("Success", "Customer added successfully")
 
             self.cancel_edit()
-            self.refresh_customer_list()
+            bus.publish(changed)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -166,20 +152,12 @@ class CustomerView:
                 return
             
             try:
-                customer = Customer.create(name=name)
-                
-                # Record action for undo if app reference exists
-                if self.app:
-                    self.app.record_action(
-                        "create_customer",
-                        None,  # No old data for creation
-                        {'customer_id': customer.id},
-                        f"Erstellung von Kunde: {name}"
-                    )
+                with undo_log.step(f"Erstellung von Kunde: {name}"):
+                    customer = Customer.create(name=name)
                 
                 messagebox.showinfo("Success", "Customer added successfully", parent=popup)
                 popup.destroy()
-                self.refresh_customer_list()
+                bus.publish(CustomerChanged(frozenset({customer.id})))
             except Exception as e:
                 messagebox.showerror("Error", str(e), parent=popup)
 
@@ -216,23 +194,12 @@ class CustomerView:
             if order_count > 0:
                 messagebox.showerror("Error", f"Cannot delete customer with {order_count} orders")
                 return
+            subscription_count = Subscription.select().where(Subscription.customer == customer).count()
+            if subscription_count > 0:
+                messagebox.showerror("Error", f"Cannot delete customer with {subscription_count} subscriptions")
+                return
             
-            # Store original data for undo
-            original_data = {
-                'customer_id': customer.id,
-                'name': customer.name,
-                'created_at': customer.created_at
-            }
-            
-            customer.delete_instance()
-            
-            # Record action for undo if app reference exists
-            if self.app:
-                self.app.record_action(
-                    "delete_customer",
-                    original_data,
-                    None,
-                    f"Löschung von Kunde: {customer.name}"
-                )
+            with undo_log.step(f"Löschung von Kunde: {customer.name}"):
+                customer.delete_instance()
             
-            self.refresh_customer_list()
\ No newline at end of file
+            bus.publish(CustomerChanged(frozenset({customer_id})))
\ No newline at end of file
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from models import *
-from peewee import fn
+from peewee import fn, JOIN, chunked
+import uuid
 
 def calculate_production_date(delivery_date, items, allow_sunday=True):
     """
@@ -24,12 +25,24 @@ def calculate_production_date(delivery_date, items, allow_sunday=True):
         
     return production_date
 
-def generate_subscription_orders(order):
+# Days between two deliveries per subscription_type
+SUBSCRIPTION_INTERVALS = {1: 7, 2: 14, 3: 21, 4: 28}
+
+def generate_subscription_orders(order, items=None):
+    """
+    Build the future orders of a materialized subscription order.
+    
+    New subscriptions are stored as Subscription rules (see create_subscription);
+    this is kept for subscriptions created before the rules existed.
+    items are the order's OrderItems (or anything with .item), read once from
+    the database when omitted.
+    """
     if order.subscription_type == 0 or not order.from_date or not order.to_date:
         return []
     
-    frequencies = {1: 7, 2: 14, 3: 21, 4: 28}
-    delta = timedelta(days=frequencies[order.subscription_type])
+    lead_items = list(order.items) if items is None else items
+    
+    delta = timedelta(days=SUBSCRIPTION_INTERVALS[order.subscription_type])
     
     # Use delivery_date as the starting point, not from_date
     current_date = order.delivery_date + delta
@@ -43,7 +56,7 @@ def generate_subscription_orders(order):
         new_order = {
             'customer': order.customer,
             'delivery_date': current_date,
-            'production_date': calculate_production_date(current_date, order.items, allow_sunday),
+            'production_date': calculate_production_date(current_date, lead_items, allow_sunday),
             'halbe_channel': order.halbe_channel,
             'is_future': True,
             'subscription_type': order.subscription_type,
@@ -55,6 +68,433 @@ def generate_subscription_orders(order):
     
     return orders
 
+def subscription_dates(subscription, start_date, end_date):
+    """
+    Delivery dates of a subscription rule between start_date and end_date (inclusive).
+    
+    Occurrences fall on anchor_date plus a multiple of the interval and must lie
+    within the rule's from_date/to_date range.
+    """
+    step = SUBSCRIPTION_INTERVALS[subscription.subscription_type]
+    first = max(start_date, subscription.from_date, subscription.anchor_date)
+    last = min(end_date, subscription.to_date)
+    
+    # Round up to the next date in the rhythm of the anchor date
+    periods = -(-(first - subscription.anchor_date).days // step)
+    current = subscription.anchor_date + timedelta(days=periods * step)
+    
+    dates = []
+    while current <= last:
+        dates.append(current)
+        current += timedelta(days=step)
+    return dates
+
+def max_lead_days():
+    """Longest soaking + germination + growth period in the item catalog"""
+    return Item.select(fn.MAX(Item.soaking_days + Item.germination_days + Item.growth_days)).scalar() or 0
+
+def expand_subscriptions(start_date, end_date, by_production_date=False):
+    """
+    Expand the subscription rules into their occurrences within a date range.
+    
+    The range applies to the delivery date, or to the production date when
+    by_production_date is set. Occurrences that have an override order are
+    skipped, the override is a regular order. Rules, their items and the
+    overrides are read with two queries regardless of the range length.
+    
+    Returns a list of dicts with 'subscription', 'delivery_date',
+    'production_date' and 'items' (SubscriptionItem instances with their item loaded).
+    """
+    # Delivery dates that can produce a match, production may start up to max_lead_days earlier
+    delivery_start = start_date
+    delivery_end = end_date + timedelta(days=max_lead_days()) if by_production_date else end_date
+    
+    rows = (SubscriptionItem
+            .select(SubscriptionItem, Subscription, Customer, Item)
+            .join(Subscription)
+            .join(Customer)
+            .switch(SubscriptionItem)
+            .join(Item)
+            .where((Subscription.from_date <= delivery_end) &
+                   (Subscription.to_date >= delivery_start)))
+    
+    rules = {}
+    for line in rows:
+        subscription, lines = rules.setdefault(line.subscription.id, (line.subscription, []))
+        lines.append(line)
+    if not rules:
+        return []
+    
+    overridden = set(
+        Order
+        .select(Order.subscription, Order.occurrence_date)
+        .where(Order.subscription.in_(list(rules)) &
+               (Order.occurrence_date >= delivery_start) &
+               (Order.occurrence_date <= delivery_end))
+        .tuples()
+    )
+    
+    occurrences = []
+    for subscription, lines in rules.values():
+        for delivery_date in subscription_dates(subscription, delivery_start, delivery_end):
+            if (subscription.id, delivery_date) in overridden:
+                continue
+            production_date = calculate_production_date(delivery_date, lines)
+            day = production_date if by_production_date else delivery_date
+            if start_date <= day <= end_date:
+                occurrences.append({
+                    'subscription': subscription,
+                    'delivery_date': delivery_date,
+                    'production_date': production_date,
+                    'items': lines
+                })
+    return occurrences
+
+class SubscriptionWriter:
+    """
+    Bulk writer shared by all order and subscription creation paths.
+    
+    Orders, order items and subscription rules are collected in memory and
+    written by write() with chunked insert_many calls inside one transaction,
+    instead of one INSERT round trip per row.
+    
+    Items are always given as (Item, amount) tuples.
+    """
+    # SQLite's default limit of bound parameters per statement (before 3.32)
+    MAX_VARIABLES = 999
+    
+    def __init__(self, database=db):
+        self.database = database
+        self.orders = []         # (order row, items)
+        self.items = []          # order item rows of existing orders
+        self.subscriptions = []  # (subscription row, items)
+        self.subscription_items = []  # subscription item rows of existing subscriptions
+    
+    def add_order(self, customer, delivery_date, items, production_date=None, **fields):
+        """
+        Queue a new order.
+        
+        production_date defaults to calculate_production_date; further Order
+        fields (from_date, to_date, subscription_type, halbe_channel, is_future,
+        order_id, ...) can be passed as keyword arguments.
+        """
+        if production_date is None:
+            production_date = calculate_production_date(
+                delivery_date, [OrderItem(item=item, amount=amount) for item, amount in items])
+        row = {
+            'customer': customer,
+            'delivery_date': delivery_date,
+            'production_date': production_date,
+            'from_date': None,
+            'to_date': None,
+            'subscription_type': 0,
+            'halbe_channel': False,
+            'is_future': False,
+            'subscription': None,
+            'occurrence_date': None,
+        }
+        row.update(fields)
+        # write() maps the new ids back through order_id, so keep it a UUID
+        order_uuid = row.get('order_id') or uuid.uuid4()
+        row['order_id'] = order_uuid if isinstance(order_uuid, uuid.UUID) else uuid.UUID(str(order_uuid))
+        self.orders.append((row, list(items)))
+    
+    def add_subscription_orders(self, order, items, skip_dates=()):
+        """
+        Queue the future orders of a materialized subscription order, copying
+        items to each. Delivery dates in skip_dates are left out.
+        """
+        lead_items = [OrderItem(item=item, amount=amount) for item, amount in items]
+        for future in generate_subscription_orders(order, lead_items):
+            if future['delivery_date'] not in skip_dates:
+                self.add_order(items=items, **future)
+    
+    def add_items(self, order, items):
+        """Queue items for an already saved order"""
+        self.items.extend({'order': order, 'item': item, 'amount': amount} for item, amount in items)
+    
+    def add_subscription(self, customer, subscription_type, delivery_date, from_date, to_date, items,
+                         halbe_channel=False):
+        """Queue a subscription rule anchored on its first delivery_date"""
+        row = {
+            'customer': customer,
+            'subscription_type': subscription_type,
+            'anchor_date': delivery_date,
+            'from_date': from_date,
+            'to_date': to_date,
+            'halbe_channel': halbe_channel,
+        }
+        self.subscriptions.append((row, list(items)))
+    
+    def add_subscription_items(self, subscription, items):
+        """Queue items for an already saved subscription rule"""
+        self.subscription_items.extend(
+            {'subscription': subscription, 'item': item, 'amount': amount} for item, amount in items)
+    
+    def _insert(self, model, rows):
+        if not rows:
+            return
+        batch_size = max(1, self.MAX_VARIABLES // len(rows[0]))
+        for batch in chunked(rows, batch_size):
+            model.insert_many(batch).execute()
+    
+    def write(self):
+        """
+        Write everything queued in one transaction and clear the queues.
+        
+        Returns:
+        - Dict with the created 'orders' and 'subscriptions' ids, in the order they were added
+        """
+        order_ids = []
+        subscription_ids = []
+        
+        with self.database.atomic():
+            subscription_lines = list(self.subscription_items)
+            for row, items in self.subscriptions:
+                subscription_id = Subscription.insert(row).execute()
+                subscription_ids.append(subscription_id)
+                subscription_lines.extend(
+                    {'subscription': subscription_id, 'item': item, 'amount': amount} for item, amount in items)
+            self._insert(SubscriptionItem, subscription_lines)
+            
+            self._insert(Order, [row for row, _ in self.orders])
+            
+            # Look the new primary keys up through the unique order_id
+            uuids = [row['order_id'] for row, _ in self.orders]
+            id_by_uuid = {}
+            for batch in chunked(uuids, self.MAX_VARIABLES):
+                id_by_uuid.update(
+                    (order_uuid, order_id) for order_id, order_uuid in
+                    Order.select(Order.id, Order.order_id).where(Order.order_id.in_(batch)).tuples())
+            
+            order_items = list(self.items)
+            for row, items in self.orders:
+                order_id = id_by_uuid[row['order_id']]
+                order_ids.append(order_id)
+                order_items.extend({'order': order_id, 'item': item, 'amount': amount} for item, amount in items)
+            self._insert(OrderItem, order_items)
+        
+        self.orders, self.items, self.subscriptions, self.subscription_items = [], [], [], []
+        return {'orders': order_ids, 'subscriptions': subscription_ids}
+
+def create_subscription(customer, subscription_type, delivery_date, from_date, to_date, items, halbe_channel=False):
+    """
+    Store a subscription as a single rule instead of one order per delivery.
+    
+    Parameters:
+    - delivery_date: First delivery, the rhythm of all occurrences is anchored on it
+    - items: List of (Item, amount) tuples
+    
+    Returns:
+    - The created Subscription
+    """
+    writer = SubscriptionWriter()
+    writer.add_subscription(customer, subscription_type, delivery_date, from_date, to_date, items, halbe_channel)
+    return Subscription.get_by_id(writer.write()['subscriptions'][0])
+
+def _replace_subscription_items(subscription, items):
+    SubscriptionItem.delete().where(SubscriptionItem.subscription == subscription).execute()
+    SubscriptionItem.insert_many([
+        {'subscription': subscription, 'item': item, 'amount': amount}
+        for item, amount in items
+    ]).execute()
+
+def _delete_orders(order_ids):
+    """Delete orders together with their items"""
+    if order_ids:
+        OrderItem.delete().where(OrderItem.order.in_(order_ids)).execute()
+        Order.delete().where(Order.id.in_(order_ids)).execute()
+
+def override_occurrence(subscription, occurrence_date, delivery_date=None, items=None, halbe_channel=None,
+                        production_date=None):
+    """
+    Materialize one occurrence of a subscription as an order ("only this" edits).
+    
+    Parameters:
+    - occurrence_date: Delivery date of the occurrence in the rule
+    - delivery_date: New delivery date, defaults to the occurrence date
+    - items: List of (Item, amount) tuples, defaults to the rule's items.
+      An empty list cancels the occurrence.
+    - halbe_channel: Defaults to the rule's setting
+    - production_date: Defaults to the date calculated from the items
+    
+    An existing override of the occurrence is updated in place.
+    
+    Returns:
+    - The override Order
+    """
+    if items is None:
+        items = [(line.item, line.amount) for line in subscription.subscription_items]
+    delivery_date = delivery_date or occurrence_date
+    
+    # A cancelled occurrence keeps the production date of the rule so it stays out of the plans
+    if production_date is None:
+        lead_items = [OrderItem(item=item, amount=amount) for item, amount in items] or list(subscription.subscription_items)
+        production_date = calculate_production_date(delivery_date, lead_items)
+    
+    with db.atomic():
+        order = Order.get_or_none((Order.subscription == subscription) &
+                                  (Order.occurrence_date == occurrence_date))
+        if order is None:
+            order = Order(subscription=subscription, occurrence_date=occurrence_date,
+                          customer=subscription.customer, order_id=uuid.uuid4())
+        else:
+            OrderItem.delete().where(OrderItem.order == order).execute()
+        order.delivery_date = delivery_date
+        order.production_date = production_date
+        order.halbe_channel = subscription.halbe_channel if halbe_channel is None else halbe_channel
+        order.save()
+        
+        if items:
+            OrderItem.insert_many([
+                {'order': order, 'item': item, 'amount': amount} for item, amount in items
+            ]).execute()
+    return order
+
+def delete_subscription(subscription):
+    """Delete a rule with its items and override orders"""
+    with db.atomic():
+        SubscriptionItem.delete().where(SubscriptionItem.subscription == subscription).execute()
+        _delete_orders([order.id for order in subscription.overrides])
+        subscription.delete_instance()
+
+def end_subscription(subscription, end_before):
+    """
+    Stop a subscription before the given date ("this and future" deletion).
+    
+    Overrides from end_before on are deleted. A rule without any remaining
+    occurrence is deleted entirely.
+    """
+    with db.atomic():
+        _delete_orders([order_id for (order_id,) in Order
+                        .select(Order.id)
+                        .where((Order.subscription == subscription) &
+                               (Order.occurrence_date >= end_before))
+                        .tuples()])
+        
+        if not subscription_dates(subscription, subscription.from_date, end_before - timedelta(days=1)):
+            delete_subscription(subscription)
+        else:
+            subscription.to_date = end_before - timedelta(days=1)
+            subscription.save()
+
+def update_subscription(subscription, occurrence_date, delivery_date, subscription_type,
+                        from_date, to_date, items, halbe_channel):
+    """
+    Apply a "this and future" edit made on one occurrence of a subscription.
+    
+    Only the rule rows are rewritten: when the edit starts at the first
+    occurrence the rule is updated in place, otherwise it is ended before the
+    occurrence and continued by a new rule. Overrides from the occurrence on
+    are replaced by the new settings. With subscription_type 0 the subscription
+    ends and the occurrence becomes a single order.
+    
+    Returns:
+    - The Subscription, or the single Order, that now holds the occurrence
+    """
+    with db.atomic():
+        first = subscription_dates(subscription, subscription.from_date, subscription.to_date)[:1]
+        
+        if subscription_type == 0:
+            end_subscription(subscription, occurrence_date)
+            order = Order.create(
+                customer=subscription.customer,
+                delivery_date=delivery_date,
+                production_date=calculate_production_date(
+                    delivery_date, [OrderItem(item=item, amount=amount) for item, amount in items]),
+                halbe_channel=halbe_channel,
+                order_id=uuid.uuid4()
+            )
+            OrderItem.insert_many([
+                {'order': order, 'item': item, 'amount': amount} for item, amount in items
+            ]).execute()
+            return order
+        
+        if first and occurrence_date > first[0]:
+            end_subscription(subscription, occurrence_date)
+            return create_subscription(subscription.customer, subscription_type, delivery_date,
+                                       from_date, to_date, items, halbe_channel)
+        
+        _delete_orders([order.id for order in subscription.overrides])
+        subscription.subscription_type = subscription_type
+        subscription.anchor_date = delivery_date
+        subscription.from_date = from_date
+        subscription.to_date = to_date
+        subscription.halbe_channel = halbe_channel
+        subscription.save()
+        _replace_subscription_items(subscription, items)
+        return subscription
+
+def subscription_snapshot(subscription):
+    """State of a rule with its items and override orders, for undo"""
+    return {
+        'id': subscription.id,
+        'customer_id': subscription.customer_id,
+        'subscription_type': subscription.subscription_type,
+        'anchor_date': subscription.anchor_date,
+        'from_date': subscription.from_date,
+        'to_date': subscription.to_date,
+        'halbe_channel': subscription.halbe_channel,
+        'items': [(line.item_id, line.amount) for line in subscription.subscription_items],
+        'overrides': [
+            {
+                'order_id': order.order_id,
+                'delivery_date': order.delivery_date,
+                'production_date': order.production_date,
+                'occurrence_date': order.occurrence_date,
+                'halbe_channel': order.halbe_channel,
+                'items': [(oi.item_id, oi.amount) for oi in order.order_items]
+            }
+            for order in subscription.overrides
+        ]
+    }
+
+def restore_subscription(snapshot):
+    """Put a rule, its items and its overrides back to a subscription_snapshot"""
+    with db.atomic():
+        _delete_orders([order_id for (order_id,) in Order
+                        .select(Order.id)
+                        .where(Order.subscription == snapshot['id'])
+                        .tuples()])
+        Subscription.insert(
+            id=snapshot['id'],
+            customer=snapshot['customer_id'],
+            subscription_type=snapshot['subscription_type'],
+            anchor_date=snapshot['anchor_date'],
+            from_date=snapshot['from_date'],
+            to_date=snapshot['to_date'],
+            halbe_channel=snapshot['halbe_channel']
+        ).on_conflict_replace().execute()
+        subscription = Subscription.get_by_id(snapshot['id'])
+        _replace_subscription_items(subscription, snapshot['items'])
+        
+        for override in snapshot['overrides']:
+            order = Order.create(
+                subscription=subscription,
+                customer=subscription.customer_id,
+                order_id=override['order_id'],
+                delivery_date=override['delivery_date'],
+                production_date=override['production_date'],
+                occurrence_date=override['occurrence_date'],
+                halbe_channel=override['halbe_channel']
+            )
+            if override['items']:
+                OrderItem.insert_many([
+                    {'order': order, 'item': item_id, 'amount': amount}
+                    for item_id, amount in override['items']
+                ]).execute()
+    return subscription
+
+SCHEDULE_TYPES = ("delivery", "production", "transfer")
+
+def fetch_schedule(schedule_type, start_date, end_date):
+    """Records of one schedule type from start_date to end_date with one range query"""
+    if schedule_type == "delivery":
+        return get_delivery_range(start_date, end_date)
+    if schedule_type == "production":
+        return get_production_range(start_date, end_date)
+    return get_transfer_schedule(start_date, end_date)
+
 def get_delivery_schedule(start_date=None, end_date=None):
     """
     Get delivery schedule for the given date range.
@@ -75,12 +515,99 @@ def get_delivery_schedule(start_date=None, end_date=None):
     # Return all orders in the date range
     return list(query.order_by(Order.delivery_date))
 
+def get_delivery_week(monday):
+    """
+    Get all deliveries of the week starting at the given Monday in a single query.
+    See get_delivery_range for the records.
+    """
+    return get_delivery_range(monday, monday + timedelta(days=6))
+
+def get_delivery_range(start_date, end_date):
+    """
+    Get all deliveries from start_date to end_date (inclusive) in a single query.
+    
+    Instead of Order instances (whose order_items/item are loaded lazily, one query
+    per order and item) this returns lightweight records, sorted by delivery date
+    and customer name:
+    - 'id': Order primary key for opening the editor, None for a subscription occurrence
+    - 'subscription_id': Subscription rule of an occurrence or override, else None
+    - 'date': delivery date
+    - 'customer': customer name
+    - 'halbe_channel': halbe channel flag
+    - 'items': list of (item name, amount) tuples sorted by item name
+    
+    Orders without items are included with an empty item list. Subscription
+    occurrences are expanded from their rules (see expand_subscriptions).
+    """
+    rows = (Order
+            .select(Order.id, Order.subscription, Order.delivery_date, Order.halbe_channel,
+                    Customer.name, Item.name, OrderItem.amount)
+            .join(Customer)
+            .switch(Order)
+            .join(OrderItem, JOIN.LEFT_OUTER)
+            .join(Item, JOIN.LEFT_OUTER)
+            .where((Order.delivery_date >= start_date) &
+                   (Order.delivery_date <= end_date))
+            .order_by(Order.delivery_date, Order.id)
+            .tuples())
+    
+    records = {}
+    for order_id, subscription_id, delivery_date, halbe_channel, customer_name, item_name, amount in rows:
+        record = records.get(order_id)
+        if record is None:
+            record = records[order_id] = {
+                'id': order_id,
+                'subscription_id': subscription_id,
+                'date': delivery_date,
+                'customer': customer_name,
+                'halbe_channel': bool(halbe_channel),
+                'items': []
+            }
+        if item_name is not None:
+            record['items'].append((item_name, amount))
+    
+    records = list(records.values())
+    for occurrence in expand_subscriptions(start_date, end_date):
+        subscription = occurrence['subscription']
+        records.append({
+            'id': None,
+            'subscription_id': subscription.id,
+            'date': occurrence['delivery_date'],
+            'customer': subscription.customer.name,
+            'halbe_channel': bool(subscription.halbe_channel),
+            'items': [(line.item.name, line.amount) for line in occurrence['items']]
+        })
+    
+    for record in records:
+        record['items'].sort(key=lambda pair: pair[0].lower())
+    
+    return sorted(records, key=lambda r: (r['date'], r['customer'].lower()))
+
+def counted_in_schedule():
+    """
+    Filter for orders that count towards the production and transfer plans:
+    single orders, and subscription orders delivered within their subscription range.
+    """
+    return (
+        # For non-subscription orders
+        (
+            (Order.from_date.is_null(True)) & 
+            (Order.to_date.is_null(True))
+        ) |
+        # For subscription orders, ensure the delivery date is within the subscription range
+        (
+            (Order.from_date.is_null(False)) & 
+            (Order.delivery_date >= Order.from_date) & 
+            (Order.delivery_date <= Order.to_date)
+        )
+    )
+
 def get_production_plan(start_date=None, end_date=None):
     """
     Get production plan for the given date range.
     
-    The application now correctly creates orders with the right subscription pattern,
-    so we should simply display all orders in the database for the requested date range.
+    This aggregates the order items directly and is the reference for the
+    production_rollup table. Weekly views and PDFs use get_production_week.
     """
     query = (OrderItem
         .select(
@@ -94,22 +621,7 @@ def get_production_plan(start_date=None, end_date=None):
         .join(Order)
         .switch(OrderItem)
         .join(Item)
-        .where(
-            # Both current and future orders should be included, just filter by subscription status
-            (
-                # For non-subscription orders
-                (
-                    (Order.from_date.is_null(True)) & 
-                    (Order.to_date.is_null(True))
-                ) |
-                # For subscription orders, ensure both delivery and production dates are within range
-                (
-                    (Order.from_date.is_null(False)) & 
-                    (Order.delivery_date >= Order.from_date) & 
-                    (Order.delivery_date <= Order.to_date)
-                )
-            )
-        )
+        .where(counted_in_schedule())
         .group_by(Order.production_date, Item.name, Item.seed_quantity, Item.substrate)
         .order_by(Order.production_date))
     
@@ -117,87 +629,118 @@ def get_production_plan(start_date=None, end_date=None):
         query = query.where((Order.production_date >= start_date) & 
                           (Order.production_date <= end_date))
     
-    # Return all results without subscription filtering
-    results = list(query)
+    return list(query)
+
+def get_production_week(monday):
+    """
+    Get the production plan of the week starting at the given Monday.
+    See get_production_range for the records.
+    """
+    return get_production_range(monday, monday + timedelta(days=6))
+
+def get_production_range(start_date, end_date):
+    """
+    Get the production plan from start_date to end_date (inclusive).
+    
+    Reads the incrementally maintained production_rollup table with a single
+    range scan over its (production_date, item) index and adds the expanded
+    subscription occurrences. Returns records with
+    'date', 'item', 'amount', 'seed_quantity' and 'substrate', sorted by date
+    and item name.
+    """
+    rows = (ProductionRollup
+            .select(ProductionRollup.production_date, ProductionRollup.total_amount,
+                    Item.name, Item.seed_quantity, Item.substrate)
+            .join(Item)
+            .where((ProductionRollup.production_date >= start_date) &
+                   (ProductionRollup.production_date <= end_date))
+            .tuples())
     
-    # Debug code for Sunday orders (kept from original)
-    sunday_orders = []
-    for result in results:
-        if result.order.production_date.weekday() == 6:  # 6 = Sunday
-            sunday_orders.append(result)
+    records = {
+        (production_date, item_name): {
+            'date': production_date,
+            'item': item_name,
+            'amount': total_amount,
+            'seed_quantity': seed_quantity,
+            'substrate': substrate
+        }
+        for production_date, total_amount, item_name, seed_quantity, substrate in rows
+    }
     
-    # This is useful to diagnose the issue but doesn't affect functionality
-    if not sunday_orders and start_date and end_date:
-        # Check if the date range includes a Sunday
-        current_date = start_date
-        while current_date <= end_date:
-            if current_date.weekday() == 6:  # Found a Sunday in the range
-                break
-            current_date += timedelta(days=1)
+    for occurrence in expand_subscriptions(start_date, end_date, by_production_date=True):
+        for line in occurrence['items']:
+            record = records.setdefault((occurrence['production_date'], line.item.name), {
+                'date': occurrence['production_date'],
+                'item': line.item.name,
+                'amount': 0,
+                'seed_quantity': line.item.seed_quantity,
+                'substrate': line.item.substrate
+            })
+            record['amount'] += line.amount
     
-    return results
+    return sorted(records.values(), key=lambda r: (r['date'], r['item'].lower()))
 
 def get_transfer_schedule(start_date=None, end_date=None):
     """
     Get transfer schedule for the given date range.
     
-    The application now correctly creates orders with the right subscription pattern,
-    so we should simply display all orders in the database for the requested date range.
+    The transfer date (production_date + soaking_days + germination_days) is
+    computed and filtered inside SQLite on top of the production_rollup table.
+    The production date is first bounded by the smallest and largest offsets in
+    the item catalog, so only the indexed rollup rows around the requested week
+    are read, independent of how much order history the database holds.
+    Subscription occurrences in the same production window are added on top.
     """
-    query = (OrderItem
+    offset = Item.soaking_days + Item.germination_days
+    transfer_date = fn.date(ProductionRollup.production_date, fn.printf('+%d days', offset))
+    
+    query = (ProductionRollup
         .select(
-            Order.production_date,
+            transfer_date.alias('transfer_date'),
             Item.name,
-            Item.soaking_days,
-            Item.germination_days,
-            fn.SUM(OrderItem.amount).alias('total_amount'),
-            Item.seed_quantity
+            fn.SUM(ProductionRollup.total_amount).alias('total_amount')
         )
-        .join(Order)
-        .switch(OrderItem)
         .join(Item)
-        .where(
-            # Include both current and future orders, filter by subscription status
-            (
-                # Either it's a non-subscription order
-                ((Order.from_date.is_null(True)) & (Order.to_date.is_null(True))) |
-                # Or it's within the subscription date range
-                ((Order.from_date.is_null(False)) & (Order.delivery_date >= Order.from_date) & (Order.delivery_date <= Order.to_date))
-            )
-        )
-        .group_by(Order.production_date, Item.name, Item.soaking_days, Item.germination_days, Item.seed_quantity))
+        .group_by(transfer_date, Item.name))
     
-    # Process all records for transfer data without subscription filtering
-    transfer_data = []
+    min_offset, max_offset = Item.select(fn.MIN(offset), fn.MAX(offset)).scalar(as_tuple=True)
+    if min_offset is None:
+        return []  # No items, so nothing can be transferred
     
-    for record in query:
-        transfer_date = record.order.production_date + timedelta(days=record.item.soaking_days + record.item.germination_days)
-        
-        if start_date and end_date:
-            if not (start_date <= transfer_date <= end_date):
-                continue
-        
-        transfer_data.append({
-            'date': transfer_date,
-            'item': record.item.name,
-            'amount': record.total_amount,
-            'seeds': record.total_amount * record.item.seed_quantity
-        })
+    if start_date and end_date:
+        production_start = start_date - timedelta(days=max_offset)
+        production_end = end_date - timedelta(days=min_offset)
+        query = query.where(
+            (ProductionRollup.production_date >= production_start) &
+            (ProductionRollup.production_date <= production_end) &
+            (transfer_date >= start_date.strftime('%Y-%m-%d')) &
+            (transfer_date <= end_date.strftime('%Y-%m-%d'))
+        )
+    else:
+        # Whole history: every occurrence of every rule
+        first, last = Subscription.select(fn.MIN(Subscription.from_date), fn.MAX(Subscription.to_date)).scalar(as_tuple=True)
+        production_start = first - timedelta(days=max_lead_days()) if first else None
+        production_end = last
     
-    # Group by date and item
-    from collections import defaultdict
-    grouped_data = defaultdict(lambda: defaultdict(float))
-    for record in transfer_data:
-        grouped_data[record['date']][record['item']] += record['amount']
-    
-    # Convert to list of records
-    result = []
-    for date, items in sorted(grouped_data.items()):
-        for item_name, amount in items.items():
-            result.append({
-                'date': date,
-                'item': item_name,
-                'amount': amount
-            })
+    # peewee converts the date() result back to a date via the production_date field
+    result = {
+        (transfer_day, item_name): {
+            'date': transfer_day,
+            'item': item_name,
+            'amount': amount
+        }
+        for transfer_day, item_name, amount in query.tuples()
+    }
+    
+    if production_start is not None:
+        for occurrence in expand_subscriptions(production_start, production_end, by_production_date=True):
+            for line in occurrence['items']:
+                transfer_day = occurrence['production_date'] + timedelta(
+                    days=line.item.soaking_days + line.item.germination_days)
+                if start_date and end_date and not start_date <= transfer_day <= end_date:
+                    continue
+                record = result.setdefault((transfer_day, line.item.name),
+                                           {'date': transfer_day, 'item': line.item.name, 'amount': 0})
+                record['amount'] += line.amount
     
-    return sorted(result, key=lambda x: (x['date'], x['item']))
\ No newline at end of file
+    return sorted(result.values(), key=lambda x: (x['date'], x['item']))
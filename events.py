@@ -0,0 +1,102 @@
+"""
+In-process change events between the write paths and the views.
+
+Write paths publish what they changed (OrderChanged, ItemChanged,
+CustomerChanged) on the module level bus, views subscribe to the event types
+their data depends on. Events published while handling one Tk event are
+collected and delivered together from after_idle(), so every view refreshes at
+most once per user action, however many writes the action did.
+"""
+import weakref
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, FrozenSet
+
+
+@dataclass(frozen=True)
+class OrderChanged:
+    """Orders, their items or subscription rules were written"""
+    # Delivery and production dates touched (old and new), None if any date may be affected
+    dates: Optional[FrozenSet[date]] = None
+    order_ids: Optional[FrozenSet[int]] = None  # Orders written or deleted, None if unknown
+
+    def touches(self, start_date, end_date):
+        """Whether the change can show up between start_date and end_date"""
+        if self.dates is None:
+            return True
+        # Production, transfer and delivery of an order lie between its production and delivery date
+        return min(self.dates) <= end_date and max(self.dates) >= start_date
+
+
+@dataclass(frozen=True)
+class ItemChanged:
+    """Items were created, edited or deleted"""
+    item_ids: Optional[FrozenSet[int]] = None  # None if unknown
+
+
+@dataclass(frozen=True)
+class CustomerChanged:
+    """Customers were created, edited or deleted"""
+    customer_ids: Optional[FrozenSet[int]] = None  # None if unknown
+
+
+def order_dates(*orders):
+    """Dates for OrderChanged from orders (or anything with delivery_date/production_date)"""
+    dates = set()
+    for order in orders:
+        for day in (order.delivery_date, order.production_date):
+            if day is not None:
+                dates.add(day)
+    return frozenset(dates)
+
+
+class EventBus:
+    """
+    Collects published events and hands each subscriber the events of its types.
+
+    Without an attached widget (tests, scripts) events are delivered right
+    away; attach() makes the bus deliver from the Tk loop's after_idle().
+    Bound methods are held weakly so a destroyed view doesn't keep getting events.
+    """
+    def __init__(self):
+        self.subscribers = []  # (reference to handler, event types)
+        self.pending = []
+        self.widget = None
+        self.scheduled = False
+
+    def attach(self, widget):
+        """Deliver from widget.after_idle() instead of synchronously"""
+        self.widget = widget
+
+    def subscribe(self, handler, *event_types):
+        """handler(events) gets the list of pending events of the given types once per delivery"""
+        if hasattr(handler, '__self__'):
+            ref = weakref.WeakMethod(handler)
+        else:
+            ref = lambda: handler
+        self.subscribers.append((ref, event_types))
+
+    def publish(self, *events):
+        self.pending.extend(events)
+        if self.widget is None:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            self.widget.after_idle(self.flush)
+
+    def flush(self):
+        """Deliver the pending events, each subscriber is called at most once"""
+        self.scheduled = False
+        events, self.pending = self.pending, []
+        if not events:
+            return
+        for ref, event_types in list(self.subscribers):
+            handler = ref()
+            relevant = [event for event in events if isinstance(event, event_types)]
+            if handler is not None and relevant:
+                handler(relevant)
+        # Forget views that were garbage collected
+        self.subscribers = [(ref, types) for ref, types in self.subscribers if ref() is not None]
+
+
+bus = EventBus()
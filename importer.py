@@ -0,0 +1,643 @@
+"""
+Streaming import of order exports in the Orders.csv format:
+
+    "Kunde","Item","Menge","Lieferdatum","Ansaehen","Woche_Wdh","Von","Bis","Preis"
+
+The file is processed as a pipeline: read_rows parses the CSV lazily,
+validate_chunk checks chunks of rows into ImportRows in worker processes,
+and OrderImporter resolves customers and items, stages the rows in a scratch
+table and, once the whole file is validated, applies the difference to the
+last import in batches with insert_many (through SubscriptionWriter). Memory stays bounded whatever the file size: only the
+current batch and the customer and item lookups are kept in Python, the diff
+runs in SQLite.
+
+The import is incremental, see OrderImporter: re-syncing a delta from the old
+system writes only the changed rows and keeps manual edits of other orders.
+temp_data_import.py wipes all orders first for a full re-import.
+
+When many rows change, the triggers of the derived tables (production rollup,
+customer statistics, change journal) are dropped while writing and the tables
+are rebuilt once at the end, see bulk_load.
+
+Run `python importer.py Orders.csv [--batch-size N] [--workers N] [--dry-run] [--report errors.json]`.
+"""
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, date
+from functools import lru_cache
+from peewee import fn, chunked, JOIN, Tuple
+from models import (db, Customer, Item, Order, OrderItem, Subscription, SubscriptionItem,
+                    ImportedRow, ImportStage, drop_triggers)
+from database import SubscriptionWriter, delete_subscription
+import changes
+import customer_stats
+import rollups
+
+COLUMNS = ("Kunde", "Item", "Menge", "Lieferdatum", "Ansaehen", "Woche_Wdh", "Von", "Bis", "Preis")
+
+ImportRow = namedtuple('ImportRow', ['line', 'customer', 'item', 'amount', 'delivery_date', 'production_date',
+                                     'subscription_type', 'from_date', 'to_date'])
+
+class RowError(ValueError):
+    """A row that can't be imported, with its line number in the file and the column at fault"""
+    def __init__(self, line, column, message):
+        super().__init__(f"Zeile {line}, {column}: {message}" if column else f"Zeile {line}: {message}")
+        self.line = line
+        self.column = column
+        self.message = message
+
+    def as_dict(self):
+        """Entry of the error report"""
+        return {'line': self.line, 'column': self.column, 'reason': self.message}
+
+def read_rows(csvfile):
+    """Yield (line number, fields) of every data row; the header is skipped"""
+    reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+    next(reader, None)
+    for row in reader:
+        yield reader.line_num, row
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    parsed = datetime.strptime(value, '%d.%m.%Y' if len(value) == 10 else '%d.%m.%y').date()
+    if parsed.year < 2000:
+        parsed = parsed.replace(year=parsed.year + 100)
+    return parsed
+
+def parse_date(value):
+    """
+    Parse DD.MM.YY or DD.MM.YYYY; two-digit years are 20xx.
+
+    Exports repeat the same few hundred dates over and over, so the parsed
+    dates are memoized.
+    """
+    return _parse_date(value.strip())
+
+def parse_row(line, row, items=None):
+    """
+    Validate one CSV row into an ImportRow, raising RowError.
+
+    items: names of the known items; rows of other items are rejected. None skips the check.
+    """
+    if len(row) < 8:
+        raise RowError(line, None, f"zu wenige Spalten ({len(row)} statt {len(COLUMNS)})")
+    customer, item = row[0].strip(), row[1].strip()
+    if not customer:
+        raise RowError(line, "Kunde", "fehlt")
+    if not item:
+        raise RowError(line, "Item", "fehlt")
+    if items is not None and item not in items:
+        raise RowError(line, "Item", f"unbekanntes Item '{item}'")
+    try:
+        amount = float(row[2].replace(',', '.'))
+    except ValueError:
+        raise RowError(line, "Menge", f"ungültige Menge '{row[2]}'")
+
+    def optional_date(index):
+        value = row[index].strip()
+        if not value:
+            return None
+        try:
+            return parse_date(value)
+        except ValueError:
+            raise RowError(line, COLUMNS[index], f"ungültiges Datum '{value}'")
+
+    delivery_date = optional_date(3)
+    if delivery_date is None:
+        raise RowError(line, "Lieferdatum", "fehlt")
+    try:
+        subscription_type = int(row[5].strip() or 0)
+    except ValueError:
+        raise RowError(line, "Woche_Wdh", f"ungültiger Rhythmus '{row[5]}'")
+    from_date = to_date = None
+    if subscription_type > 0:
+        from_date, to_date = optional_date(6), optional_date(7)
+        if from_date is None or to_date is None:
+            raise RowError(line, "Von" if from_date is None else "Bis", "fehlt bei einem Abonnement")
+    try:
+        production_date = optional_date(4)
+    except RowError:
+        # Not fatal, the production date is calculated from the items instead
+        production_date = None
+    return ImportRow(line, customer, item, amount, delivery_date, production_date,
+                     subscription_type, from_date, to_date)
+
+def validate_chunk(rows, items):
+    """
+    Validate a list of (line number, fields); runs in the worker processes.
+
+    Returns:
+    - (ImportRows of the valid rows, (line, column, reason) of the others)
+    """
+    valid = []
+    errors = []
+    for line, row in rows:
+        try:
+            valid.append(parse_row(line, row, items))
+        except RowError as error:
+            errors.append((error.line, error.column, error.message))
+    return valid, errors
+
+def derived_triggers():
+    """Names of the triggers of the tables bulk_load rebuilds"""
+    return [*rollups.TRIGGERS, *customer_stats.TRIGGERS, *changes.TRIGGERS]
+
+@contextmanager
+def bulk_load(database=db):
+    """
+    Write many rows without the per-row triggers of the derived tables.
+
+    The triggers are dropped for the block and reinstalled afterwards, then
+    production_rollup and customer_stats are rebuilt and the change journal
+    marks every day as changed. Use it inside a transaction so nobody sees
+    the derived tables out of date.
+    """
+    drop_triggers(derived_triggers(), database)
+    try:
+        yield
+    finally:
+        rollups.install_triggers(database)
+        customer_stats.install_triggers(database)
+        changes.install_triggers(database)
+    rollups.rebuild_rollups(database)
+    customer_stats.rebuild_customer_stats(database)
+    changes.bump_all(database)
+
+def natural_key(row):
+    """Key of an ImportRow: customer, item, delivery date, cadence and subscription range as exported"""
+    return '|'.join(str(part) if part is not None else '' for part in
+                    (row.customer, row.item, row.delivery_date, row.subscription_type, row.from_date, row.to_date))
+
+def _order_key(row):
+    return '|'.join(str(part) if part is not None else '' for part in
+                    (row.customer, row.delivery_date, row.subscription_type, row.from_date, row.to_date))
+
+_STAGE_COLUMNS = [ImportStage.key, ImportStage.customer, ImportStage.item, ImportStage.delivery_date,
+                  ImportStage.subscription_type, ImportStage.from_date, ImportStage.to_date,
+                  ImportStage.amount, ImportStage.production_date]
+
+def _sql_value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+def _insert_rows(database, model, rows, on_conflict=''):
+    """
+    Insert dicts of column values with one prepared statement. Cheaper than
+    insert_many for the many narrow rows of the import, whose SQL peewee would
+    generate anew for every chunk. on_conflict is appended to the statement,
+    e.g. an ON CONFLICT ... DO UPDATE clause.
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+    names = ', '.join(f'"{model._meta.fields[name].column_name}"' for name in columns)
+    sql = (f'INSERT INTO "{model._meta.table_name}" ({names}) '
+           f'VALUES ({", ".join("?" * len(columns))}) {on_conflict}')
+    database.cursor().executemany(sql, ([_sql_value(row[name]) for name in columns] for row in rows))
+
+_MERGE_DUPLICATES = ('ON CONFLICT ("key") DO UPDATE SET amount = amount + excluded.amount, '
+                     'production_date = IFNULL(production_date, excluded.production_date)')
+
+StagedRow = namedtuple('StagedRow', ['key', 'customer', 'item', 'delivery_date', 'subscription_type',
+                                     'from_date', 'to_date', 'amount', 'production_date'])
+
+def _group(row):
+    """Rows with the same group make up one order or subscription rule"""
+    return (row.customer, row.delivery_date, row.subscription_type, row.from_date, row.to_date)
+
+class OrderImporter:
+    """
+    Incremental import of an order export.
+
+    Every row is identified by its natural key (customer, item, delivery date,
+    cadence, range), kept in imported_row together with the order or
+    subscription rule it was written to. The export is staged in a scratch
+    table and diffed against imported_row with joins on the key; only new,
+    changed and vanished rows are written, in batches. Orders and rules the
+    import didn't create are left alone except that rows matching them are
+    adopted instead of duplicated, and manual edits of imported orders stay
+    until the export changes the row. Re-importing the same file writes nothing.
+    """
+    batch_size = 5000       # Rows per insert batch
+    bulk_threshold = 10000  # Changed rows from which the derived tables are rebuilt instead of triggered
+    chunk_rows = 20000      # Rows per validation task
+
+    def __init__(self, batch_size=None, progress=None, on_error=None, database=db, workers=None):
+        """
+        - progress: called with the number of rows read after every validated chunk
+        - on_error: called with every RowError, skipped rows are counted either way
+        - workers: processes validating the rows, default one per CPU; 1 validates in this process
+        """
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.progress = progress
+        self.on_error = on_error
+        self.database = database
+        self.workers = workers or os.cpu_count() or 1
+        self.today = date.today()
+
+    def run(self, path, dry_run=False):
+        """
+        Apply the export at path in one transaction.
+
+        The whole file is validated and staged before anything is written, so
+        the error report (error_report()) is complete at that point. With
+        dry_run nothing is written at all: the counts tell what the import
+        would do, except for the created orders and subscriptions.
+
+        Returns:
+        - Dict with the number of 'rows' read, 'skipped' invalid rows,
+          'duplicates' (rows repeating an earlier key, their amounts are added to it),
+          'inserted', 'updated', 'deleted' and 'unchanged' rows, and the created
+          'orders', 'subscriptions' and 'customers'
+        """
+        self.path = path
+        self.errors = []
+        self.stats = dict.fromkeys(['rows', 'skipped', 'duplicates', 'inserted', 'updated', 'deleted',
+                                    'unchanged', 'orders', 'subscriptions', 'customers'], 0)
+        self.customers = {customer.name: customer.id for customer in Customer.select(Customer.id, Customer.name)}
+        self.new_customers = set()
+        self.items = {item.name: item for item in Item.select()}
+        self.items_by_id = {item.id: item for item in self.items.values()}
+
+        # Left over if an earlier import was killed
+        self.database.drop_tables([ImportStage], safe=True)
+        self.database.create_tables([ImportStage])
+        try:
+            with self.database.atomic():
+                # utf-8-sig drops the byte order mark of exports saved by Excel
+                with open(path, 'r', encoding='utf-8-sig', newline='') as csvfile:
+                    for valid in self.validate(read_rows(csvfile)):
+                        self.stage(valid)
+                staged = ImportStage.select().count()
+                self.stats['duplicates'] = self.stats['rows'] - self.stats['skipped'] - staged
+                self.stats['customers'] = len(self.new_customers)
+
+                if dry_run:
+                    self.stats['deleted'] = self._removed().count()
+                    self.stats['updated'] = self._changed().count()
+                    self.stats['inserted'] = self._new().count()
+                else:
+                    self.create_customers()
+                    pending = self._removed().count() + self._changed().count() + self._new().count()
+                    if pending:
+                        with bulk_load(self.database) if pending >= self.bulk_threshold else nullcontext():
+                            self.apply_deletes()
+                            self.apply_updates()
+                            self.apply_inserts()
+                self.stats['unchanged'] = staged - self.stats['inserted'] - self.stats['updated']
+        finally:
+            # Dropping the filled table inside the transaction would hold all its freed pages in memory
+            self.database.drop_tables([ImportStage])
+        return self.stats
+
+    def validate(self, rows):
+        """
+        Parse and check the rows in chunks of chunk_rows, in worker processes
+        unless workers is 1, and yield the valid ImportRows of every chunk in
+        file order. Invalid rows are counted and collected for the report.
+        """
+        items = frozenset(self.items)
+        chunks = chunked(rows, self.chunk_rows)
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield self._collect(*validate_chunk(chunk, items))
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # A few chunks per worker in flight keep them busy without reading the whole file ahead
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(validate_chunk, chunk, items))
+                if len(pending) >= 2 * self.workers:
+                    yield self._collect(*pending.popleft().result())
+            while pending:
+                yield self._collect(*pending.popleft().result())
+
+    def _collect(self, valid, errors):
+        self.stats['rows'] += len(valid) + len(errors)
+        self.stats['skipped'] += len(errors)
+        for line, column, reason in errors:
+            error = RowError(line, column, reason)
+            self.errors.append(error)
+            if self.on_error:
+                self.on_error(error)
+        return valid
+
+    def error_report(self):
+        """The invalid rows of the last run, for json.dump"""
+        return {
+            'file': self.path,
+            'rows': self.stats['rows'],
+            'errors': [error.as_dict() for error in sorted(self.errors, key=lambda error: error.line)],
+        }
+
+    def stage(self, rows):
+        """Write validated rows into import_stage, batch_size at a time"""
+        for batch in chunked(rows, self.batch_size):
+            # Rows with the same key are lines of the same item in one order: their amounts add up
+            _insert_rows(self.database, ImportStage, [self.resolve(row) for row in batch], _MERGE_DUPLICATES)
+        if self.progress:
+            self.progress(self.stats['rows'])
+
+    def resolve(self, row):
+        """The stage row of an ImportRow; customers that don't exist yet are created by create_customers"""
+        customer_id = self.customers.get(row.customer)
+        if customer_id is None:
+            self.new_customers.add(row.customer)
+        return {
+            'key': natural_key(row),
+            'order_key': _order_key(row),
+            'line': row.line,
+            'customer_name': row.customer,
+            'customer': customer_id,
+            'item': self.items[row.item].id,
+            'delivery_date': row.delivery_date,
+            'production_date': row.production_date,
+            'subscription_type': row.subscription_type,
+            'from_date': row.from_date,
+            'to_date': row.to_date,
+            'amount': row.amount,
+        }
+
+    def create_customers(self):
+        """Create the customers of the export that don't exist and fill in their ids"""
+        if not self.new_customers:
+            return
+        Customer.insert_many([{'name': name} for name in sorted(self.new_customers)]).execute()
+        self.database.execute_sql(
+            'UPDATE import_stage SET customer = (SELECT MIN(id) FROM customer WHERE name = customer_name) '
+            'WHERE customer IS NULL')
+
+    # The three sides of the diff
+
+    def _removed(self):
+        """Imported rows no longer in the export"""
+        return (ImportedRow
+                .select(ImportedRow.id, ImportedRow.item, ImportedRow.order, ImportedRow.subscription)
+                .join(ImportStage, JOIN.LEFT_OUTER, on=(ImportStage.key == ImportedRow.key))
+                .where(ImportStage.id.is_null()))
+
+    def _changed(self):
+        """Imported rows whose amount or production date differs in the export"""
+        return (ImportedRow
+                .select(ImportedRow.id, ImportedRow.item, ImportedRow.order, ImportedRow.subscription,
+                        ImportStage.amount, ImportStage.production_date)
+                .join(ImportStage, on=(ImportStage.key == ImportedRow.key))
+                .where((ImportStage.amount != ImportedRow.amount) |
+                       (fn.IFNULL(ImportStage.production_date, '') != fn.IFNULL(ImportedRow.production_date, ''))))
+
+    def _new(self):
+        """Export rows without an imported row, the rows of an order together"""
+        return (ImportStage
+                .select(*_STAGE_COLUMNS, ImportStage.order_key)
+                .join(ImportedRow, JOIN.LEFT_OUTER, on=(ImportedRow.key == ImportStage.key))
+                .where(ImportedRow.id.is_null())
+                .order_by(ImportStage.order_key, ImportStage.key))
+
+    def _pages(self, query, order_column, key):
+        """Run query in batches, continuing after the key of the previous batch's last row"""
+        last = None
+        while True:
+            page = query
+            if last is not None:
+                page = page.where(order_column > last)
+            rows = list(page.order_by(order_column).limit(self.batch_size).tuples())
+            if not rows:
+                return
+            yield rows
+            last = key(rows[-1])
+
+    def apply_deletes(self):
+        """Remove the items of vanished rows, and the orders and rules left without items"""
+        cursor = self.database.cursor()
+        for rows in self._pages(self._removed(), ImportedRow.id, lambda row: row[0]):
+            orders = [(order_id, item_id) for row_id, item_id, order_id, subscription_id in rows if order_id]
+            subscriptions = [(subscription_id, item_id)
+                             for row_id, item_id, order_id, subscription_id in rows if subscription_id]
+            cursor.executemany('DELETE FROM orderitem WHERE order_id = ? AND item_id = ?', orders)
+            cursor.executemany('DELETE FROM subscriptionitem WHERE subscription_id = ? AND item_id = ?',
+                               subscriptions)
+            for chunk in chunked({order_id for order_id, _ in orders}, SubscriptionWriter.MAX_VARIABLES):
+                (Order.delete()
+                 .where(Order.id.in_(chunk) &
+                        ~fn.EXISTS(OrderItem.select().where(OrderItem.order == Order.id)))
+                 .execute())
+            for chunk in chunked({subscription_id for subscription_id, _ in subscriptions},
+                                 SubscriptionWriter.MAX_VARIABLES):
+                emptied = (Subscription.select()
+                           .where(Subscription.id.in_(chunk) &
+                                  ~fn.EXISTS(SubscriptionItem.select()
+                                             .where(SubscriptionItem.subscription == Subscription.id))))
+                for subscription in emptied:
+                    delete_subscription(subscription)
+            for chunk in chunked([row[0] for row in rows], SubscriptionWriter.MAX_VARIABLES):
+                ImportedRow.delete().where(ImportedRow.id.in_(chunk)).execute()
+            self.stats['deleted'] += len(rows)
+
+    def apply_updates(self):
+        """Write the new amounts and production dates of changed rows"""
+        cursor = self.database.cursor()
+        for rows in self._pages(self._changed(), ImportedRow.id, lambda row: row[0]):
+            rows = [(*row[:5], row[5] and row[5].isoformat()) for row in rows]
+            cursor.executemany(
+                'UPDATE orderitem SET amount = ? WHERE order_id = ? AND item_id = ?',
+                [(amount, order_id, item_id) for _, item_id, order_id, _, amount, _ in rows if order_id])
+            cursor.executemany(
+                'UPDATE subscriptionitem SET amount = ? WHERE subscription_id = ? AND item_id = ?',
+                [(amount, subscription_id, item_id)
+                 for _, item_id, _, subscription_id, amount, _ in rows if subscription_id])
+            cursor.executemany(
+                'UPDATE "order" SET production_date = ? WHERE id = ? AND production_date IS NOT ?',
+                [(production_date, order_id, production_date)
+                 for _, _, order_id, _, _, production_date in rows if order_id and production_date])
+            cursor.executemany(
+                'UPDATE imported_row SET amount = ?, production_date = ? WHERE id = ?',
+                [(amount, production_date, row_id) for row_id, _, _, _, amount, production_date in rows])
+            self.stats['updated'] += len(rows)
+
+    def apply_inserts(self):
+        """Write the new rows into the order or rule of their group, creating those that don't exist"""
+        query = self._new()
+        last = None
+        while True:
+            page = query
+            if last is not None:
+                page = page.where(Tuple(ImportStage.order_key, ImportStage.key) > Tuple(*last))
+            rows = list(page.limit(self.batch_size).tuples())
+            if not rows:
+                return
+            last = (rows[-1][-1], rows[-1][0])
+            self._insert_rows([StagedRow(*row[:-1]) for row in rows])
+
+    def _insert_rows(self, rows):
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault(_group(row), []).append(row)
+        targets = self._targets(groups, rows)
+        existing = self._existing_items(targets.values())
+
+        writer = SubscriptionWriter(self.database)
+        created = {'order': [], 'subscription': []}  # Groups in the order they were queued
+        placed = []  # (row, kind, id)
+        amounts = {'order': [], 'subscription': []}
+        for group, group_rows in groups.items():
+            target = targets.get(group)
+            if target is None:
+                first = group_rows[0]
+                items = [(self.items_by_id[row.item], row.amount) for row in group_rows]
+                if first.subscription_type > 0:
+                    writer.add_subscription(first.customer, first.subscription_type, first.delivery_date,
+                                            first.from_date, first.to_date, items)
+                    created['subscription'].append(group_rows)
+                else:
+                    writer.add_order(first.customer, first.delivery_date, items,
+                                     production_date=first.production_date,
+                                     is_future=first.delivery_date > self.today)
+                    created['order'].append(group_rows)
+                continue
+            kind, target_id = target
+            for row in group_rows:
+                amount = existing.get((kind, target_id, row.item))
+                # An item the order already has is adopted, with the amount of the export
+                if amount is None:
+                    if kind == 'order':
+                        writer.add_items(target_id, [(row.item, row.amount)])
+                    else:
+                        writer.add_subscription_items(target_id, [(row.item, row.amount)])
+                elif amount != row.amount:
+                    amounts[kind].append((row.amount, target_id, row.item))
+                placed.append((row, kind, target_id))
+
+        written = writer.write()
+        for kind, plural in (('order', 'orders'), ('subscription', 'subscriptions')):
+            self.stats[plural] += len(written[plural])
+            for group_rows, new_id in zip(created[kind], written[plural]):
+                placed.extend((row, kind, new_id) for row in group_rows)
+        cursor = self.database.cursor()
+        cursor.executemany('UPDATE orderitem SET amount = ? WHERE order_id = ? AND item_id = ?', amounts['order'])
+        cursor.executemany('UPDATE subscriptionitem SET amount = ? WHERE subscription_id = ? AND item_id = ?',
+                           amounts['subscription'])
+
+        imported = [{
+            **row._asdict(),
+            'order': target_id if kind == 'order' else None,
+            'subscription': target_id if kind == 'subscription' else None,
+        } for row, kind, target_id in placed]
+        _insert_rows(self.database, ImportedRow, imported)
+        self.stats['inserted'] += len(rows)
+
+    def _targets(self, groups, rows):
+        """
+        The existing order or rule of each group: the one earlier imported rows
+        of the group went to, else a matching order or rule of the database.
+
+        Returns:
+        - Dict of group -> ('order' | 'subscription', id)
+        """
+        # The rows are sorted by customer and date, so ranges bound the lookups
+        customers = (min(row.customer for row in rows), max(row.customer for row in rows))
+        dates = (min(row.delivery_date for row in rows), max(row.delivery_date for row in rows))
+        targets = {}
+
+        def imported(field):
+            return (ImportedRow
+                    .select(ImportedRow.customer, ImportedRow.delivery_date, ImportedRow.subscription_type,
+                            ImportedRow.from_date, ImportedRow.to_date, field)
+                    .join(field.rel_model, on=(field == field.rel_model.id))
+                    .where(ImportedRow.customer.between(*customers) &
+                           ImportedRow.delivery_date.between(*dates))
+                    .tuples())
+
+        for kind, field in (('order', ImportedRow.order), ('subscription', ImportedRow.subscription)):
+            for *group, target_id in imported(field):
+                targets.setdefault(tuple(group), (kind, target_id))
+
+        orders = (Order
+                  .select(Order.customer, Order.delivery_date, Order.id)
+                  .where(Order.customer.between(*customers) & Order.delivery_date.between(*dates) &
+                         Order.subscription.is_null() & (Order.subscription_type == 0))
+                  .order_by(Order.id)
+                  .tuples())
+        for customer_id, delivery_date, order_id in orders:
+            targets.setdefault((customer_id, delivery_date, 0, None, None), ('order', order_id))
+        rules = (Subscription
+                 .select(Subscription.customer, Subscription.anchor_date, Subscription.subscription_type,
+                         Subscription.from_date, Subscription.to_date, Subscription.id)
+                 .where(Subscription.customer.between(*customers) & Subscription.anchor_date.between(*dates))
+                 .order_by(Subscription.id)
+                 .tuples())
+        for *group, subscription_id in rules:
+            targets.setdefault(tuple(group), ('subscription', subscription_id))
+        return {group: targets[group] for group in groups if group in targets}
+
+    def _existing_items(self, targets):
+        """(kind, id, item id) -> amount of the items the target orders and rules already have"""
+        existing = {}
+        for kind, model, parent in (('order', OrderItem, OrderItem.order),
+                                    ('subscription', SubscriptionItem, SubscriptionItem.subscription)):
+            ids = sorted({target_id for target_kind, target_id in targets if target_kind == kind})
+            for chunk in chunked(ids, SubscriptionWriter.MAX_VARIABLES):
+                for target_id, item_id, amount in (model.select(parent, model.item, model.amount)
+                                                   .where(parent.in_(chunk)).tuples()):
+                    existing[(kind, target_id, item_id)] = amount
+        return existing
+
+def import_orders(path, batch_size=None, progress=None, on_error=None):
+    """Import an order export, see OrderImporter.run"""
+    return OrderImporter(batch_size, progress, on_error).run(path)
+
+def add_arguments(parser):
+    """Options of the import command, shared with the kleinblatt command line"""
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help=f"rows per insert batch (default: {OrderImporter.batch_size})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processes validating the rows (default: one per CPU)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only validate and report what would change, write nothing")
+    parser.add_argument('--report', metavar='JSON',
+                        help="write the invalid rows (line, column, reason) to this file")
+
+def run_command(args):
+    """Import with the parsed options of add_arguments and print a summary; returns the exit status"""
+    importer = OrderImporter(args.batch_size, workers=args.workers,
+                             progress=lambda rows: print(f"\r{rows} Zeilen geprüft", end='', flush=True))
+    stats = importer.run(args.path, dry_run=args.dry_run)
+    report = importer.error_report()
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        for error in report['errors']:
+            print(f"\nZeile {error['line']}, {error['column'] or '-'}: {error['reason']}", end='')
+
+    print(f"\n{'Probelauf, nichts geschrieben: ' if args.dry_run else ''}"
+          f"{stats['inserted']} neu, {stats['updated']} geändert, {stats['deleted']} gelöscht, "
+          f"{stats['unchanged']} unverändert, {stats['duplicates']} doppelt, {stats['skipped']} fehlerhaft")
+    if not args.dry_run:
+        print(f"{stats['orders']} Bestellungen, {stats['subscriptions']} Abonnements und "
+              f"{stats['customers']} Kunden angelegt")
+    else:
+        print(f"{stats['customers']} neue Kunden")
+    return 1 if stats['skipped'] else 0
+
+def main(argv=None):
+    """Command line: python importer.py Orders.csv [--dry-run] [--report errors.json]; returns the exit status"""
+    import argparse
+    from models import configure_database, create_tables
+
+    parser = argparse.ArgumentParser(description="Import an order export (Orders.csv format)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    configure_database()
+    create_tables()
+    return run_command(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
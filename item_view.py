@@ -1,17 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from widgets import AutocompleteCombobox
-from models import Item
+from models import Item, OrderItem, SubscriptionItem
 from datetime import datetime
+from events import bus, ItemChanged
+from undo import undo_log
 
 class ItemView:
     def __init__(self, parent, app=None):
         self.parent = parent
-        self.app = app  # Store reference to main app for undo system
+        self.app = app  # Store reference to main app
         self.edit_mode = False
         self.current_item = None
         self.create_widgets()
         self.refresh_item_list()
+        bus.subscribe(self.on_change, ItemChanged)
+
+    def on_change(self, events):
+        """Bus handler for item writes, including undo"""
+        self.refresh_item_list()
 
     def create_widgets(self):
         # Input frame
@@ -148,18 +155,6 @@ class ItemView:
 
         try:
             if self.edit_mode and self.current_item:
-                # Store original data for undo
-                original_data = {
-                    'item_id': self.current_item.id,
-                    'name': self.current_item.name,
-                    'seed_quantity': self.current_item.seed_quantity,
-                    'soaking_days': self.current_item.soaking_days,
-                    'germination_days': self.current_item.germination_days,
-                    'growth_days': self.current_item.growth_days,
-                    'price': self.current_item.price,
-                    'substrate': self.current_item.substrate
-                }
-                
                 # Update existing item
                 self.current_item.name = name
                 self.current_item.seed_quantity = seed_qty
@@ -168,43 +163,29 @@ class ItemView:
                 self.current_item.growth_days = growth_days
                 self.current_item.price = price
                 self.current_item.substrate = substrate
-                self.current_item.save()
-                
-                # Record action for undo if app reference exists
-                if self.app:
-                    self.app.record_action(
-                        "edit_item",
-                        original_data,
-                        {'item_id': self.current_item.id},
-                        f"Änderung von Artikel: {name}"
-                    )
+                with undo_log.step(f"Änderung von Artikel: {name}"):
+                    self.current_item.save()
                 
+                changed = ItemChanged(frozenset({self.current_item.id}))
                 messagebox.showinfo("Erfolg", "Artikel erfolgreich aktualisiert")
             else:
                 # Create new item
-                item = Item.create(
-                    name=name,
-                    seed_quantity=seed_qty,
-                    soaking_days=soaking_days,
-                    germination_days=germination_days,
-                    growth_days=growth_days,
-                    price=price,
-                    substrate=substrate
-                )
-                
-                # Record action for undo if app reference exists
-                if self.app:
-                    self.app.record_action(
-                        "create_item",
-                        None,  # No old data for creation
-                        {'item_id': item.id},
-                        f"Erstellung von Artikel: {name}"
+                with undo_log.step(f"Erstellung von Artikel: {name}"):
+                    item = Item.create(
+                        name=name,
+                        seed_quantity=seed_qty,
+                        soaking_days=soaking_days,
+                        germination_days=germination_days,
+                        growth_days=growth_days,
+                        price=price,
+                        substrate=substrate
                     )
                 
+                changed = ItemChanged(frozenset({item.id}))
                 messagebox.showinfo("Erfolg", "Artikel erfolgreich hinzugefügt")
 
             self.cancel_edit()
-            self.refresh_item_list()
+            bus.publish(changed)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -264,27 +245,14 @@ class ItemView:
             item_id = self.tree.item(selected_item[0])['values'][0]
             item = Item.get_by_id(item_id)
             
-            # Store original data for undo
-            original_data = {
-                'item_id': item.id,
-                'name': item.name,
-                'seed_quantity': item.seed_quantity,
-                'soaking_days': item.soaking_days,
-                'germination_days': item.germination_days,
-                'growth_days': item.growth_days,
-                'price': item.price,
-                'substrate': item.substrate
-            }
-            
-            item.delete_instance()
+            # Items still in use can't be deleted (foreign keys are enforced)
+            usage_count = (OrderItem.select().where(OrderItem.item == item).count() +
+                           SubscriptionItem.select().where(SubscriptionItem.item == item).count())
+            if usage_count > 0:
+                messagebox.showerror("Fehler", f"Artikel wird in {usage_count} Bestellpositionen verwendet und kann nicht gelöscht werden")
+                return
             
-            # Record action for undo if app reference exists
-            if self.app:
-                self.app.record_action(
-                    "delete_item",
-                    original_data,
-                    None,
-                    f"Löschung von Artikel: {item.name}"
-                )
+            with undo_log.step(f"Löschung von Artikel: {item.name}"):
+                item.delete_instance()
             
-            self.refresh_item_list()
\ No newline at end of file
+            bus.publish(ItemChanged(frozenset({item.id})))
\ No newline at end of file
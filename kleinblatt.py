@@ -0,0 +1,160 @@
+"""
+Command line of Kleinblatt, for cron jobs and scripts on machines without a display.
+
+    python kleinblatt.py delivery --week 2024-W10 [--json]
+    python kleinblatt.py production --week 2024-W10
+    python kleinblatt.py transfer --week 2024-W10
+    python kleinblatt.py print --week 2024-W10 [--types delivery,production] [--output DIR]
+    python kleinblatt.py import Orders.csv [--dry-run] [--report errors.json]
+
+Without --week the current week is used. Nothing here imports tkinter, and
+the PDF renderer (fpdf) is only imported by the print command, so showing a
+week stays well under a second.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import date, timedelta
+
+from models import db, configure_database, create_tables
+from database import SCHEDULE_TYPES, fetch_schedule
+import importer
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'production.db')
+
+WEEKDAYS = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+
+_WEEK = re.compile(r'^(\d{4})-?W(\d{1,2})$', re.IGNORECASE)
+
+def parse_week(value):
+    """Monday of an ISO week given as YYYY-Www (e.g. 2024-W10)"""
+    match = _WEEK.match(value.strip())
+    if match:
+        try:
+            return date.fromisocalendar(int(match.group(1)), int(match.group(2)), 1)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid week '{value}', expected YYYY-Www")
+
+def week_label(monday):
+    year, week, _ = monday.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def format_amount(amount):
+    """Whole numbers without decimals, like the printed schedules"""
+    return str(int(amount)) if amount == int(amount) else str(amount)
+
+def schedule_rows(schedule_type, records):
+    """Headers and text rows of the schedule records of fetch_schedule"""
+    if schedule_type == "delivery":
+        return ["Datum", "Kunde", "Items", "Halbe Channel"], [
+            [_day(record['date']), record['customer'],
+             ", ".join(f"{name}: {format_amount(amount)}" for name, amount in record['items']),
+             "Ja" if record['halbe_channel'] else "Nein"]
+            for record in records
+        ]
+    if schedule_type == "production":
+        return ["Datum", "Item", "Menge", "Saatgut", "Substrat"], [
+            [_day(record['date']), record['item'], format_amount(record['amount']),
+             format_amount(round(record['amount'] * (record['seed_quantity'] or 0), 2)),
+             record['substrate'] or ""]
+            for record in records
+        ]
+    return ["Datum", "Item", "Menge"], [
+        [_day(record['date']), record['item'], format_amount(record['amount'])]
+        for record in records
+    ]
+
+def _day(day):
+    return f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m.%Y')}"
+
+def format_table(headers, rows):
+    """Plain text table with columns padded to their widest cell"""
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = ["  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip()
+             for row in [headers, ["-" * width for width in widths], *rows]]
+    return "\n".join(lines)
+
+def schedule_json(schedule_type, monday, records):
+    """JSON document of a week's schedule records, dates in ISO format"""
+    if schedule_type == "delivery":
+        records = [dict(record, items=[{'item': name, 'amount': amount} for name, amount in record['items']])
+                   for record in records]
+    return json.dumps({
+        'type': schedule_type,
+        'week': week_label(monday),
+        'from': monday.isoformat(),
+        'to': (monday + timedelta(days=6)).isoformat(),
+        'records': records,
+    }, default=date.isoformat, ensure_ascii=False, indent=2)
+
+def show_schedule(args):
+    monday = args.week
+    with db.reporting():
+        records = fetch_schedule(args.command, monday, monday + timedelta(days=6))
+    if args.json:
+        print(schedule_json(args.command, monday, records))
+    elif records:
+        print(format_table(*schedule_rows(args.command, records)))
+    else:
+        print(f"Keine Einträge in {week_label(monday)}")
+    return 0
+
+def print_week(args):
+    from print_schedules import SchedulePrinter
+    paths = SchedulePrinter(args.output).export_weeks(args.week, args.week + timedelta(days=6), args.types,
+                                                      merge=args.merge, max_workers=args.workers)
+    for path in paths:
+        print(path)
+    return 0
+
+def open_database(path):
+    configure_database(path=path)
+    create_tables()
+
+def parse_types(value):
+    types = [t.strip() for t in value.split(',') if t.strip()]
+    unknown = set(types) - set(SCHEDULE_TYPES)
+    if unknown or not types:
+        raise argparse.ArgumentTypeError(f"unknown schedule type: {', '.join(sorted(unknown)) or value}")
+    return types
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="kleinblatt", description="Kleinblatt without the graphical interface")
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help="SQLite database file (default: production.db next to this script)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    current_week = date.today() - timedelta(days=date.today().weekday())
+    for schedule_type, help_text in zip(SCHEDULE_TYPES, ["delivery schedule", "production plan", "transfer schedule"]):
+        command = commands.add_parser(schedule_type, help=f"show the {help_text} of a week")
+        command.add_argument('--week', type=parse_week, default=current_week,
+                             help="ISO week, YYYY-Www (default: current week)")
+        command.add_argument('--json', action='store_true', help="print JSON instead of a table")
+        command.set_defaults(run=show_schedule)
+
+    command = commands.add_parser('print', help="write the PDF schedules of a week")
+    command.add_argument('--week', type=parse_week, default=current_week,
+                         help="ISO week, YYYY-Www (default: current week)")
+    command.add_argument('--types', type=parse_types, default=list(SCHEDULE_TYPES),
+                         help="comma separated: delivery,production,transfer (default: all)")
+    command.add_argument('--merge', action='store_true', help="write a single document")
+    command.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    command.add_argument('--output', default="output", help="output directory (default: output)")
+    command.set_defaults(run=print_week)
+
+    command = commands.add_parser('import', help="import an order export (Orders.csv format)")
+    importer.add_arguments(command)
+    command.set_defaults(run=importer.run_command)
+    return parser
+
+def main(argv=None):
+    """Run a command; returns the exit status"""
+    args = build_parser().parse_args(argv)
+    open_database(args.database)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
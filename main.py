@@ -1,8 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, timedelta, date
-from models import Item, Order, Customer, OrderItem, db
-from database import calculate_production_date, generate_subscription_orders, get_delivery_schedule, get_production_plan, get_transfer_schedule
+from models import Item, Order, Customer, OrderItem, Subscription, db, create_tables, configure_database, describe_database
+from database import calculate_production_date, get_delivery_schedule, get_production_plan, get_transfer_schedule
+from database import SubscriptionWriter, create_subscription, override_occurrence, subscription_dates
 from peewee import fn, JOIN
 import uuid
 from weekly_view import WeeklyDeliveryView, WeeklyProductionView, WeeklyTransferView
@@ -10,57 +11,19 @@ from customers_view import CustomerView
 from item_view import ItemView
 from widgets import AutocompleteCombobox
 from print_schedules import SchedulePrinter, ask_week_selection
+from events import bus, OrderChanged, ItemChanged, CustomerChanged, order_dates
+from analytics import item_analytics
+from customer_stats import customer_overview
+from undo import undo_log
+from updates import VERSION, start_update_check
 import os
-import requests
 import re
 import sys
 import subprocess
 import json
 import copy
-import time
 
-# Check for updates
-VERSION = "0.9"
-
-# Define action types for undo system
-ACTION_CREATE_ORDER = "create_order"
-ACTION_DELETE_ORDER = "delete_order"
-ACTION_EDIT_ORDER = "edit_order"
-ACTION_CREATE_CUSTOMER = "create_customer"
-ACTION_EDIT_CUSTOMER = "edit_customer"
-ACTION_CREATE_ITEM = "create_item"
-ACTION_EDIT_ITEM = "edit_item"
-
-def check_for_updates():
-    try:
-        # Get latest release info from GitHub API
-        response = requests.get("https://api.github.com/repos/GingerApe/kleinblatt/releases/latest")
-        if response.status_code == 200:
-            latest_version = response.json().get("tag_name", "").strip("v")
-            
-            # Compare versions
-            if latest_version and latest_version > VERSION:
-                update_choice = messagebox.askyesno(
-                    "Update Available", 
-                    f"New version {latest_version} available! (Current: {VERSION})\n\n"
-                    f"Would you like to update now?")
-                
-                if update_choice:
-                    try:
-                        # Run the update script which will pull latest code
-                        update_script = "./update_kleinblatt.sh"
-                        subprocess.run([update_script], check=True)
-                        messagebox.showinfo("Update Successful", 
-                                           "Kleinblatt has been updated successfully!\n"
-                                           "Please restart the application.")
-                        sys.exit(0)
-                    except Exception as e:
-                        messagebox.showerror("Update Failed", 
-                                            f"Could not update automatically. Please update manually:\n{str(e)}")
-        return False
-    except Exception as e:
-        print(f"Update check failed: {str(e)}")
-        return False
+UPDATE_POLL_MS = 200
 
 class ProductionApp(tk.Tk):
     def __init__(self):
@@ -71,14 +34,8 @@ class ProductionApp(tk.Tk):
         self.db = db
         self.printer = SchedulePrinter()
         
-        # Initialize undo history stack
-        self.undo_stack = []
-        self.undo_pointer = -1
-        self.max_undo_steps = 20  # Limit the number of undo actions
-        
-        # Throttling mechanism for refreshes
-        self.last_refresh = 0
-        self.refresh_throttle = 500  # ms minimum between refreshes
+        # Deliver change events once per user action from the Tk loop
+        bus.attach(self)
         
         style = ttk.Style()
         style.configure('Green.TFrame', background='green')
@@ -90,12 +47,19 @@ class ProductionApp(tk.Tk):
         # Create undo button
         self.undo_button = ttk.Button(self.toolbar, text="Rückgängig (Ctrl+Z)", command=self.undo_last_action)
         self.undo_button.pack(side='left', padx=5)
-        self.undo_button.config(state='disabled')  # Initially disabled until there are actions
+        self.update_undo_button()  # The log is kept in production.db, also across restarts
         
-        # Create refresh button with improved throttled refresh
-        self.refresh_button = ttk.Button(self.toolbar, text="Alle Ansichten aktualisieren", command=self.throttled_refresh)
+        # Create refresh button, e.g. after another program changed production.db
+        self.refresh_button = ttk.Button(self.toolbar, text="Alle Ansichten aktualisieren", command=self.refresh_tables)
         self.refresh_button.pack(side='left', padx=5)
         
+        # Non-modal update banner, shown once the background update check finds a release
+        self.update_banner = ttk.Frame(self.toolbar)
+        self.update_label = ttk.Label(self.update_banner)
+        self.update_label.pack(side='left', padx=5)
+        ttk.Button(self.update_banner, text="Aktualisieren", command=self.install_update).pack(side='left', padx=5)
+        ttk.Button(self.update_banner, text="✕", width=2, command=self.update_banner.pack_forget).pack(side='left')
+        
         # Create undo keyboard shortcut
         self.bind('<Control-z>', lambda event: self.undo_last_action())
 
@@ -120,581 +84,140 @@ class ProductionApp(tk.Tk):
         self.notebook.pack(expand=True, fill='both', padx=10, pady=5)
         
         self.load_data()
-        self.create_order_tab()
-        self.create_delivery_tab()
-        self.create_production_tab()
-        self.create_transfer_tab()
-        self.create_customers_tab()
-        self.create_items_tab()
-        self.create_orders_tab()
+        
+        # Tabs are built and loaded when first selected, so startup only pays for the visible one
+        self.tab_builders = {
+            str(self.tab1): self.create_order_tab,
+            str(self.tab2): self.create_delivery_tab,
+            str(self.tab3): self.create_production_tab,
+            str(self.tab4): self.create_transfer_tab,
+            str(self.tab5): self.create_customers_tab,
+            str(self.tab6): self.create_items_tab,
+            str(self.tab7): self.create_orders_tab,
+        }
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        self.build_tab(self.notebook.select())
+        
+        bus.subscribe(self.on_catalog_change, ItemChanged, CustomerChanged)
+        bus.subscribe(self.update_undo_button, OrderChanged, ItemChanged, CustomerChanged)
 
-            # Add these lines to refresh data when app starts
-        if hasattr(self, 'delivery_view'):
-            self.delivery_view.refresh()
-        if hasattr(self, 'production_view'):
-            self.production_view.refresh()
-        if hasattr(self, 'transfer_view'):
-            self.transfer_view.refresh()
+    def on_tab_changed(self, event=None):
+        self.build_tab(self.notebook.select())
+
+    def build_tab(self, tab):
+        """Build the given tab (frame or its path name) unless it was built already"""
+        builder = self.tab_builders.pop(str(tab), None)
+        if builder is not None:
+            builder()
+
+    def start_update_check(self, **kwargs):
+        """Check for a new release in the background, see updates.py"""
+        self.poll_update_check(start_update_check(**kwargs))
+
+    def poll_update_check(self, future):
+        if not future.done():
+            self.after(UPDATE_POLL_MS, self.poll_update_check, future)
+            return
+        try:
+            latest = future.result()
+        except Exception as e:
+            print(f"Update check failed: {e}")
+            return
+        if latest:
+            self.show_update_banner(latest)
+
+    def show_update_banner(self, latest):
+        self.update_label.config(text=f"Neue Version {latest} verfügbar (aktuell: {VERSION})")
+        self.update_banner.pack(side='right', padx=5)
+
+    def install_update(self):
+        try:
+            # Run the update script which will pull latest code
+            subprocess.run(["./update_kleinblatt.sh"], check=True)
+        except Exception as e:
+            messagebox.showerror("Update fehlgeschlagen",
+                                 f"Automatisches Update nicht möglich, bitte manuell aktualisieren:\n{str(e)}")
+            return
+        self.update_banner.pack_forget()
+        messagebox.showinfo("Update erfolgreich",
+                            "Kleinblatt wurde aktualisiert.\nBitte starten Sie die Anwendung neu.")
 
-    def throttled_refresh(self):
-        """Refresh all views but enforce a minimum time between refreshes to prevent flickering"""
-        current_time = int(time.time() * 1000)  # Current time in ms
-        if current_time - self.last_refresh > self.refresh_throttle:
-            self.last_refresh = current_time
-            self.refresh_tables()
-            self.refresh_button.config(state='disabled')  # Temporarily disable button
-            # Re-enable button after throttle period
-            self.after(self.refresh_throttle, lambda: self.refresh_button.config(state='normal'))
+    def on_catalog_change(self, events):
+        """Bus handler: reload the item and customer lookups of the order form"""
+        self.items = {item.name: item for item in Item.select()}
+        self.customers = {customer.name: customer for customer in Customer.select()}
+        if not hasattr(self, 'item_combo'):
+            return  # The order form is not built yet
+        self.item_combo.set_completion_list(sorted(self.items.keys()))
+        self.customer_combo.set_completion_list(sorted(self.customers.keys()))
 
     # Undo system methods
-    def record_action(self, action_type, old_data=None, new_data=None, description=None):
-        """Record an action for potential undo"""
-        # Debug print to see what's being recorded
-        print(f"Recording action: {action_type}, Description: {description}")
-        
-        # Remove any actions that were undone
-        if self.undo_pointer < len(self.undo_stack) - 1:
-            self.undo_stack = self.undo_stack[:self.undo_pointer + 1]
-            
-        # Add the new action
-        self.undo_stack.append({
-            'type': action_type,
-            'old_data': old_data,
-            'new_data': new_data,
-            'description': description or f"Action: {action_type}"
-        })
-        
-        # Limit the stack size
-        if len(self.undo_stack) > self.max_undo_steps:
-            self.undo_stack.pop(0)
-        
-        self.undo_pointer = len(self.undo_stack) - 1
-        self.undo_button.config(state='normal')
-        print(f"Undo stack now has {len(self.undo_stack)} entries, pointer at {self.undo_pointer}")
-    
+    def update_undo_button(self, events=None):
+        """Enable the undo button while the log has a step; also a bus handler, every undoable write publishes"""
+        self.undo_button.config(state='normal' if undo_log.can_undo() else 'disabled')
+
     def undo_last_action(self):
-        """Undo the last recorded action"""
-        if not self.undo_stack or self.undo_pointer < 0:
-            self.undo_button.config(state='disabled')
-            return
-            
-        action = self.undo_stack[self.undo_pointer]
-        print(f"Undoing action: {action['type']}, {action['description']}")
-        
+        """Undo the last recorded step of the persistent undo log (see undo.py)"""
         try:
-            if action['type'] == ACTION_CREATE_ORDER:
-                # Undo order creation by deleting the order
-                if action['new_data'] and 'order_id' in action['new_data']:
-                    order_id = action['new_data']['order_id']
-                    
-                    # Find and delete all orders with this order_id or related to the same subscription
-                    orders = Order.select().where(Order.order_id == order_id)
-                    if orders.exists():
-                        # Get the first order to find related subscription orders
-                        main_order = orders.get()
-                        if main_order.from_date and main_order.to_date and main_order.subscription_type > 0:
-                            # This is a subscription order, get all related orders
-                            with db.atomic():
-                                Order.delete().where(
-                                    (Order.from_date == main_order.from_date) &
-                                    (Order.to_date == main_order.to_date) &
-                                    (Order.customer == main_order.customer)
-                                ).execute()
-                        else:
-                            # Single order
-                            with db.atomic():
-                                Order.delete().where(Order.order_id == order_id).execute()
-                            
-                        messagebox.showinfo("Rückgängig", "Bestellerstellung rückgängig gemacht")
-                
-            elif action['type'] == ACTION_DELETE_ORDER:
-                # Undo order deletion by recreating the order
-                if action['old_data']:
-                    print(f"Restoring deleted order from data: {type(action['old_data'])}")
-                    self.recreate_order_from_data(action['old_data'])
-                    messagebox.showinfo("Rückgängig", "Bestelllöschung rückgängig gemacht")
-                
-            elif action['type'] == ACTION_EDIT_ORDER:
-                # Undo order edit by restoring the previous state
-                if action['old_data']:
-                    print(f"Restoring previous order state from data: {type(action['old_data'])}")
-                    
-                    if isinstance(action['old_data'], dict) and action['old_data'].get('order_id'):
-                        # Single order edit (from delivery tab)
-                        print("Restoring single order from delivery tab")
-                        
-                        # Check if the order still exists
-                        order_id = action['old_data']['order_id']
-                        existing_order = Order.get_or_none(Order.order_id == order_id)
-                        
-                        if existing_order:
-                            print(f"Found existing order with ID {order_id}, updating it")
-                            self.restore_order_from_data(action['old_data'])
-                        else:
-                            print(f"Order with ID {order_id} doesn't exist, recreating it")
-                            self.recreate_order_from_data(action['old_data'])
-                            
-                    elif isinstance(action['old_data'], dict) and 'orders' in action['old_data']:
-                        # Multiple orders edit (from order management)
-                        print(f"Restoring multiple orders ({len(action['old_data']['orders'])}) from orders tab")
-                        self.restore_order_from_data(action['old_data'])
-                    else:
-                        print(f"Unknown order data format for undo: {type(action['old_data'])}")
-                        
-                    messagebox.showinfo("Rückgängig", "Bestelländerung rückgängig gemacht")
-                    
-            elif action['type'] == ACTION_CREATE_CUSTOMER:
-                # Undo customer creation
-                if action['new_data'] and 'customer_id' in action['new_data']:
-                    customer = Customer.get_or_none(Customer.id == action['new_data']['customer_id'])
-                    if customer:
-                        customer.delete_instance(recursive=True)
-                        messagebox.showinfo("Rückgängig", "Kundenerstellung rückgängig gemacht")
-                        
-            elif action['type'] == ACTION_EDIT_CUSTOMER:
-                # Undo customer edit
-                if action['old_data'] and 'customer_id' in action['old_data']:
-                    customer = Customer.get_or_none(Customer.id == action['old_data']['customer_id'])
-                    if customer:
-                        for key, value in action['old_data'].items():
-                            if key != 'customer_id':
-                                setattr(customer, key, value)
-                        customer.save()
-                        messagebox.showinfo("Rückgängig", "Kundenänderung rückgängig gemacht")
-                        
-            elif action['type'] == ACTION_CREATE_ITEM:
-                # Undo item creation
-                if action['new_data'] and 'item_id' in action['new_data']:
-                    item = Item.get_or_none(Item.id == action['new_data']['item_id'])
-                    if item:
-                        item.delete_instance(recursive=True)
-                        messagebox.showinfo("Rückgängig", "Artikelerstellung rückgängig gemacht")
-                        
-            elif action['type'] == ACTION_EDIT_ITEM:
-                # Undo item edit
-                if action['old_data'] and 'item_id' in action['old_data']:
-                    item = Item.get_or_none(Item.id == action['old_data']['item_id'])
-                    if item:
-                        for key, value in action['old_data'].items():
-                            if key != 'item_id':
-                                setattr(item, key, value)
-                        item.save()
-                        messagebox.showinfo("Rückgängig", "Artikeländerung rückgängig gemacht")
-            
-            # Update UI after undo
-            self.load_data()
-            self.refresh_all_tables()  # Use our comprehensive refresh method
-            
-            # Update current customer view if open
-            if hasattr(self, 'on_customer_select'):
-                selected_customers = self.customer_tree.selection() if hasattr(self, 'customer_tree') else None
-                if selected_customers:
-                    self.on_customer_select(None)
-            
-            # Updating undo stack pointer
-            self.undo_pointer -= 1
-            if self.undo_pointer < 0:
-                self.undo_button.config(state='disabled')
-                
+            result = undo_log.undo()
         except Exception as e:
             print(f"Undo error: {str(e)}")
             import traceback
             traceback.print_exc()
             messagebox.showerror("Undo Error", f"Fehler beim Rückgängigmachen: {str(e)}")
-    
-    def recreate_order_from_data(self, order_data):
-        """Recreate an order from stored data"""
-        with db.atomic():
-            # Check if we have a batch of orders to restore
-            if 'orders' in order_data:
-                # Multiple orders
-                for order in order_data['orders']:
-                    self.recreate_order_from_data(order)
-                return
-                
-            # Main order data
-            order_items = order_data.pop('order_items', [])
-            
-            # Make a copy of the data to avoid modifying the original
-            order_dict = order_data.copy()
-            
-            # Remove the 'id' field to avoid unique constraint violations
-            if 'id' in order_dict:
-                order_dict.pop('id')
-            
-            # Handle date fields explicitly
-            for field in ['delivery_date', 'production_date', 'from_date', 'to_date']:
-                if field in order_dict and isinstance(order_dict[field], str):
-                    try:
-                        order_dict[field] = datetime.strptime(order_dict[field], '%Y-%m-%d').date()
-                    except (ValueError, TypeError):
-                        # If conversion fails, remove the field
-                        order_dict.pop(field, None)
-            
-            try:
-                # Check if order with this order_id already exists
-                order_id = order_dict.get('order_id')
-                existing_order = Order.get_or_none(Order.order_id == order_id)
-                
-                if existing_order:
-                    # Update existing order instead of creating a new one
-                    for key, value in order_dict.items():
-                        if key != 'order_id' and hasattr(existing_order, key):
-                            setattr(existing_order, key, value)
-                    existing_order.save()
-                    order = existing_order
-                    
-                    # Delete existing items
-                    OrderItem.delete().where(OrderItem.order == order).execute()
-                else:
-                    # Create new order
-                    order = Order.create(**order_dict)
-                
-                # Recreate order items
-                for item_data in order_items:
-                    item = Item.get(Item.id == item_data['item_id'])
-                    OrderItem.create(
-                        order=order,
-                        item=item,
-                        amount=item_data['amount']
-                    )
-            except Exception as e:
-                print(f"Error recreating order: {str(e)}")
-                print(f"Order data: {order_dict}")
-                raise
-    
-    def restore_order_from_data(self, order_data):
-        """Restore an order to its previous state"""
-        with db.atomic():
-            # Check if we have a batch of orders to restore
-            if 'orders' in order_data:
-                # Multiple orders - could be from subscription edit
-                print(f"Restoring {len(order_data['orders'])} orders from a subscription edit")
-                
-                # First determine what orders currently exist vs what needs to be recreated
-                orders_to_update = {}
-                orders_to_create = []
-                
-                for orig_order in order_data['orders']:
-                    # Ensure order_id is properly formatted for comparison
-                    orig_order_id = orig_order.get('order_id')
-                    if orig_order_id:
-                        # Convert to string if it's a UUID object
-                        if isinstance(orig_order_id, uuid.UUID):
-                            orig_order_id = str(orig_order_id)
-                        orig_order['order_id'] = orig_order_id
-                    
-                    # Check if this order still exists
-                    existing_order = None
-                    if orig_order_id:
-                        existing_order = Order.get_or_none(Order.order_id == orig_order_id)
-                    
-                    if existing_order:
-                        # Add to update dictionary
-                        orders_to_update[orig_order_id] = {
-                            'order': existing_order,
-                            'data': orig_order
-                        }
-                    else:
-                        # Before creating a new order, check if there's already an order with the same:
-                        # - customer
-                        # - delivery_date 
-                        # - from_date/to_date
-                        # This would indicate an order that was edited and we should update it instead of creating a new one
-                        if 'delivery_date' in orig_order and 'customer_id' in orig_order:
-                            delivery_date = orig_order['delivery_date']
-                            if isinstance(delivery_date, str):
-                                delivery_date = datetime.strptime(delivery_date, '%Y-%m-%d').date()
-                            
-                            from_date = orig_order.get('from_date')
-                            if isinstance(from_date, str):
-                                from_date = datetime.strptime(from_date, '%Y-%m-%d').date()
-                                
-                            to_date = orig_order.get('to_date')
-                            if isinstance(to_date, str):
-                                to_date = datetime.strptime(to_date, '%Y-%m-%d').date()
-                            
-                            # Try to find an existing order with matching parameters
-                            try:
-                                customer = Customer.get_by_id(orig_order['customer_id'])
-                                matching_order = Order.get_or_none(
-                                    (Order.customer == customer) &
-                                    (Order.delivery_date == delivery_date) &
-                                    (Order.from_date == from_date) &
-                                    (Order.to_date == to_date)
-                                )
-                                
-                                if matching_order:
-                                    # Found a matching order, update it instead of creating a new one
-                                    print(f"Found matching order with ID {matching_order.order_id} for date {delivery_date}, updating instead of creating new")
-                                    orders_to_update[orig_order_id] = {
-                                        'order': matching_order,
-                                        'data': orig_order
-                                    }
-                                    continue
-                            except Exception as e:
-                                print(f"Error finding matching order: {str(e)}")
-                        
-                        # If no matching order found, add to create list
-                        orders_to_create.append(orig_order)
-                
-                # Delete any FUTURE orders that aren't in the original data
-                # This prevents accidentally deleting past orders
-                if len(orders_to_update) > 0:
-                    # Get a sample order to find subscription details
-                    sample_order_data = list(orders_to_update.values())[0]['data']
-                    sample_order = list(orders_to_update.values())[0]['order']
-                    
-                    # Find original subscription parameters
-                    original_from_date = sample_order_data.get('from_date')
-                    original_to_date = sample_order_data.get('to_date')
-                    original_customer_id = sample_order_data.get('customer_id')
-                    
-                    if original_from_date and original_to_date and original_customer_id:
-                        # Format dates if they're strings
-                        if isinstance(original_from_date, str):
-                            original_from_date = datetime.strptime(original_from_date, '%Y-%m-%d').date()
-                        if isinstance(original_to_date, str):
-                            original_to_date = datetime.strptime(original_to_date, '%Y-%m-%d').date()
-                        
-                        # Get current date to ensure we only remove future orders
-                        today = datetime.now().date()
-                        
-                        # Get all FUTURE orders in the subscription
-                        customer = Customer.get_by_id(original_customer_id)
-                        current_subscription_orders = Order.select().where(
-                            (Order.from_date == sample_order.from_date) &
-                            (Order.to_date == sample_order.to_date) &
-                            (Order.customer == customer) &
-                            (Order.delivery_date >= today)  # CRITICAL: Only consider future orders
-                        )
-                        
-                        # Find orders that aren't in the original data
-                        # Convert all order IDs to strings for consistent comparison
-                        original_order_ids = [str(od['order_id']) for od in order_data['orders']]
-                        
-                        # Get delivery dates from original orders for comparison
-                        original_delivery_dates = {}
-                        for od in order_data['orders']:
-                            if 'delivery_date' in od:
-                                # Convert to date object if it's a string
-                                if isinstance(od['delivery_date'], str):
-                                    delivery_date = datetime.strptime(od['delivery_date'], '%Y-%m-%d').date()
-                                else:
-                                    delivery_date = od['delivery_date']
-                                original_delivery_dates[str(od['order_id'])] = delivery_date
-                        
-                        for current_order in current_subscription_orders:
-                            order_id_str = str(current_order.order_id)
-                            
-                            # Only delete if this order doesn't exist in original data
-                            # AND it's not a past order that was recreated with a new ID
-                            if order_id_str not in original_order_ids:
-                                # Also check if there's a corresponding delivery date match
-                                date_match_found = False
-                                for orig_id, orig_date in original_delivery_dates.items():
-                                    if orig_date == current_order.delivery_date:
-                                        date_match_found = True
-                                        break
-                                        
-                                if not date_match_found:
-                                    # Delete this order as it wasn't in the original subscription
-                                    print(f"Deleting future order {current_order.id} that wasn't in original subscription (delivery date: {current_order.delivery_date})")
-                                    current_order.delete_instance(recursive=True)
-                
-                # Update existing orders
-                for order_info in orders_to_update.values():
-                    order = order_info['order']
-                    data = order_info['data']
-                    
-                    # Make a copy to avoid modifying the original
-                    order_dict = data.copy()
-                    order_items = order_dict.pop('order_items', [])
-                    
-                    # Remove id to avoid conflicts
-                    order_dict.pop('id', None)
-                    
-                    # Handle date fields
-                    for field in ['delivery_date', 'production_date', 'from_date', 'to_date']:
-                        if field in order_dict and isinstance(order_dict[field], str):
-                            try:
-                                order_dict[field] = datetime.strptime(order_dict[field], '%Y-%m-%d').date()
-                            except (ValueError, TypeError):
-                                pass
-                    
-                    # Update order fields
-                    for key, value in order_dict.items():
-                        if key != 'order_id' and key != 'id' and hasattr(order, key):
-                            setattr(order, key, value)
-                    order.save()
-                    
-                    # Delete existing items and recreate them
-                    OrderItem.delete().where(OrderItem.order == order).execute()
-                    
-                    # Recreate order items
-                    for item_data in order_items:
-                        item = Item.get(Item.id == item_data['item_id'])
-                        OrderItem.create(
-                            order=order,
-                            item=item,
-                            amount=item_data['amount']
-                        )
-                
-                # Create orders that no longer exist
-                for order_data in orders_to_create:
-                    self.recreate_order_from_data(order_data)
-                
-                return
-                
-            # Single order restoration logic
-            # Ensure order_id is a string
-            if 'order_id' in order_data and not isinstance(order_data['order_id'], str):
-                order_data['order_id'] = str(order_data['order_id'])
-                
-            # Get the order
-            order = Order.get_or_none(Order.order_id == order_data['order_id'])
-            if not order:
-                # Check if there's an order with the same delivery date and customer
-                if 'delivery_date' in order_data and 'customer_id' in order_data:
-                    delivery_date = order_data['delivery_date']
-                    if isinstance(delivery_date, str):
-                        delivery_date = datetime.strptime(delivery_date, '%Y-%m-%d').date()
-                    
-                    try:
-                        customer = Customer.get_by_id(order_data['customer_id'])
-                        matching_order = Order.get_or_none(
-                            (Order.customer == customer) &
-                            (Order.delivery_date == delivery_date)
-                        )
-                        
-                        if matching_order:
-                            # Found a matching order, update it instead of creating a new one
-                            print(f"Found matching order with ID {matching_order.order_id} for customer {customer.id} and date {delivery_date}")
-                            order = matching_order
-                    except Exception as e:
-                        print(f"Error finding matching order: {str(e)}")
-                
-                # If still no order found, recreate it
-                if not order:
-                    return self.recreate_order_from_data(order_data)
-                
-            # Make a copy to avoid modifying the original
-            order_dict = order_data.copy()
-            order_items = order_dict.pop('order_items', [])
-            
-            # Remove id to avoid conflicts
-            order_dict.pop('id', None)
-            
-            # Handle date fields explicitly
-            for field in ['delivery_date', 'production_date', 'from_date', 'to_date']:
-                if field in order_dict and isinstance(order_dict[field], str):
-                    try:
-                        order_dict[field] = datetime.strptime(order_dict[field], '%Y-%m-%d').date()
-                    except (ValueError, TypeError):
-                        # If conversion fails, keep the original value
-                        pass
-            
-            # Update main order data
-            try:
-                for key, value in order_dict.items():
-                    if key != 'order_id' and key != 'id' and hasattr(order, key):
-                        setattr(order, key, value)
-                order.save()
-                
-                # Delete existing items
-                OrderItem.delete().where(OrderItem.order == order).execute()
-                
-                # Recreate order items
-                for item_data in order_items:
-                    item = Item.get(Item.id == item_data['item_id'])
-                    OrderItem.create(
-                        order=order,
-                        item=item,
-                        amount=item_data['amount']
-                    )
-            except Exception as e:
-                print(f"Error restoring order: {str(e)}")
-                print(f"Order data: {order_dict}")
-                raise
-
-    def serialize_order(self, order):
-        """Serialize an order instance for the undo system"""
-        order_data = {
-            'id': order.id,
-            'order_id': str(order.order_id),  # Convert UUID to string
-            'customer_id': order.customer.id,
-            'delivery_date': order.delivery_date,
-            'production_date': order.production_date,
-            'from_date': order.from_date,
-            'to_date': order.to_date,
-            'subscription_type': order.subscription_type,
-            'halbe_channel': order.halbe_channel,
-            'is_future': order.is_future,
-            'order_items': []
-        }
-        
-        # Convert date objects to strings
-        for key, value in order_data.items():
-            if isinstance(value, date):
-                order_data[key] = value.strftime('%Y-%m-%d')
-            elif isinstance(value, uuid.UUID):
-                order_data[key] = str(value)
-        
-        # Add order items
-        for item in order.order_items:
-            order_data['order_items'].append({
-                'id': item.id,
-                'item_id': item.item.id,
-                'amount': item.amount
-            })
-        
-        return order_data
+            return
+        finally:
+            self.update_undo_button()
+        if result is None:
+            return
 
-    def collect_orders_data(self, orders):
-        """Collect data for multiple orders for the undo system"""
-        return [self.serialize_order(order) for order in orders]
+        description, tables, skipped = result
+        # Update UI after undo
+        events = []
+        if 'customer' in tables:
+            events.append(CustomerChanged())
+        if 'item' in tables:
+            events.append(ItemChanged())
+        if set(tables) - {'customer', 'item'}:
+            events.append(OrderChanged())
+        bus.publish(*events)
+        message = f"{description} rückgängig gemacht"
+        if skipped:
+            message += f"\n\n{skipped} inzwischen gelöschte Einträge konnten nicht wiederhergestellt werden."
+        messagebox.showinfo("Rückgängig", message)
 
     # Add this method
     def create_items_tab(self):
         self.item_view = ItemView(self.tab6, self)
     
-    def load_customers(self):
+    def load_customers(self, events=None):
+        """Fill the customer list and summary from customer_overview (see customer_stats.py)"""
         # Clear existing data
         for item in self.customer_tree.get_children():
             self.customer_tree.delete(item)
             
-        # Fetch customers sorted by order count with total price calculation
-        customers = (Customer
-                    .select(Customer, 
-                            fn.COUNT(Order.id).alias('order_count'),
-                            fn.SUM(OrderItem.amount * Item.price).alias('total_price'),
-                            fn.MAX(Order.delivery_date).alias('last_order_date'))
-                    .join(Order, JOIN.LEFT_OUTER)
-                    .join(OrderItem, JOIN.LEFT_OUTER)
-                    .join(Item, JOIN.LEFT_OUTER)
-                    .where(Order.is_future == False)  # Only include historical orders
-                    .group_by(Customer)
-                    .order_by(fn.COUNT(Order.id).desc()))
+        # Customers sorted by delivery count, subscription deliveries included
+        with db.reporting():
+            customers = customer_overview()
         
         total_customers = 0
         total_revenue = 0.0
         total_orders = 0
         
-        for customer in customers:
-            # Format the total price as currency or show €0.00 if None
-            total_price = customer.total_price or 0
+        for name, order_count, total_price, last_delivery in customers:
+            # Format the total price as currency
             formatted_price = f"€{total_price:.2f}".replace('.',',')
             
             # Calculate average order value
-            avg_value = total_price / customer.order_count if customer.order_count > 0 and total_price else 0
+            avg_value = total_price / order_count if order_count > 0 else 0
             formatted_avg = f"€{avg_value:.2f}".replace('.',',')
             
             # Format last order date
-            last_order = customer.last_order_date.strftime('%d.%m.%Y') if customer.last_order_date else "-"
+            last_order = last_delivery.strftime('%d.%m.%Y') if last_delivery else "-"
             
             self.customer_tree.insert('', 'end', values=(
-                customer.name, 
-                customer.order_count, 
+                name, 
+                order_count, 
                 formatted_price,
                 formatted_avg,
                 last_order
@@ -703,7 +226,7 @@ class ProductionApp(tk.Tk):
             # Update totals
             total_customers += 1
             total_revenue += total_price
-            total_orders += customer.order_count
+            total_orders += order_count
         
         # Update summary variables
         self.total_customers_var.set(f"Anzahl Kunden: {total_customers}")
@@ -711,104 +234,48 @@ class ProductionApp(tk.Tk):
         
         avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
         self.avg_order_value_var.set(f"Durchschn. Bestellwert: €{avg_order_value:.2f}".replace('.',','))
-        
-        # Update the item metrics
+    
+    def refresh_orders_tab(self):
+        """Daten aktualisieren: re-read the customer list and the item metrics"""
+        item_analytics.invalidate()
+        self.load_customers()
         self.update_item_metrics()
     
-    def update_item_metrics(self):
-        """Update the top lists and metrics for items"""
+    def update_item_metrics(self, events=None):
+        """Update the top lists and metrics for items, of the year chosen in the year selector"""
         try:
             # Clear existing data
             for tree in [self.top_items_tree, self.least_items_tree, self.seasonal_tree]:
                 for item in tree.get_children():
                     tree.delete(item)
             
-            # Get item order statistics - most popular items by total amount sold
-            item_stats = (Item
-                        .select(Item,
-                               fn.SUM(OrderItem.amount).alias('total_amount'),
-                               fn.COUNT(OrderItem.id).alias('order_count'),
-                               fn.SUM(OrderItem.amount * Item.price).alias('total_revenue'))
-                        .join(OrderItem)
-                        .join(Order)
-                        .where(Order.is_future == False)
-                        .group_by(Item))
-            
-            # Sort by total amount for top items
-            top_items = sorted(item_stats, key=lambda x: x.total_amount or 0, reverse=True)[:5]
-            
-            # Add top items to tree
-            for item in top_items:
-                total_amount = item.total_amount or 0
-                order_count = item.order_count or 0
-                revenue = item.total_revenue or 0
-                
-                self.top_items_tree.insert('', 'end', values=(
-                    item.name,
-                    f"{total_amount:.1f}",
-                    order_count,
-                    f"€{revenue:.2f}".replace('.',',')
-                ))
-            
-            # Sort by total amount for least ordered items (non-zero orders)
-            non_zero_items = [item for item in item_stats if item.total_amount > 0]
-            least_items = sorted(non_zero_items, key=lambda x: x.total_amount or 0)[:5]
+            years = item_analytics.available_years()
+            self.metrics_year_combo['values'] = ["Alle Jahre"] + [str(year) for year in years]
+            selected = self.metrics_year_combo.get()
+            year = int(selected) if selected.isdigit() else None
             
-            # Add least ordered items to tree
-            for item in least_items:
-                total_amount = item.total_amount or 0
-                order_count = item.order_count or 0
-                revenue = item.total_revenue or 0
-                
-                self.least_items_tree.insert('', 'end', values=(
-                    item.name,
-                    f"{total_amount:.1f}",
-                    order_count,
-                    f"€{revenue:.2f}".replace('.',',')
-                ))
-            
-            # Get seasonal data for popular items
-            seasonal_items = sorted(item_stats, key=lambda x: x.total_amount or 0, reverse=True)[:10]
+            # Top items and least ordered items (non-zero orders)
+            for tree, stats in [(self.top_items_tree, item_analytics.top_items(5, year)),
+                                (self.least_items_tree, item_analytics.least_items(5, year))]:
+                for item in stats:
+                    tree.insert('', 'end', values=(
+                        item.name,
+                        f"{item.total_amount:.1f}",
+                        item.order_count,
+                        f"€{item.total_revenue:.2f}".replace('.',',')
+                    ))
             
-            for item in seasonal_items:
-                # Query quarterly data for this item
-                q1_amount = self.get_quarterly_amount(item, 1, 3)
-                q2_amount = self.get_quarterly_amount(item, 4, 6)
-                q3_amount = self.get_quarterly_amount(item, 7, 9)
-                q4_amount = self.get_quarterly_amount(item, 10, 12)
-                
-                # Determine trend
-                trend = self.determine_trend([q1_amount, q2_amount, q3_amount, q4_amount])
-                
+            # Quarterly amounts of the popular items
+            for item in item_analytics.seasonal(10, year):
                 self.seasonal_tree.insert('', 'end', values=(
                     item.name,
-                    f"{q1_amount:.1f}",
-                    f"{q2_amount:.1f}",
-                    f"{q3_amount:.1f}",
-                    f"{q4_amount:.1f}",
-                    trend
+                    *(f"{amount:.1f}" for amount in item.quarters),
+                    self.determine_trend(item.quarters)
                 ))
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to update item metrics: {str(e)}")
     
-    def get_quarterly_amount(self, item, start_month, end_month):
-        """Get the total amount ordered for an item in a specific quarter"""
-        try:
-            result = (OrderItem
-                    .select(fn.SUM(OrderItem.amount).alias('q_amount'))
-                    .join(Order)
-                    .where(
-                        (OrderItem.item == item) &
-                        (Order.is_future == False) &
-                        (fn.EXTRACT('month', Order.delivery_date) >= start_month) &
-                        (fn.EXTRACT('month', Order.delivery_date) <= end_month)
-                    )
-                    .scalar())
-            return result or 0
-        except Exception:
-            return 0
-    
     def determine_trend(self, quarterly_data):
         """Determine the trend based on quarterly data"""
         if all(x == 0 for x in quarterly_data):
@@ -826,9 +293,8 @@ class ProductionApp(tk.Tk):
         else:
             return "Stable →"
     
-    # Modify refresh_tables method to include items
     def refresh_tables(self):
-        """Refresh all weekly views, but don't automatically schedule another refresh"""
+        """Reload all views unconditionally (toolbar button), write paths publish events instead"""
         if hasattr(self, 'delivery_view'):
             self.delivery_view.refresh()
         if hasattr(self, 'production_view'):
@@ -871,11 +337,21 @@ class ProductionApp(tk.Tk):
             to_date = "" if order.subscription_type == 0 else order.to_date
             
             self.order_tree.insert('', 'end', values=(from_date, to_date, items_summary))
+        
+        # Subscription rules, editable through their next delivery
+        for subscription in Subscription.select().where(Subscription.customer == customer):
+            items_summary = ', '.join(f"{line.item.name} ({line.amount})" for line in subscription.subscription_items)
+            self.order_tree.insert('', 'end', iid=f"subscription-{subscription.id}",
+                                   values=(subscription.from_date, subscription.to_date, items_summary))
             
     def edit_order(self):
         selected_item = self.order_tree.selection()
         if not selected_item:
             return
+        
+        if selected_item[0].startswith('subscription-'):
+            self.edit_subscription(int(selected_item[0].split('-', 1)[1]))
+            return
 
         # Use the from_date and to_date from the selected order row as a grouping key.
         from_date_val, to_date_val, _ = self.order_tree.item(selected_item, 'values')
@@ -885,9 +361,6 @@ class ProductionApp(tk.Tk):
                 (Order.from_date == from_date_val) & (Order.to_date == to_date_val)
             ))
             
-            # Store the original state for undo
-            original_orders_data = self.collect_orders_data(subscription_orders)
-            
         except Order.DoesNotExist:
             messagebox.showerror("Error", "The selected order does not exist.")
             return
@@ -1017,6 +490,7 @@ class ProductionApp(tk.Tk):
                     # Only show subscription options if this is a subscription order
                     has_subscription = existing_order.subscription_type > 0 and existing_order.from_date and existing_order.to_date
                     
+                    # Every question is asked before the undo step starts, no dialog may wait inside its transaction
                     if has_subscription:
                         choice = messagebox.askyesnocancel(
                             "Bestellung löschen", 
@@ -1029,91 +503,69 @@ class ProductionApp(tk.Tk):
                         if choice is None:  # Cancel
                             return
                         
-                        with db.atomic():  # Transaction to ensure all operations succeed or fail together
-                            # First record the action for undo
-                            if choice:  # Yes - Delete only this order
-                                # Store the order data before deletion
-                                order_data = self.serialize_order(existing_order)
-                                self.record_action(
-                                    ACTION_DELETE_ORDER,
-                                    order_data,
-                                    None,
-                                    "Löschung einer Bestellung"
-                                )
-                                
-                                existing_order.delete_instance(recursive=True)
-                                messagebox.showinfo("Erfolg", "Bestellung erfolgreich gelöscht!")
-                            else:  # No - Delete this and all future orders
-                                today = datetime.now().date()
-                                
-                                # Get the items in this order to compare with other orders
-                                current_order_items = set()
-                                for order_item in existing_order.order_items:
-                                    current_order_items.add(order_item.item.id)
-                                
-                                # Get weekday of the current order
-                                current_weekday = existing_order.delivery_date.weekday()
-                                
-                                # Display confirmation dialog with more details
-                                if messagebox.askokcancel("Bestätigen", 
-                                    f"Sind Sie sicher, dass Sie diese Lieferung und alle zukünftigen Lieferungen für {existing_order.customer.name} am gleichen Wochentag löschen möchten?\n\n"
-                                    f"Es werden nur Bestellungen mit identischen Artikeln gelöscht."):
-                                    
-                                    # First get all future orders for the same customer on same weekday
-                                    future_orders_query = Order.select().where(
-                                        (Order.customer == existing_order.customer) &
-                                        (Order.delivery_date >= today)
-                                    )
-                                    
-                                    # Filter for same weekday and same items
-                                    matching_orders = []
-                                    
-                                    for order in future_orders_query:
-                                        # Check if same weekday
-                                        if order.delivery_date.weekday() != current_weekday:
-                                            continue
-                                            
-                                        # Check if has the same items
-                                        order_items = set()
-                                        for order_item in order.order_items:
-                                            order_items.add(order_item.item.id)
-                                            
-                                        # Only include if items match exactly (same count and same IDs)
-                                        if order_items == current_order_items:
-                                            matching_orders.append(order)
-                                    
-                                    # Store all the order data before deletion
-                                    deleted_orders_data = self.collect_orders_data(matching_orders)
-                                    self.record_action(
-                                        ACTION_DELETE_ORDER,
-                                        {'orders': deleted_orders_data},
-                                        None,
-                                        f"Löschung von {len(matching_orders)} Bestellungen"
-                                    )
+                        if choice:  # Yes - Delete only this order
+                            doomed = [existing_order]
+                            description = "Löschung einer Bestellung"
+                            message = "Bestellung erfolgreich gelöscht!"
+                        else:  # No - Delete this and all future orders
+                            # Display confirmation dialog with more details
+                            if not messagebox.askokcancel("Bestätigen", 
+                                f"Sind Sie sicher, dass Sie diese Lieferung und alle zukünftigen Lieferungen für {existing_order.customer.name} am gleichen Wochentag löschen möchten?\n\n"
+                                f"Es werden nur Bestellungen mit identischen Artikeln gelöscht."):
+                                return  # User cancelled the deletion
+                            
+                            today = datetime.now().date()
+                            
+                            # Get the items in this order to compare with other orders
+                            current_order_items = set()
+                            for order_item in existing_order.order_items:
+                                current_order_items.add(order_item.item.id)
+                            
+                            # Get weekday of the current order
+                            current_weekday = existing_order.delivery_date.weekday()
+                            
+                            # First get all future orders for the same customer on same weekday
+                            future_orders_query = Order.select().where(
+                                (Order.customer == existing_order.customer) &
+                                (Order.delivery_date >= today)
+                            )
+                            
+                            # Filter for same weekday and same items
+                            doomed = []
+                            
+                            for order in future_orders_query:
+                                # Check if same weekday
+                                if order.delivery_date.weekday() != current_weekday:
+                                    continue
                                     
-                                    # Delete the matching orders
-                                    deleted_count = 0
-                                    for future_order in matching_orders:
-                                        future_order.delete_instance(recursive=True)
-                                        deleted_count += 1
+                                # Check if has the same items
+                                order_items = set()
+                                for order_item in order.order_items:
+                                    order_items.add(order_item.item.id)
                                     
-                                    messagebox.showinfo("Erfolg", f"{deleted_count} Bestellungen erfolgreich gelöscht!")
-                                else:
-                                    return  # User cancelled the deletion
+                                # Only include if items match exactly (same count and same IDs)
+                                if order_items == current_order_items:
+                                    doomed.append(order)
+                            
+                            description = f"Löschung von {len(doomed)} Bestellungen"
+                            message = f"{len(doomed)} Bestellungen erfolgreich gelöscht!"
                     else:
                         # Not a subscription order, simple confirmation
-                        if messagebox.askyesno("Bestätigen", "Diese Bestellung löschen?"):
-                            # Store the order data before deletion
-                            order_data = self.serialize_order(existing_order)
-                            self.record_action(
-                                ACTION_DELETE_ORDER,
-                                order_data,
-                                None,
-                                "Löschung einer Bestellung"
-                            )
-                            
-                            existing_order.delete_instance(recursive=True)
-                            messagebox.showinfo("Erfolg", "Bestellung erfolgreich gelöscht!")
+                        if not messagebox.askyesno("Bestätigen", "Diese Bestellung löschen?"):
+                            return
+                        doomed = [existing_order]
+                        description = "Löschung einer Bestellung"
+                        message = "Bestellung erfolgreich gelöscht!"
+                    
+                    # Taken before the rows are gone
+                    changed = OrderChanged(order_dates(*doomed), frozenset(order.id for order in doomed))
+                    # One transaction and one undo step for all deletions
+                    with undo_log.step(description):
+                        for order in doomed:
+                            order.delete_instance(recursive=True)
+                    messagebox.showinfo("Erfolg", message)
+                    # Refreshes the weeks, the customer list, the analytics and the undo button
+                    bus.publish(changed)
                     
                     row_frame.destroy()
                     order_rows.remove(order_row_dict)
@@ -1179,10 +631,10 @@ class ProductionApp(tk.Tk):
                     except ValueError:
                         return False, f"Ungültige Menge für Artikel {item_name}. Bitte geben Sie eine Zahl ein."
                 
-                with db.atomic():  # Use transaction to ensure all changes are saved or none
-                    # Track edited and new orders for the undo system
-                    edited_orders = []
-                    
+                # One transaction and one undo step for all changes. Invalid rows raise
+                # ValueError, which rolls back the rows written so far; the dialogs are
+                # shown after the transaction ended
+                with undo_log.step("Änderung von Bestellungen"):
                     # Track if subscription type changed for any order
                     subscription_type_changed = False
                     subscription_type = None
@@ -1198,14 +650,17 @@ class ProductionApp(tk.Tk):
                         customer = reference_order.customer
                         halbe_channel = reference_order.halbe_channel
                         
+                        # Items are queued and written in bulk once all rows are validated
+                        writer = SubscriptionWriter()
+                        rewritten_order_ids = []
+                        
                         # Loop through each order row to update/create orders and their items.
                         for row in order_rows:
                             delivery_date_str = row['delivery_entry'].get()
                             try:
                                 delivery_date = datetime.strptime(delivery_date_str, "%d.%m.%Y").date()
                             except ValueError:
-                                messagebox.showerror("Fehler", f"Ungültiges Datumsformat: {delivery_date_str}. Verwenden Sie dd.mm.yyyy.")
-                                return
+                                raise ValueError(f"Ungültiges Datumsformat: {delivery_date_str}. Verwenden Sie dd.mm.yyyy.")
 
                             existing_order = row['existing_order']
                             
@@ -1219,22 +674,16 @@ class ProductionApp(tk.Tk):
                                 valid, result = validate_amount(amount_str, item_name)
                                 
                                 if not valid:
-                                    messagebox.showerror("Fehler", result)
-                                    return
+                                    raise ValueError(result)
                                 
                                 amount = result  # This is the validated float value
                                 
                                 if item_name not in self.items:
-                                    messagebox.showerror("Fehler", f"Ungültiger Artikel: {item_name}")
-                                    return
+                                    raise ValueError(f"Ungültiger Artikel: {item_name}")
                                 
                                 order_items_data.append((item_name, amount))
                             
                             if existing_order:
-                                # Store the original order state for undo
-                                original_order_data = self.serialize_order(existing_order)
-                                edited_orders.append(original_order_data)
-                                
                                 # Update existing order
                                 existing_order.delivery_date = delivery_date
                                 existing_order.from_date = overall_from
@@ -1247,17 +696,10 @@ class ProductionApp(tk.Tk):
                                 # Save changes to the order
                                 existing_order.save()
                                 
-                                # Delete existing order items for this order
-                                for oi in existing_order.order_items:
-                                    oi.delete_instance()
-                                
-                                # Create new order items
-                                for item_name, amount in order_items_data:
-                                    OrderItem.create(
-                                        order=existing_order,
-                                        item=self.items[item_name],
-                                        amount=amount
-                                    )
+                                # Replace the order items of this order
+                                rewritten_order_ids.append(existing_order.id)
+                                writer.add_items(existing_order, [(self.items[item_name], amount)
+                                                                  for item_name, amount in order_items_data])
                                 
                                 # Save the subscription type from the first order
                                 if subscription_type is None:
@@ -1268,33 +710,26 @@ class ProductionApp(tk.Tk):
                                     if subscription_type is None:
                                         subscription_type = subscription_orders[0].subscription_type
                                 else:
-                                    messagebox.showerror("Fehler", "Kunde für neue Bestellung kann nicht bestimmt werden.")
-                                    return
+                                    raise ValueError("Kunde für neue Bestellung kann nicht bestimmt werden.")
                                 
                                 # Calculate production date based on max days
                                 max_days = max(self.items[item_name].total_days for item_name, _ in order_items_data)
                                 production_date = delivery_date - timedelta(days=max_days)
                                 
-                                # Create new order - make sure to use a unique order_id
-                                new_order = Order.create(
-                                    customer=customer,
-                                    delivery_date=delivery_date,
+                                # Queue the new order, the writer gives it a unique order_id
+                                writer.add_order(
+                                    customer, delivery_date,
+                                    [(self.items[item_name], amount) for item_name, amount in order_items_data],
                                     production_date=production_date,
                                     from_date=overall_from,
                                     to_date=overall_to,
                                     subscription_type=subscription_type,
                                     halbe_channel=halbe_channel,
-                                    order_id=uuid.uuid4(),
                                     is_future=True
                                 )
-                                
-                                # Create order items
-                                for item_name, amount in order_items_data:
-                                    OrderItem.create(
-                                        order=new_order,
-                                        item=self.items[item_name],
-                                        amount=amount
-                                    )
+                        
+                        OrderItem.delete().where(OrderItem.order.in_(rewritten_order_ids)).execute()
+                        writer.write()
                         
                         # If subscription type changed, we need to regenerate all future orders
                         # Delete all future orders excluding those we just edited
@@ -1310,9 +745,7 @@ class ProductionApp(tk.Tk):
                                 ~(Order.id << edited_order_ids)
                             )
                             
-                            # Save data for undo
                             for order_to_delete in future_orders_to_delete:
-                                edited_orders.append(self.serialize_order(order_to_delete))
                                 order_to_delete.delete_instance(recursive=True)
                             
                             # Find the earliest existing order to use as a template for regeneration
@@ -1327,48 +760,28 @@ class ProductionApp(tk.Tk):
                                 base_order.subscription_type = subscription_type
                                 base_order.save()
                                 
-                                # Generate new future orders with the updated subscription type
-                                future_orders = generate_subscription_orders(base_order)
-                                
-                                # Get all items from the base order
-                                base_items = list(base_order.order_items)
-                                
-                                # Create the new future orders with the same items
-                                for future_order_data in future_orders:
-                                    # Check if this date already exists in edited orders
-                                    delivery_date = future_order_data['delivery_date']
-                                    if not Order.select().where(
+                                # Dates that already exist in the edited orders are kept
+                                existing_dates = {
+                                    row[0] for row in Order.select(Order.delivery_date).where(
                                         (Order.from_date == overall_from) &
                                         (Order.to_date == overall_to) &
-                                        (Order.customer == customer) &
-                                        (Order.delivery_date == delivery_date)
-                                    ).exists():
-                                        future_order = Order.create(
-                                            **future_order_data,
-                                            order_id=uuid.uuid4()
-                                        )
-                                        
-                                        # Copy items from base order
-                                        for item_data in base_items:
-                                            OrderItem.create(
-                                                order=future_order,
-                                                item=item_data.item,
-                                                amount=item_data.amount
-                                            )
-                
-                # Record action for undo after successful save
-                self.record_action(
-                    ACTION_EDIT_ORDER,
-                    {'orders': original_orders_data},
-                    {'orders': edited_orders},  # Add the edited orders data as new_data
-                    "Änderung von Bestellungen"
-                )
+                                        (Order.customer == customer)
+                                    ).tuples()
+                                }
+                                
+                                # Generate new future orders with the updated subscription type
+                                # and the same items as the base order
+                                base_items = [(oi.item, oi.amount) for oi in base_order.order_items]
+                                writer.add_subscription_orders(base_order, base_items, skip_dates=existing_dates)
+                                writer.write()
                 
                 messagebox.showinfo("Erfolg", "Bestellungen erfolgreich aktualisiert!")
                 edit_window.destroy()
                 self.on_customer_select(None)  # Refresh orders list
-                self.refresh_tables()  # Refresh all views
+                bus.publish(OrderChanged())
                 
+            except ValueError as e:
+                messagebox.showerror("Fehler", str(e))
             except Exception as e:
                 messagebox.showerror("Fehler", f"Ein Fehler ist aufgetreten: {str(e)}")
         # Save button
@@ -1383,6 +796,21 @@ class ProductionApp(tk.Tk):
         canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))  # Linux
         canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))  # Linux
             
+    def edit_subscription(self, subscription_id):
+        """Open the delivery editor on the next delivery of a subscription rule"""
+        subscription = Subscription.get_or_none(Subscription.id == subscription_id)
+        if subscription is None:
+            return
+        
+        today = datetime.now().date()
+        upcoming = (subscription_dates(subscription, today, subscription.to_date) or
+                    subscription_dates(subscription, subscription.from_date, subscription.to_date))
+        if not upcoming:
+            messagebox.showinfo("Abonnement", "Dieses Abonnement hat keine Lieferungen.")
+            return
+        self.build_tab(self.tab2)
+        self.delivery_view.open_occurrence_editor(subscription.id, upcoming[0])
+    
     def create_order_tab(self):
         # Customer Frame
         customer_frame = ttk.LabelFrame(self.tab1, text="Kundeninformationen", padding="10")
@@ -1535,6 +963,15 @@ class ProductionApp(tk.Tk):
         metrics_notebook = ttk.Notebook(customer_frame)
         metrics_notebook.pack(fill='both', expand=True, padx=5, pady=5, before=summary_frame)
         
+        # Year selector for the item metrics
+        year_frame = ttk.Frame(customer_frame)
+        year_frame.pack(fill='x', padx=5, before=metrics_notebook)
+        ttk.Label(year_frame, text="Jahr:").pack(side='left', padx=5)
+        self.metrics_year_combo = ttk.Combobox(year_frame, values=["Alle Jahre"], state='readonly', width=12)
+        self.metrics_year_combo.set("Alle Jahre")
+        self.metrics_year_combo.pack(side='left', padx=5)
+        self.metrics_year_combo.bind('<<ComboboxSelected>>', lambda e: self.update_item_metrics())
+        
         # Tab for top ordered items
         top_items_frame = ttk.Frame(metrics_notebook)
         least_items_frame = ttk.Frame(metrics_notebook)
@@ -1617,9 +1054,14 @@ class ProductionApp(tk.Tk):
         ttk.Button(button_frame, text="Bestellung bearbeiten", command=self.edit_order).pack(side='left', padx=5)
         
         # Refresh button
-        ttk.Button(button_frame, text="Daten aktualisieren", command=self.load_customers).pack(side='right', padx=5)
+        ttk.Button(button_frame, text="Daten aktualisieren", command=self.refresh_orders_tab).pack(side='right', padx=5)
         
         self.load_customers()
+        self.update_item_metrics()
+        # customer_stats is current after every write; subscription deliveries are counted on each read
+        bus.subscribe(self.load_customers, OrderChanged, ItemChanged, CustomerChanged)
+        # The analytics re-read only the changed years, after they were invalidated on the same events
+        bus.subscribe(self.update_item_metrics, OrderChanged, ItemChanged)
 
     def set_date_entry(self, date_frame, date):
         """Set date in a date entry frame"""
@@ -1742,62 +1184,39 @@ class ProductionApp(tk.Tk):
                 if use_sunday is False:  # User clicked No, move to Saturday
                     production_date = production_date - timedelta(days=1)
             
-            created_orders = []
+            order_items = [(item_data['item'], item_data['amount']) for item_data in self.order_items]
             
-            with db.atomic():
+            if self.sub_var.get() > 0:
+                # Subscriptions are stored as one rule, the views expand the deliveries
+                with undo_log.step("Erstellung eines Abonnements"):
+                    subscription = create_subscription(
+                        customer,
+                        self.sub_var.get(),
+                        delivery_date,
+                        self.get_date_from_entry(self.from_date),
+                        self.get_date_from_entry(self.to_date),
+                        order_items,
+                        halbe_channel=self.halbe_var.get()
+                    )
+                    # Keep a production date moved to Saturday for the first delivery
+                    if production_date != delivery_date - timedelta(days=max_days):
+                        override_occurrence(subscription, delivery_date, production_date=production_date)
+                changed = OrderChanged()
+            else:
                 # Generate a unique order_id
                 order_id = uuid.uuid4()
-                
-                # Create order
-                order = Order.create(
-                    customer=customer,
-                    delivery_date=delivery_date,
-                    production_date=production_date,
-                    from_date=self.get_date_from_entry(self.from_date) if self.sub_var.get() else None,
-                    to_date=self.get_date_from_entry(self.to_date) if self.sub_var.get() else None,
-                    subscription_type=self.sub_var.get(),
-                    halbe_channel=self.halbe_var.get(),
-                    order_id=order_id,
-                    is_future=False
-                )
-                created_orders.append(order)
-                
-                # Create order items
-                for item_data in self.order_items:
-                    OrderItem.create(
-                        order=order,
-                        item=item_data['item'],
-                        amount=item_data['amount']
-                    )
-                
-                # Generate subscription orders if applicable
-                if self.sub_var.get() > 0:
-                    future_orders = generate_subscription_orders(order)
-                    for future_order_data in future_orders:
-                        future_order = Order.create(
-                            **future_order_data,
-                            order_id=uuid.uuid4()
-                        )
-                        created_orders.append(future_order)
-                        # Copy items to future order
-                        for item_data in self.order_items:
-                            OrderItem.create(
-                                order=future_order,
-                                item=item_data['item'],
-                                amount=item_data['amount']
-                            )
-            
-            # Record action for undo
-            self.record_action(
-                ACTION_CREATE_ORDER,
-                None,  # No old data for creation
-                {'order_id': order_id, 'count': len(created_orders)},
-                f"Erstellung von {len(created_orders)} Bestellungen"
-            )
+                writer = SubscriptionWriter()
+                writer.add_order(customer, delivery_date, order_items,
+                                 production_date=production_date,
+                                 halbe_channel=self.halbe_var.get(),
+                                 order_id=order_id)
+                with undo_log.step("Erstellung einer Bestellung"):
+                    writer.write()
+                changed = OrderChanged(frozenset({delivery_date, production_date}))
             
             messagebox.showinfo("Erfolg", "Bestellung erfolgreich gespeichert!")
             self.clear_form()
-            self.refresh_tables()
+            bus.publish(changed)
             
         except Exception as e:
             messagebox.showerror("Fehler", str(e))
@@ -1828,20 +1247,8 @@ class ProductionApp(tk.Tk):
         
         # Pass self (the ProductionApp instance) to WeeklyDeliveryView
         self.delivery_view = WeeklyDeliveryView(self.tab2, self, self.db)
-        
-        # Set up callbacks to enable undo
-        def delivery_on_edit_order(order_data, new_data):
-            # This will be called when an order is edited in the delivery tab
-            print("Order edited in delivery tab, recording for undo")
-            self.record_action(
-                ACTION_EDIT_ORDER,
-                order_data,  # Original order data
-                new_data,    # New order data
-                "Änderung von Bestellung in Lieferungsplan"
-            )
-        
-        # Attach the callback
-        self.delivery_view.set_edit_callback(delivery_on_edit_order)
+        # Production and transfer view load their week on construction
+        self.delivery_view.refresh()
     
     def create_production_tab(self):
         # Create print button frame
@@ -1915,40 +1322,12 @@ class ProductionApp(tk.Tk):
         except Exception as e:
             messagebox.showwarning("Warnung", f"PDF wurde erstellt, konnte aber nicht automatisch geöffnet werden: {filepath}")
 
-    def refresh_all_tables(self):
-        """Comprehensive refresh of all UI components with delays between refreshes"""
-        # Disable the refresh button temporarily
-        if hasattr(self, 'refresh_button'):
-            self.refresh_button.config(state='disabled')
-            
-        # Refresh views with small delays between each to reduce UI load
-        if hasattr(self, 'delivery_view'):
-            self.delivery_view.refresh()
-            
-        # Schedule other views to refresh with delays
-        def refresh_production():
-            if hasattr(self, 'production_view'):
-                self.production_view.refresh()
-                
-        def refresh_transfer():
-            if hasattr(self, 'transfer_view'):
-                self.transfer_view.refresh()
-                
-        def refresh_other_tabs():
-            if hasattr(self, 'customer_view'):
-                self.customer_view.refresh_customer_list()
-            if hasattr(self, 'item_view'):
-                self.item_view.refresh_item_list()
-            # Re-enable the refresh button
-            if hasattr(self, 'refresh_button'):
-                self.refresh_button.config(state='normal')
-        
-        # Schedule refreshes with delays between each
-        self.after(100, refresh_production)
-        self.after(200, refresh_transfer)
-        self.after(300, refresh_other_tabs)
-
 if __name__ == "__main__":
-    check_for_updates()
+    profile = configure_database()  # KLEINBLATT_DB_PROFILE=safe|fast
+    create_tables()  # Upgrades an existing production.db in place
+    with db:
+        pragmas = ', '.join(f"{name}={value}" for name, value in describe_database().items())
+    print(f"Database profile: {profile} ({pragmas})")
     app = ProductionApp()
+    app.start_update_check()
     app.mainloop()
\ No newline at end of file
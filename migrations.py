@@ -0,0 +1,167 @@
+from datetime import datetime
+from peewee import Model, IntegerField, CharField, DateTimeField, DateField, ForeignKeyField, fn
+from playhouse.migrate import SqliteMigrator, migrate as run_operations
+from models import (db, ProductionRollup, Subscription, SubscriptionItem, ChangeJournal, CustomerStats,
+                    UndoStep, UndoEntry, UndoState, ImportedRow, create_triggers, drop_triggers, trigger_sql)
+import rollups
+import changes
+import customer_stats
+import undo
+
+class SchemaVersion(Model):
+    """One row per applied migration step"""
+    version = IntegerField(primary_key=True)
+    description = CharField()
+    applied_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        database = db
+        table_name = 'schema_version'
+
+def add_order_date_indexes(database):
+    """Index the date columns used by the weekly schedule queries"""
+    database.execute_sql('CREATE INDEX IF NOT EXISTS "order_delivery_date" ON "order" ("delivery_date")')
+    database.execute_sql('CREATE INDEX IF NOT EXISTS "order_production_date" ON "order" ("production_date")')
+    database.execute_sql(
+        'CREATE INDEX IF NOT EXISTS "order_customer_id_from_date_to_date" '
+        'ON "order" ("customer_id", "from_date", "to_date")'
+    )
+
+def add_production_rollup(database):
+    """Create the production_rollup table and fill it from existing orders"""
+    with database.bind_ctx([ProductionRollup]):
+        database.create_tables([ProductionRollup], safe=True)
+    rollups.rebuild_rollups(database)
+
+def add_subscription_rules(database):
+    """Create the subscription rule tables and link override orders to their rule"""
+    with database.bind_ctx([Subscription, SubscriptionItem]):
+        database.create_tables([Subscription, SubscriptionItem], safe=True)
+
+    # Databases created from the current models already have the columns
+    columns = {column.name for column in database.get_columns('order')}
+    migrator = SqliteMigrator(database)
+    operations = []
+    if 'subscription_id' not in columns:
+        # create_tables() indexes the missing column as a string literal, replace that index
+        database.execute_sql('DROP INDEX IF EXISTS "order_subscription_id"')
+        operations.append(migrator.add_column(
+            'order', 'subscription_id',
+            ForeignKeyField(Subscription, field=Subscription.id, null=True)))
+    if 'occurrence_date' not in columns:
+        operations.append(migrator.add_column('order', 'occurrence_date', DateField(null=True)))
+    run_operations(*operations)
+
+def add_change_journal(database):
+    """Create the change_journal table"""
+    with database.bind_ctx([ChangeJournal]):
+        database.create_tables([ChangeJournal], safe=True)
+
+def add_customer_stats(database):
+    """Create the customer_stats table and fill it from existing orders"""
+    with database.bind_ctx([CustomerStats]):
+        database.create_tables([CustomerStats], safe=True)
+    customer_stats.rebuild_customer_stats(database)
+
+def add_undo_log(database):
+    """Create the persistent undo log tables"""
+    with database.bind_ctx([UndoStep, UndoEntry, UndoState]):
+        database.create_tables([UndoStep, UndoEntry, UndoState], safe=True)
+
+def add_imported_rows(database):
+    """Create the table tracking the rows applied by the order import"""
+    with database.bind_ctx([ImportedRow]):
+        database.create_tables([ImportedRow], safe=True)
+
+def customer_stats_without_subscriptions(database):
+    """Recount customer_stats without the subscription overrides, they are counted with their rules now"""
+    customer_stats.rebuild_customer_stats(database)
+
+def record_imported_rows_for_undo(database):
+    """Record imported_row in the undo log, so undo restores its links to orders and rules"""
+    # Only the undo triggers of imported_row change, sync_derived_triggers() installs them
+
+# Ordered list of (version, description, step). Steps receive the database and
+# must never be edited once released - add a new step instead.
+#
+# Steps create tables and recompute rows, they install no triggers: the trigger
+# SQL of the derived tables lives only in rollups.py, changes.py,
+# customer_stats.py and undo.py, and migrate() ends with sync_derived_triggers()
+# on every start. Changing a trigger therefore needs no step, unless the rows
+# it maintains must be recomputed (see customer_stats_without_subscriptions).
+MIGRATIONS = [
+    (1, "Indexes on order delivery/production date and subscription range", add_order_date_indexes),
+    (2, "Production rollup table maintained by triggers", add_production_rollup),
+    (3, "Subscription rules with per-occurrence override orders", add_subscription_rules),
+    (4, "Per-date change journal maintained by triggers", add_change_journal),
+    (5, "Customer statistics table maintained by triggers", add_customer_stats),
+    (6, "Persistent undo log recorded by triggers", add_undo_log),
+    (7, "Natural keys of imported order rows", add_imported_rows),
+    (8, "Customer statistics without subscription overrides", customer_stats_without_subscriptions),
+    (9, "Undo log records imported rows", record_imported_rows_for_undo),
+]
+
+# Name prefixes of the triggers owned by sync_derived_triggers()
+DERIVED_TRIGGER_PREFIXES = ('production_rollup_', 'change_journal_', 'customer_stats_', 'undo_')
+
+def derived_triggers():
+    """Name -> (event, body) of the current triggers of all derived tables"""
+    return {**rollups.TRIGGERS, **changes.TRIGGERS, **customer_stats.TRIGGERS, **undo.triggers()}
+
+def sync_derived_triggers(database=db):
+    """
+    Make the derived triggers of the database those of the current code.
+
+    Triggers whose SQL differs are recreated, missing ones created and ones no
+    longer defined dropped; matching ones are left alone.
+
+    Returns:
+    - Sorted names of the triggers that were written or dropped
+    """
+    wanted = derived_triggers()
+    installed = dict(database.execute_sql("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+    stale = [name for name in installed if name.startswith(DERIVED_TRIGGER_PREFIXES) and name not in wanted]
+    changed = {name: trigger for name, trigger in wanted.items() if installed.get(name) != trigger_sql(name, *trigger)}
+    drop_triggers(stale, database)
+    create_triggers(changed, database)
+    return sorted([*stale, *changed])
+
+def get_schema_version(database=db):
+    """Return the highest applied migration version (0 for an unversioned database)"""
+    with database.bind_ctx([SchemaVersion]):
+        if not SchemaVersion.table_exists():
+            return 0
+        return SchemaVersion.select(fn.MAX(SchemaVersion.version)).scalar() or 0
+
+def migrate(database=db):
+    """
+    Bring the database schema up to date in place.
+
+    Every pending step runs in its own transaction together with the insert of
+    its schema_version row, so an interrupted upgrade resumes at the failed step.
+    Afterwards the derived triggers are synced with the code, see
+    sync_derived_triggers().
+
+    Returns:
+    - List of versions that were applied
+    """
+    applied = []
+    with database.bind_ctx([SchemaVersion]):
+        database.create_tables([SchemaVersion], safe=True)
+        current = get_schema_version(database)
+
+        for version, description, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current:
+                continue
+            with database.atomic():
+                step(database)
+                SchemaVersion.create(version=version, description=description)
+            print(f"Applied migration {version}: {description}")
+            applied.append(version)
+
+    with database.atomic():
+        synced = sync_derived_triggers(database)
+    if synced:
+        print(f"Installed {len(synced)} derived triggers")
+
+    return applied
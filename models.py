@@ -1,11 +1,156 @@
 from peewee import (
     SqliteDatabase, Model, CharField, DateTimeField, 
     FloatField, IntegerField, ForeignKeyField, 
-    DateField, BooleanField, UUIDField
+    DateField, BooleanField, UUIDField, CompositeKey, TextField
 )
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from urllib.request import pathname2url
+import os
+import sqlite3
+import threading
 
-db = SqliteDatabase('production.db')
+# SQLite pragma profiles. cache_size is negative KiB, mmap_size bytes, temp_store 2 = memory.
+PRAGMA_PROFILES = {
+    # WAL with every commit synced to disk, no memory-mapped I/O
+    'safe': {
+        'journal_mode': 'wal',
+        'synchronous': 2,  # FULL
+        'cache_size': -16384,
+        'mmap_size': 0,
+        'temp_store': 2,
+        'foreign_keys': 1,
+    },
+    # WAL commits are only synced at checkpoints; a power cut may lose the last
+    # transactions but never corrupts the database
+    'fast': {
+        'journal_mode': 'wal',
+        'synchronous': 1,  # NORMAL
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 2,
+        'foreign_keys': 1,
+    },
+    # Reporting and printing only: writes are rejected
+    'readonly-report': {
+        'journal_mode': 'wal',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 2,
+        'foreign_keys': 1,
+        'query_only': 1,
+    },
+}
+DEFAULT_PROFILE = 'safe'
+PROFILE_ENV = 'KLEINBLATT_DB_PROFILE'
+# The main connection migrates and saves; the read-only profile is only for db.reporting()
+MAIN_PROFILES = ('safe', 'fast')
+REPORTING_PROFILE = 'readonly-report'
+
+def pragma_profile(name=None):
+    """Profile of the main connection: the given one, else $KLEINBLATT_DB_PROFILE, else DEFAULT_PROFILE"""
+    name = name or os.environ.get(PROFILE_ENV) or DEFAULT_PROFILE
+    if name == REPORTING_PROFILE:
+        raise ValueError(f"Database profile '{name}' is only used by the read-only reporting connections, "
+                         f"the main connection must write; expected one of: {', '.join(MAIN_PROFILES)}")
+    if name not in MAIN_PROFILES:
+        raise ValueError(f"Unknown database profile '{name}', expected one of: {', '.join(MAIN_PROFILES)}")
+    return name
+
+class KleinblattDatabase(SqliteDatabase):
+    """
+    SqliteDatabase with a read-only reporting connection per thread.
+    
+    Inside `with db.reporting():` every query of the current thread - including
+    the model queries in database.py - runs on a separate connection opened with
+    a mode=ro URI and the readonly-report pragmas. Under WAL such a reader never
+    blocks a save on the editing connection, and a save never blocks it.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reporting = threading.local()
+    
+    @property
+    def in_memory(self):
+        """True for :memory: databases, which only exist on the connection that created them"""
+        return self.database in (':memory:', '')
+    
+    def _reporting_connection(self):
+        """The calling thread's read-only connection, opened on first use"""
+        path = os.path.abspath(self.database)
+        conn = getattr(self._reporting, 'conn', None)
+        if conn is not None and self._reporting.path == path:
+            return conn
+        self.close_reporting()
+        conn = sqlite3.connect(f'file:{pathname2url(path)}?mode=ro', uri=True,
+                               timeout=self._timeout, isolation_level=None)
+        for name, value in PRAGMA_PROFILES[REPORTING_PROFILE].items():
+            # The journal mode is a property of the file, set by the editing connection
+            if name != 'journal_mode':
+                conn.execute(f'PRAGMA {name} = {value}')
+        self._reporting.conn, self._reporting.path = conn, path
+        return conn
+    
+    @contextmanager
+    def reporting(self):
+        """
+        Run the enclosed queries as reporting queries on the read-only connection.
+        
+        In-memory databases can't be opened twice and an open transaction must
+        read its own writes, so both keep using the editing connection.
+        """
+        if self.in_memory or self.in_transaction():
+            yield self
+            return
+        state = self._state
+        saved = (state.closed, state.conn, state.ctx, state.transactions)
+        state.set_connection(self._reporting_connection())
+        try:
+            yield self
+        finally:
+            state.closed, state.conn, state.ctx, state.transactions = saved
+    
+    def close_reporting(self):
+        """Close the calling thread's reporting connection, if any"""
+        conn = getattr(self._reporting, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._reporting.conn = None
+
+db = KleinblattDatabase('production.db', pragmas=PRAGMA_PROFILES[DEFAULT_PROFILE])
+
+def configure_database(profile=None, database=db, path=None):
+    """
+    Apply a pragma profile to the database; it takes effect on the next connection.
+    
+    path switches to another database file, by default the current one is kept.
+    
+    Returns:
+    - The name of the applied profile
+    """
+    name = pragma_profile(profile)
+    database.init(path or database.database, pragmas=PRAGMA_PROFILES[name])
+    return name
+
+def describe_database(database=db):
+    """Effective values of the profile pragmas on the open connection, for the startup report"""
+    names = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'foreign_keys', 'query_only']
+    return {name: database.execute_sql(f'PRAGMA {name}').fetchone()[0] for name in names}
+
+def trigger_sql(name, event, body):
+    """CREATE TRIGGER statement of a trigger, as sqlite_master stores it"""
+    return f'CREATE TRIGGER "{name}" {event} BEGIN {body} END'
+
+def create_triggers(triggers, database=db):
+    """(Re)create triggers given as name -> (event, body), replacing older versions of them"""
+    for name, (event, body) in triggers.items():
+        database.execute_sql(f'DROP TRIGGER IF EXISTS "{name}"')
+        database.execute_sql(trigger_sql(name, event, body))
+
+def drop_triggers(names, database=db):
+    """Drop the named triggers, missing ones are ignored"""
+    for name in names:
+        database.execute_sql(f'DROP TRIGGER IF EXISTS "{name}"')
 
 class BaseModel(Model):
     class Meta:
@@ -28,6 +173,25 @@ class Item(BaseModel):
     def total_days(self):
         return self.soaking_days + self.germination_days + self.growth_days
 
+class Subscription(BaseModel):
+    """
+    Recurring delivery rule. Occurrences fall on anchor_date plus a multiple of
+    the interval within [from_date, to_date] and are expanded by the schedule
+    queries in database.py instead of being stored as orders.
+    """
+    customer = ForeignKeyField(Customer, backref='subscriptions')
+    subscription_type = IntegerField()  # 1=weekly, 2=biweekly, 3=every 3 weeks, 4=every 4 weeks
+    anchor_date = DateField()
+    from_date = DateField()
+    to_date = DateField()
+    halbe_channel = BooleanField(default=False)
+    created_at = DateTimeField(default=datetime.now)
+
+class SubscriptionItem(BaseModel):
+    subscription = ForeignKeyField(Subscription, backref='subscription_items')
+    item = ForeignKeyField(Item)
+    amount = FloatField()
+
 class Order(BaseModel):
     customer = ForeignKeyField(Customer, backref='orders')
     delivery_date = DateField()
@@ -39,6 +203,9 @@ class Order(BaseModel):
     order_id = UUIDField(unique=True)
     is_future = BooleanField(default=False)
     created_at = DateTimeField(default=datetime.now)
+    # Set when this order overrides one occurrence of a subscription rule
+    subscription = ForeignKeyField(Subscription, backref='overrides', null=True)
+    occurrence_date = DateField(null=True)
     
     @property
     def total_price(self):
@@ -61,6 +228,118 @@ class OrderItem(BaseModel):
     def total_price(self):
         return self.amount * self.item.price
 
+class ProductionRollup(BaseModel):
+    """Total ordered amount per production date and item, maintained by triggers (see rollups.py)"""
+    production_date = DateField()
+    item = ForeignKeyField(Item)
+    total_amount = FloatField()
+
+    class Meta:
+        table_name = 'production_rollup'
+        indexes = (
+            (('production_date', 'item'), True),
+        )
+
+class ChangeJournal(BaseModel):
+    """Version per changed delivery/production/transfer date, maintained by triggers (see changes.py)"""
+    kind = CharField()  # delivery, production, transfer or all
+    day = DateField()
+    version = IntegerField(default=1)
+
+    class Meta:
+        table_name = 'change_journal'
+        primary_key = CompositeKey('kind', 'day')
+
+class CustomerStats(BaseModel):
+    """Orders, revenue and last delivery per customer, maintained by triggers (see customer_stats.py)"""
+    customer = ForeignKeyField(Customer, primary_key=True, on_delete='CASCADE')
+    order_count = IntegerField(default=0)
+    revenue = FloatField(default=0.0)
+    last_delivery = DateField(null=True)
+
+    class Meta:
+        table_name = 'customer_stats'
+        indexes = (
+            # The Bestellungen tab lists customers by order count
+            (('order_count',), False),
+        )
+
+class UndoStep(BaseModel):
+    """One undoable user action, its row images are in undo_log (see undo.py)"""
+    description = CharField()
+    created_at = DateTimeField(default=datetime.now)
+    size = IntegerField(default=0)  # Bytes of the stored images, for the undo log cap
+
+    class Meta:
+        table_name = 'undo_step'
+
+class UndoEntry(BaseModel):
+    """Before-image of one written row, captured by triggers"""
+    step = ForeignKeyField(UndoStep, backref='entries', on_delete='CASCADE')
+    table_name = CharField()
+    pk = IntegerField()
+    op = CharField()  # I (inserted), U (updated) or D (deleted)
+    image = TextField(null=True)  # JSON of the old values: changed columns (U) or the whole row (D)
+
+    class Meta:
+        table_name = 'undo_log'
+
+class UndoState(BaseModel):
+    """Single row naming the step the undo triggers currently record into (NULL: none)"""
+    step = IntegerField(null=True)
+
+    class Meta:
+        table_name = 'undo_state'
+
+class ImportedRow(BaseModel):
+    """
+    Row of an order export applied by the import (see importer.py), under its
+    natural key. Points at the order or subscription rule holding the item;
+    both are NULL once that was deleted in the app.
+    """
+    key = CharField(unique=True)  # Kunde|Item|Lieferdatum|Woche_Wdh|Von|Bis as exported
+    customer = ForeignKeyField(Customer, on_delete='CASCADE')
+    item = ForeignKeyField(Item, on_delete='CASCADE')
+    delivery_date = DateField()
+    subscription_type = IntegerField(default=0)
+    from_date = DateField(null=True)
+    to_date = DateField(null=True)
+    amount = FloatField()
+    production_date = DateField(null=True)  # As given in the export
+    order = ForeignKeyField(Order, null=True, on_delete='SET NULL')
+    subscription = ForeignKeyField(Subscription, null=True, on_delete='SET NULL')
+
+    class Meta:
+        table_name = 'imported_row'
+        indexes = (
+            # Order lookup when later rows of the same order are imported
+            (('customer', 'delivery_date'), False),
+        )
+
+class ImportStage(BaseModel):
+    """Scratch table holding the export being imported, created and dropped by each import"""
+    key = CharField(unique=True)
+    order_key = CharField()  # Sorts the rows of an order together
+    line = IntegerField()
+    customer_name = CharField()
+    customer = IntegerField(null=True)  # NULL until create_customers for customers new in the export
+    item = IntegerField()
+    delivery_date = DateField()
+    production_date = DateField(null=True)
+    subscription_type = IntegerField(default=0)
+    from_date = DateField(null=True)
+    to_date = DateField(null=True)
+    amount = FloatField()
+
+    class Meta:
+        table_name = 'import_stage'
+        indexes = (
+            (('order_key', 'key'), False),
+        )
+
 def create_tables():
+    """Create missing tables and apply pending schema migrations"""
+    from migrations import migrate
     with db:
         db.create_tables([Customer, Item, Order, OrderItem])
+        migrate(db)
@@ -1,18 +1,173 @@
+import hashlib
+import json
 import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta, date
 from fpdf import FPDF
-from models import Order, OrderItem, Item, Customer
-from database import get_delivery_schedule, get_production_plan, get_transfer_schedule
-from peewee import *
-import tkinter as tk
-from tkinter import messagebox
+from types import SimpleNamespace
+from models import db
+from database import get_delivery_week, get_production_week, get_transfer_schedule, SCHEDULE_TYPES, fetch_schedule
 from collections import defaultdict
 
-class SchedulePrinter:
+# Part of the cache key of printed PDFs: bump it when the layout changes
+RENDERER_VERSION = 1
+
+class TextLayout:
+    """
+    Line counts of text wrapped like FPDF.multi_cell, measured with
+    get_string_width on the document being written. Results are memoized by
+    (text, width, font), customer item lists repeat across days and weeks.
+    """
     def __init__(self):
-        self.output_dir = "output"
-        if not os.path.exists(self.output_dir):
+        self.cache = {}
+
+    def line_count(self, pdf, text, width):
+        key = (text, width, pdf.font_family, pdf.font_style, pdf.font_size_pt)
+        count = self.cache.get(key)
+        if count is None:
+            count = self.cache[key] = self._count_lines(pdf, text, width)
+        return count
+
+    @staticmethod
+    def _count_lines(pdf, text, width):
+        # Same rules as multi_cell: break at the last space that fits, split
+        # words wider than a line between characters
+        wmax = width - 2 * pdf.c_margin
+        space = pdf.get_string_width(' ')
+        text = text.replace('\r', '')
+        if text.endswith('\n'):
+            text = text[:-1]
+        count = 0
+        for paragraph in text.split('\n'):
+            count += 1
+            line = None  # Width of the current line, None while empty
+            for word in paragraph.split(' '):
+                word_width = pdf.get_string_width(word)
+                if line is not None and line + space + word_width <= wmax:
+                    line += space + word_width
+                    continue
+                if line is not None:
+                    count += 1
+                line = 0
+                for char in word:
+                    char_width = pdf.get_string_width(char)
+                    if line + char_width > wmax and line > 0:
+                        count += 1
+                        line = 0
+                    line += char_width
+        return count
+
+def split_weeks(records):
+    """Group schedule records by the Monday of their date"""
+    weeks = defaultdict(list)
+    for record in records:
+        weeks[record['date'] - timedelta(days=record['date'].weekday())].append(record)
+    return weeks
+
+_worker_printer = None  # One printer per worker process, its text layout memo is reused across weeks
+
+def _render_task(schedule_type, monday, data, filepath):
+    """Worker of export_weeks: render one week and write it to filepath"""
+    global _worker_printer
+    if _worker_printer is None:
+        _worker_printer = SchedulePrinter(output_dir=None)
+    pdf = FPDF()
+    _worker_printer.render_week(pdf, schedule_type, monday, data)
+    pdf.output(filepath)
+    return filepath
+
+_FONT_REFERENCE = re.compile(r'BT /F(\d+) ')
+
+def _append_pages(target, source):
+    """
+    Append the pages of source to target.
+    
+    fpdf 1.7 cannot import pages, but pages that only use the core fonts are
+    plain content streams; they are copied with their font numbers mapped to
+    the fonts of target.
+    """
+    numbers = {}
+    for page in range(1, source.page + 1):
+        target.add_page('L' if page in source.orientation_changes else 'P')
+        if not numbers:
+            # Registered on the new page, whose content is replaced below
+            for fontkey, font in source.fonts.items():
+                family = fontkey.rstrip('BI')
+                target.set_font(family, fontkey[len(family):])
+                numbers[str(font['i'])] = str(target.fonts[fontkey]['i'])
+        target.pages[target.page] = _FONT_REFERENCE.sub(
+            lambda match: f'BT /F{numbers[match.group(1)]} ', source.pages[page])
+
+_STREAM = re.compile(rb'<<(/Filter /FlateDecode )?/Length (\d+)>>\nstream\n')
+_BASE_FONTS = {name: fontkey for fontkey, name in FPDF().core_fonts.items()}
+
+def _read_pages(filepath):
+    """
+    The pages of a PDF written by fpdf, as far as _append_pages reads them
+    from an FPDF (page, orientation_changes, fonts, pages).
+    
+    Only fpdf's own output with core fonts is understood: the objects are
+    found through the xref table and every page has one content stream.
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    xref = int(re.search(rb'startxref\n(\d+)', data).group(1))
+    header = re.compile(rb'xref\n0 (\d+)\n').match(data, xref)
+    offsets = {}
+    for number in range(int(header.group(1))):
+        entry = data[header.end() + 20 * number:header.end() + 20 * (number + 1)]  # 20 bytes per entry
+        if entry[17:18] == b'n':
+            offsets[number] = int(entry[:10])
+
+    def body(number):
+        return data.index(b' obj\n', offsets[number]) + 5
+
+    def text(number):
+        start = body(number)
+        return data[start:data.index(b'endobj', start)].decode('latin-1')
+
+    def stream(number):
+        match = _STREAM.match(data, body(number))
+        content = data[match.end():match.end() + int(match.group(2))]
+        return (zlib.decompress(content) if match.group(1) else content).decode('latin-1')
+
+    def size(dictionary):
+        width, height = re.search(r'/MediaBox \[0 0 ([\d.]+) ([\d.]+)\]', dictionary).groups()
+        return float(width), float(height)
+
+    root = text(1)
+    landscape = size(root)[0] > size(root)[1]
+    source = SimpleNamespace(page=0, orientation_changes=set(), fonts={}, pages={})
+    for kid in re.findall(r'(\d+) 0 R', re.search(r'/Kids \[([^\]]*)\]', root).group(1)):
+        page = text(int(kid))
+        source.page += 1
+        if '/MediaBox' in page:
+            landscape_page = size(page)[0] > size(page)[1]
+        else:
+            landscape_page = landscape
+        if landscape_page:
+            source.orientation_changes.add(source.page)
+        source.pages[source.page] = stream(int(re.search(r'/Contents (\d+) 0 R', page).group(1)))
+        if not source.fonts:
+            resources = text(int(re.search(r'/Resources (\d+) 0 R', page).group(1)))
+            for index, number in re.findall(r'/F(\d+) (\d+) 0 R', resources):
+                name = re.search(r'/BaseFont /(\S+)', text(int(number))).group(1)
+                source.fonts[_BASE_FONTS[name]] = {'i': int(index)}
+    return source
+
+class SchedulePrinter:
+    # Eviction of the output directory, see evict()
+    max_age = timedelta(days=90)
+    max_bytes = 200 * 1024 * 1024
+
+    def __init__(self, output_dir="output"):
+        self.output_dir = output_dir  # None for a printer that only renders, see _render_task
+        if output_dir is not None and not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
+        self.layout = TextLayout()
 
     def _create_header(self, pdf, title, week_date):
         pdf.set_font('Arial', 'B', 20)
@@ -122,25 +277,11 @@ class SchedulePrinter:
         pdf.ln()
         
         pdf.set_font('Arial', '', 10)
+        # Maximum line width for content (same as used in the actual cell)
+        max_width = col_widths[1] - 4  # Subtract margin
         for row in data:
-            # First, calculate how much height we need for the middle column
-            # Create a temporary PDF object to calculate text height
-            temp_pdf = FPDF()
-            temp_pdf.add_page()
-            temp_pdf.set_font('Arial', '', 10)
-            
-            # Set a reference position
-            start_y = temp_pdf.get_y()
-            
-            # Calculate maximum line width for content (same as we'll use in actual cell)
-            max_width = col_widths[1] - 4  # Subtract margin
-            
-            # Simulate writing text to calculate height
-            temp_pdf.multi_cell(max_width, 4, str(row[1]), 0, 'L')
-            
-            # Calculate how much height was used
-            end_y = temp_pdf.get_y()
-            needed_height = end_y - start_y
+            # Height the wrapped items list needs, 4 per line
+            needed_height = self.layout.line_count(pdf, str(row[1]), max_width) * 4
             
             # Set minimum cell height (6) or calculated height + padding
             cell_height = max(6, needed_height + 2)  # Add 2 for padding
@@ -164,42 +305,37 @@ class SchedulePrinter:
             # Restore position for next cell
             pdf.set_xy(x_pos + col_widths[1], y_pos)
             
-            # Handle Halbe Channel (third column)
-            pdf.cell(col_widths[2], cell_height, str(row[2]), 1, 0, 'C')
+            # Handle Halbe Channel (third column), the transfer tables have two columns
+            if len(row) > 2:
+                pdf.cell(col_widths[2], cell_height, str(row[2]), 1, 0, 'C')
             pdf.ln()
         pdf.ln(10)
 
     def format_delivery_data(self, deliveries):
         """
-        Format delivery schedule data from the database.get_delivery_schedule function
+        Format delivery records from the database.get_delivery_week function
         for PDF rendering
         """
         daily_data = {}
         
         for delivery in deliveries:
-            date_str = delivery.delivery_date.strftime("%d.%m.%Y")
+            date_str = delivery['date'].strftime("%d.%m.%Y")
             if date_str not in daily_data:
                 daily_data[date_str] = []
             
-            # Sort order items by name
-            sorted_items = sorted(delivery.order_items, key=lambda item: item.item.name.lower())
-            
-            # Create item text descriptions
+            # Create item text descriptions (items are already sorted by name)
             item_texts = []
-            for item in sorted_items:
+            for item_name, amount in delivery['items']:
                 # Format the amount: remove decimals if it's a whole number
-                amount_str = str(int(item.amount)) if item.amount == int(item.amount) else str(item.amount)
-                item_texts.append(f"{item.item.name}: {amount_str}")
+                amount_str = str(int(amount)) if amount == int(amount) else str(amount)
+                item_texts.append(f"{item_name}: {amount_str}")
             
-            # Add formatted data
+            # Add formatted data (records arrive sorted by customer within each day)
             daily_data[date_str].append([
-                delivery.customer.name,
+                delivery['customer'],
                 ", ".join(item_texts),
-                "Ja" if delivery.halbe_channel else "Nein"
+                "Ja" if delivery['halbe_channel'] else "Nein"
             ])
-            
-            # Sort customers alphabetically within each day
-            daily_data[date_str].sort(key=lambda x: x[0].lower())
         
         return {
             "headers": ["Kunde", "Items", "Halbe Channel"],
@@ -208,23 +344,24 @@ class SchedulePrinter:
 
     def format_production_data(self, production_data):
         """
-        Format production plan data from the database.get_production_plan function
+        Format production records from the database.get_production_week function
         for PDF rendering
         """
         daily_items = {}
         
         for prod in production_data:
-            date_str = prod.order.production_date.strftime("%d.%m.%Y")
+            date_str = prod['date'].strftime("%d.%m.%Y")
             if date_str not in daily_items:
                 daily_items[date_str] = {}
             
-            if prod.item.name not in daily_items[date_str]:
-                daily_items[date_str][prod.item.name] = {
+            if prod['item'] not in daily_items[date_str]:
+                daily_items[date_str][prod['item']] = {
                     'amount': 0,
-                    'half_channel': "Ja" if prod.order.halbe_channel else "Nein"
+                    # Amounts are summed over all orders, so there is no single halbe channel flag
+                    'half_channel': "Nein"
                 }
             
-            daily_items[date_str][prod.item.name]['amount'] += prod.total_amount
+            daily_items[date_str][prod['item']]['amount'] += prod['amount']
         
         return daily_items
 
@@ -247,52 +384,187 @@ class SchedulePrinter:
         
         return daily_transfers
 
-    def print_week_schedule(self, schedule_type, week_date=None):
-        if week_date is None:
-            week_date = date.today()
-
-        # Define the date range for the week
-        monday = week_date - timedelta(days=week_date.weekday())
-        sunday = monday + timedelta(days=6)
+    def format_week(self, schedule_type, records):
+        """Formatted data of one week for render_week, from the records of fetch_schedule"""
+        if schedule_type == "delivery":
+            return self.format_delivery_data(records)
+        if schedule_type == "production":
+            return self.format_production_data(records)
+        return self.format_transfer_data(records)
 
-        pdf = FPDF()
+    def render_week(self, pdf, schedule_type, week_date, data):
+        """
+        Add the schedule of one week to pdf.
+        
+        data is the output of format_week; rendering does not touch the
+        database, so it can run in a worker process (see export_weeks).
+        """
         pdf.add_page('L')  # Landscape orientation
 
         if schedule_type == "delivery":
             title = "Wöchentlicher Lieferplan"
-            # Get delivery data using the standard database function
-            deliveries = get_delivery_schedule(monday, sunday)
-            schedule_data = self.format_delivery_data(deliveries)
-            
             self._create_header(pdf, title, week_date)
-            for date_str, deliveries in schedule_data["daily_data"].items():
+            for date_str, deliveries in data["daily_data"].items():
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, f'Datum: {date_str}', 0, 1, 'L')
-                self._add_table(pdf, schedule_data["headers"], deliveries)
+                self._add_table(pdf, data["headers"], deliveries)
 
         elif schedule_type == "production":
             title = "Wöchentlicher Produktionsplan"
-            # Get production data using the standard database function
-            production_data = get_production_plan(monday, sunday)
-            daily_items = self.format_production_data(production_data)
-            
             self._create_header(pdf, title, week_date)
-            self._add_weekly_plan_table(pdf, daily_items, week_date)
+            self._add_weekly_plan_table(pdf, data, week_date)
 
         else:  # transfer
             title = "Wöchentlicher Transferplan"
-            # Get transfer data using the standard database function
-            transfer_data = get_transfer_schedule(monday, sunday)
-            daily_transfers = self.format_transfer_data(transfer_data)
-            
             self._create_header(pdf, title, week_date)
-            self._add_weekly_plan_table(pdf, daily_transfers, week_date)
+            self._add_weekly_plan_table(pdf, data, week_date)
+
+    @staticmethod
+    def cache_key(*parts):
+        """Content hash of formatted schedule data and the renderer version"""
+        payload = json.dumps([RENDERER_VERSION, *parts], default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def cached_path(self, prefix, monday, key):
+        """Path of the PDF for the key; an unchanged schedule maps to the file printed before"""
+        return os.path.join(self.output_dir, f"{prefix}_{monday.strftime('%Y%m%d')}_{key}.pdf")
 
-        filename = f"{schedule_type}_schedule_{week_date.strftime('%Y%m%d')}.pdf"
-        filepath = os.path.join(self.output_dir, filename)
+    @staticmethod
+    def is_cached(filepath):
+        if not os.path.exists(filepath):
+            return False
+        os.utime(filepath)  # Age eviction counts from the last use
+        return True
+
+    def evict(self, keep=()):
+        """
+        Delete PDFs in the output directory unused for max_age, then the least
+        recently used ones until the directory is below max_bytes.
+        
+        Returns:
+        - List of the deleted paths
+        """
+        files = []
+        for entry in os.scandir(self.output_dir):
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        cutoff = time.time() - self.max_age.total_seconds()
+        total = sum(size for _, size, _ in files)
+        deleted = []
+        for mtime, size, path in files:
+            if path in keep or (mtime >= cutoff and total <= self.max_bytes):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Opened in a viewer on Windows, retried next time
+            total -= size
+            deleted.append(path)
+        return deleted
+
+    def print_week_schedule(self, schedule_type, week_date=None):
+        if week_date is None:
+            week_date = date.today()
+
+        # Define the date range for the week
+        monday = week_date - timedelta(days=week_date.weekday())
+        sunday = monday + timedelta(days=6)
+
+        # Get the data using the standard database functions
+        with db.reporting():
+            records = fetch_schedule(schedule_type, monday, sunday)
+        data = self.format_week(schedule_type, records)
+
+        filepath = self.cached_path(f"{schedule_type}_schedule", monday,
+                                    self.cache_key(schedule_type, monday, data))
+        if self.is_cached(filepath):
+            return filepath
+
+        pdf = FPDF()
+        self.render_week(pdf, schedule_type, week_date, data)
         pdf.output(filepath)
+        self.evict(keep={filepath})
         return filepath
 
+    def export_weeks(self, start_date, end_date, schedule_types=SCHEDULE_TYPES, merge=False,
+                     progress=None, max_workers=None):
+        """
+        Export the schedules of every week from start_date to end_date.
+        
+        The records of the whole range are read with one range query per
+        schedule type, split into weeks and rendered in a ProcessPoolExecutor.
+        Every week and type is a cached PDF of its own (see cached_path), only
+        the changed ones are rendered again.
+        
+        Args:
+        - schedule_types: any of "delivery", "production", "transfer"
+        - merge: write one document with all weeks (per week all types in the
+          given order) instead of one file per week and type. It is put
+          together from the per week files and cached under their keys.
+        - progress: called as progress(done, total) after every rendered week and schedule type
+        
+        Returns:
+        - List of the written file paths, sorted by week and type
+        """
+        first_monday = start_date - timedelta(days=start_date.weekday())
+        last_sunday = end_date + timedelta(days=6 - end_date.weekday())
+        mondays = [first_monday + timedelta(weeks=n)
+                   for n in range((last_sunday - first_monday).days // 7 + 1)]
+
+        with db.reporting():
+            weeks = {
+                schedule_type: split_weeks(fetch_schedule(schedule_type, first_monday, last_sunday))
+                for schedule_type in schedule_types
+            }
+
+        parts = []
+        keys = []
+        for monday in mondays:
+            for schedule_type in schedule_types:
+                data = self.format_week(schedule_type, weeks[schedule_type].get(monday, []))
+                key = self.cache_key(schedule_type, monday, data)
+                keys.append(key)
+                parts.append((schedule_type, monday, data, self.cached_path(f"{schedule_type}_schedule", monday, key)))
+
+        if merge:
+            # The keys of the parts cover the types, their order and every week's data
+            filename = (f"schedules_{'-'.join(schedule_types)}_{first_monday.strftime('%Y%m%d')}_"
+                        f"{last_sunday.strftime('%Y%m%d')}_{self.cache_key(*keys)}.pdf")
+            merged_path = os.path.join(self.output_dir, filename)
+            if self.is_cached(merged_path):
+                if progress:
+                    progress(len(parts), len(parts))
+                return [merged_path]
+
+        results = [filepath for _, _, _, filepath in parts]
+        tasks = [(index, part) for index, part in enumerate(parts) if not self.is_cached(part[3])]
+
+        done = len(results) - len(tasks)
+        if progress and done:
+            progress(done, len(results))
+        if tasks:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(_render_task, *task): index for index, task in tasks}
+                for future in as_completed(futures):
+                    future.result()
+                    done += 1
+                    if progress:
+                        progress(done, len(results))
+
+        if not merge:
+            self.evict(keep=set(results))
+            return results
+
+        merged = FPDF()
+        for filepath in results:
+            _append_pages(merged, _read_pages(filepath))
+        merged.output(merged_path)
+        self.evict(keep={merged_path, *results})
+        return [merged_path]
+
     def print_all_schedules(self, week_date=None):
         """Print all schedules for specified week"""
         if week_date is None:
@@ -302,15 +574,22 @@ class SchedulePrinter:
         monday = week_date - timedelta(days=week_date.weekday())
         sunday = monday + timedelta(days=6)
 
+        # Get the data using the standard database functions
+        with db.reporting():
+            schedule_data = self.format_delivery_data(get_delivery_week(monday))
+            daily_items = self.format_production_data(get_production_week(monday))
+            daily_transfers = self.format_transfer_data(get_transfer_schedule(monday, sunday))
+
+        filepath = self.cached_path("all_schedules", monday,
+                                    self.cache_key("all", monday, schedule_data, daily_items, daily_transfers))
+        if self.is_cached(filepath):
+            return filepath
+
         pdf = FPDF()
         
         # Delivery Schedule
         pdf.add_page('L')
         title = "Wöchentlicher Lieferplan"
-        # Get delivery data using the standard database function
-        deliveries = get_delivery_schedule(monday, sunday)
-        schedule_data = self.format_delivery_data(deliveries)
-        
         self._create_header(pdf, title, week_date)
         for date_str, deliveries in schedule_data["daily_data"].items():
             pdf.set_font('Arial', 'B', 12)
@@ -320,10 +599,6 @@ class SchedulePrinter:
         # Production Plan
         pdf.add_page('L')
         title = "Wöchentlicher Produktionsplan"
-        # Get production data using the standard database function
-        production_data = get_production_plan(monday, sunday)
-        daily_items = self.format_production_data(production_data)
-        
         self._create_header(pdf, title, week_date)
         for date_str, items in daily_items.items():
             pdf.set_font('Arial', 'B', 12)
@@ -346,10 +621,6 @@ class SchedulePrinter:
         # Transfer Schedule
         pdf.add_page('L')
         title = "Wöchentlicher Transferplan"
-        # Get transfer data using the standard database function
-        transfer_data = get_transfer_schedule(monday, sunday)
-        daily_transfers = self.format_transfer_data(transfer_data)
-        
         self._create_header(pdf, title, week_date)
         for date_str, transfers in daily_transfers.items():
             pdf.set_font('Arial', 'B', 12)
@@ -361,13 +632,14 @@ class SchedulePrinter:
             
             self._add_table(pdf, ["Item", "Menge"], data)
         
-        filename = f"all_schedules_{week_date.strftime('%Y%m%d')}.pdf"
-        filepath = os.path.join(self.output_dir, filename)
         pdf.output(filepath)
+        self.evict(keep={filepath})
         return filepath
 
 def ask_week_selection():
     """Ask user which week to print"""
+    # Imported here, so the batch export and the command line run without a display
+    import tkinter as tk
     dialog = tk.Toplevel()
     dialog.title("Woche auswählen")
     dialog.geometry("300x150")
@@ -391,4 +663,46 @@ def ask_week_selection():
     dialog.grab_set()
     dialog.wait_window()
     
-    return result["week"]
\ No newline at end of file
+    return result["week"]
+
+def main(argv=None):
+    """Batch export: python print_schedules.py --from 2024-01-01 --to 2024-03-31 [--types delivery,production] [--merge]"""
+    import argparse
+    from models import configure_database, create_tables
+
+    def parse_date(value):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+
+    def parse_types(value):
+        types = [t.strip() for t in value.split(',') if t.strip()]
+        unknown = set(types) - set(SCHEDULE_TYPES)
+        if unknown or not types:
+            raise argparse.ArgumentTypeError(f"unknown schedule type: {', '.join(sorted(unknown)) or value}")
+        return types
+
+    parser = argparse.ArgumentParser(description="Export the weekly schedules of a date range as PDF files")
+    parser.add_argument('--from', dest='start', type=parse_date, required=True, help="first day, YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', type=parse_date, required=True, help="last day, YYYY-MM-DD")
+    parser.add_argument('--types', type=parse_types, default=list(SCHEDULE_TYPES),
+                        help="comma separated: delivery,production,transfer (default: all)")
+    parser.add_argument('--merge', action='store_true', help="write a single document")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--output', default="output", help="output directory (default: output)")
+    args = parser.parse_args(argv)
+    if args.end < args.start:
+        parser.error("--to is before --from")
+
+    configure_database()
+    create_tables()
+
+    def report(done, total):
+        print(f"\r{done}/{total} Wochenpläne gerendert", end='', flush=True)
+
+    paths = SchedulePrinter(args.output).export_weeks(args.start, args.end, args.types, merge=args.merge,
+                                                      progress=report, max_workers=args.workers)
+    print()
+    for path in paths:
+        print(path)
+
+if __name__ == "__main__":
+    main()
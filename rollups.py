@@ -0,0 +1,131 @@
+"""
+Maintenance of the production_rollup table.
+
+production_rollup holds SUM(OrderItem.amount) per (production_date, item) for
+every order counted by database.get_production_plan. SQLite triggers on the
+order and orderitem tables recompute the affected (production_date, item)
+buckets inside the same transaction as the write. The production plan of a
+week then reads a few rows per day from the table instead of summing up the
+order items of every order in the date range.
+
+Run `python rollups.py --check` to compare the table against the order data
+and `python rollups.py --rebuild` to recompute it from scratch.
+"""
+import sys
+from peewee import fn
+from models import db, Order, OrderItem, ProductionRollup, create_triggers
+from database import counted_in_schedule
+
+# Same filter as database.counted_in_schedule, for use inside the triggers
+_COUNTED = (
+    '((o.from_date IS NULL AND o.to_date IS NULL) OR '
+    '(o.from_date IS NOT NULL AND o.delivery_date >= o.from_date AND o.delivery_date <= o.to_date))'
+)
+
+def _recompute(date_expr, items_expr):
+    """SQL recomputing the buckets of one production date for the given item ids"""
+    return f'''
+        DELETE FROM production_rollup
+        WHERE production_date = {date_expr} AND item_id IN ({items_expr});
+        INSERT INTO production_rollup (production_date, item_id, total_amount)
+        SELECT o.production_date, oi.item_id, SUM(oi.amount)
+        FROM orderitem AS oi JOIN "order" AS o ON o.id = oi.order_id
+        WHERE o.production_date = {date_expr} AND oi.item_id IN ({items_expr}) AND {_COUNTED}
+        GROUP BY o.production_date, oi.item_id;'''
+
+_ORDER_DATE = '(SELECT production_date FROM "order" WHERE id = {}.order_id)'
+
+TRIGGERS = {
+    'production_rollup_orderitem_insert': (
+        'AFTER INSERT ON orderitem',
+        _recompute(_ORDER_DATE.format('NEW'), 'NEW.item_id')
+    ),
+    'production_rollup_orderitem_delete': (
+        'AFTER DELETE ON orderitem',
+        _recompute(_ORDER_DATE.format('OLD'), 'OLD.item_id')
+    ),
+    'production_rollup_orderitem_update': (
+        'AFTER UPDATE OF order_id, item_id, amount ON orderitem',
+        _recompute(_ORDER_DATE.format('OLD'), 'OLD.item_id') +
+        _recompute(_ORDER_DATE.format('NEW'), 'NEW.item_id')
+    ),
+    'production_rollup_order_update': (
+        'AFTER UPDATE OF production_date, delivery_date, from_date, to_date ON "order" '
+        'WHEN OLD.production_date IS NOT NEW.production_date '
+        'OR OLD.delivery_date IS NOT NEW.delivery_date '
+        'OR OLD.from_date IS NOT NEW.from_date '
+        'OR OLD.to_date IS NOT NEW.to_date',
+        _recompute('OLD.production_date', 'SELECT item_id FROM orderitem WHERE order_id = OLD.id') +
+        _recompute('NEW.production_date', 'SELECT item_id FROM orderitem WHERE order_id = NEW.id')
+    ),
+    # Items left behind by a bare Order.delete() no longer join to an order and drop out
+    'production_rollup_order_delete': (
+        'AFTER DELETE ON "order"',
+        _recompute('OLD.production_date', 'SELECT item_id FROM orderitem WHERE order_id = OLD.id')
+    ),
+}
+
+def install_triggers(database=db):
+    """(Re)create the triggers that keep production_rollup current"""
+    create_triggers(TRIGGERS, database)
+
+def _source_query():
+    """Aggregate of the order data the rollup must match"""
+    return (OrderItem
+            .select(Order.production_date, OrderItem.item, fn.SUM(OrderItem.amount))
+            .join(Order)
+            .where(counted_in_schedule())
+            .group_by(Order.production_date, OrderItem.item))
+
+def rebuild_rollups(database=db):
+    """
+    Recompute production_rollup from the order data.
+
+    Returns:
+    - Number of rollup rows written
+    """
+    with database.bind_ctx([Order, OrderItem, ProductionRollup]):
+        with database.atomic():
+            ProductionRollup.delete().execute()
+            ProductionRollup.insert_from(
+                _source_query(),
+                [ProductionRollup.production_date, ProductionRollup.item, ProductionRollup.total_amount]
+            ).execute()
+            return ProductionRollup.select().count()
+
+def check_rollups(database=db, tolerance=1e-6):
+    """
+    Compare production_rollup with the order data.
+
+    Returns:
+    - List of (production_date, item_id, expected, actual) for every mismatching
+      bucket; a missing bucket is reported with None. Empty when consistent.
+    """
+    with database.bind_ctx([Order, OrderItem, ProductionRollup]):
+        expected = {(d, item_id): amount for d, item_id, amount in _source_query().tuples()}
+        actual = {
+            (d, item_id): amount
+            for d, item_id, amount in ProductionRollup
+                .select(ProductionRollup.production_date, ProductionRollup.item, ProductionRollup.total_amount)
+                .tuples()
+        }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key)
+        have = actual.get(key)
+        if want is None or have is None or abs(want - have) > tolerance:
+            mismatches.append((key[0], key[1], want, have))
+    return mismatches
+
+if __name__ == "__main__":
+    if '--rebuild' in sys.argv:
+        print(f"Rebuilt production rollup: {rebuild_rollups()} rows")
+    else:
+        mismatches = check_rollups()
+        for production_date, item_id, want, have in mismatches:
+            print(f"  {production_date} item {item_id}: expected {want}, found {have}")
+        if mismatches:
+            print(f"❌ {len(mismatches)} inconsistent rollup rows. Run with --rebuild to repair.")
+            sys.exit(1)
+        print("✅ Production rollup is consistent")
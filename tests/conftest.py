@@ -8,6 +8,7 @@ import uuid
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from models import db, Customer, Item, Order, OrderItem
+from migrations import migrate
 
 # Helper function for date handling in tests
 def normalize_date(date_value):
@@ -35,6 +36,8 @@ def test_db():
     db.init(':memory:')
     db.connect()
     db.create_tables([Customer, Item, Order, OrderItem])
+    # Bring the test database to the same schema version as production.db
+    migrate(db)
     
     yield db
     
@@ -48,6 +51,19 @@ def test_db():
         finally:
             db.close()
 
+@pytest.fixture
+def query_log(test_db, monkeypatch):
+    """Record the SQL of every statement executed against the test database"""
+    statements = []
+    original_execute_sql = test_db.execute_sql
+
+    def recording_execute_sql(sql, params=None, *args, **kwargs):
+        statements.append(sql)
+        return original_execute_sql(sql, params, *args, **kwargs)
+
+    monkeypatch.setattr(test_db, 'execute_sql', recording_execute_sql)
+    return statements
+
 @pytest.fixture
 def sample_data(test_db):
     """Create sample data for testing"""
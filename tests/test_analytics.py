@@ -0,0 +1,108 @@
+import pytest
+from datetime import date, timedelta
+import uuid
+from models import Customer, Item, Order, OrderItem
+from database import create_subscription, override_occurrence
+from analytics import ItemAnalytics
+from events import OrderChanged, ItemChanged
+
+
+@pytest.fixture
+def history(test_db):
+    """Past orders in two years, plus one future order that must not count"""
+    customer = Customer.create(name="Analytics Customer")
+    items = {
+        name: Item.create(name=name, growth_days=3, soaking_days=1, germination_days=2,
+                          price=price, seed_quantity=0.1, substrate="Substrate 1")
+        for name, price in [("Radish", 2.0), ("Pea", 3.0), ("Sunflower", 4.0)]
+    }
+    orders = {}
+
+    def order(delivery_date, amounts, is_future=False):
+        o = Order.create(customer=customer, delivery_date=delivery_date, production_date=delivery_date,
+                         order_id=uuid.uuid4(), is_future=is_future)
+        for name, amount in amounts.items():
+            OrderItem.create(order=o, item=items[name], amount=amount)
+        orders[delivery_date] = o
+
+    order(date(2023, 2, 1), {"Radish": 1.0, "Pea": 2.0})
+    order(date(2023, 11, 1), {"Radish": 4.0})
+    order(date(2024, 5, 1), {"Radish": 1.0, "Sunflower": 0.5})
+    order(date(2024, 8, 1), {"Pea": 1.0})
+    order(date(2024, 12, 1), {"Sunflower": 9.0}, is_future=True)
+    return {'items': items, 'orders': orders}
+
+
+def test_stats_and_quarterly_pivot(history):
+    """Totals, revenue and quarters per item, all years and per year"""
+    analytics = ItemAnalytics()
+
+    stats = {s.name: s for s in analytics.item_stats()}
+    assert stats["Radish"].total_amount == 6.0
+    assert stats["Radish"].order_count == 3
+    assert stats["Radish"].total_revenue == 12.0
+    assert stats["Radish"].quarters == [1.0, 1.0, 0.0, 4.0]
+    assert stats["Sunflower"].total_amount == 0.5  # The future order doesn't count
+
+    assert [s.name for s in analytics.top_items(2)] == ["Radish", "Pea"]
+    assert [s.name for s in analytics.least_items(2)] == ["Sunflower", "Pea"]
+    assert [(s.name, s.quarters) for s in analytics.seasonal(year=2023)] == [
+        ("Radish", [1.0, 0.0, 0.0, 4.0]), ("Pea", [2.0, 0.0, 0.0, 0.0])]
+    assert analytics.available_years() == [2024, 2023]
+
+
+def test_one_query_and_cached(history, query_log):
+    """The orders come from one grouped query, repeated access reads nothing"""
+    analytics = ItemAnalytics()
+    analytics.top_items()
+    analytics.least_items()
+    analytics.seasonal(year=2024)
+
+    # The grouped order query and the lookup of the first subscription rule
+    assert len(query_log) == 2
+    assert 'strftime' in query_log[0]
+    assert '"subscription"' in query_log[1]
+
+
+def test_order_change_rereads_only_its_year(history, query_log):
+    analytics = ItemAnalytics()
+    analytics.item_stats()
+    OrderItem.update(amount=10.0).where(OrderItem.order == history['orders'][date(2024, 8, 1)]).execute()
+    analytics.invalidate([OrderChanged(frozenset({date(2024, 8, 1)}))])
+    query_log.clear()
+
+    stats = {s.name: s for s in analytics.item_stats()}
+
+    assert stats["Pea"].total_amount == 12.0
+    assert stats["Radish"].total_amount == 6.0  # 2023 still from the cache
+    # One order query restricted to the delivery dates of 2024
+    assert len([sql for sql in query_log if 'strftime' in sql]) == 1
+    assert '"delivery_date" >=' in query_log[0]
+
+
+def test_item_change_rereads_everything(history):
+    analytics = ItemAnalytics()
+    analytics.item_stats()
+    Item.update(price=1.0).where(Item.name == "Radish").execute()
+    analytics.invalidate([ItemChanged()])
+
+    stats = {s.name: s for s in analytics.item_stats()}
+    assert stats["Radish"].total_revenue == 6.0
+
+
+def test_subscription_deliveries_count(history):
+    """Occurrences of a rule up to today count like orders, overrides replace their occurrence"""
+    items = history['items']
+    customer = Customer.create(name="Subscription Customer")
+    today = date.today()
+    start = today - timedelta(weeks=51)
+    rule = create_subscription(customer, 1, start, start, start + timedelta(weeks=52), [(items["Pea"], 2.0)])
+    override_occurrence(rule, start + timedelta(weeks=1), items=[])
+    override_occurrence(rule, start + timedelta(weeks=2), items=[(items["Pea"], 3.0)])
+
+    stats = {s.name: s for s in ItemAnalytics().item_stats()}
+
+    # 52 deliveries up to today, one cancelled; plus the 3.0 of the past orders
+    assert stats["Pea"].order_count == 51 + 2
+    assert stats["Pea"].total_amount == 50 * 2.0 + 3.0 + 3.0
+    assert stats["Pea"].total_revenue == (50 * 2.0 + 3.0 + 3.0) * 3.0
@@ -0,0 +1,138 @@
+import pytest
+import re
+from datetime import date, timedelta
+from fpdf import FPDF
+from database import create_subscription, get_delivery_week, get_delivery_range, get_production_week, get_production_range
+from print_schedules import SchedulePrinter, _append_pages, _read_pages, split_weeks
+
+MONDAY = date(2024, 3, 4)
+
+
+def page_count(path):
+    with open(path, 'rb') as f:
+        return len(re.findall(rb'/Type /Page\b(?!s)', f.read()))
+
+
+@pytest.fixture
+def weekly_subscription(sample_data):
+    customer, item = sample_data['customers'][0], sample_data['items'][1]
+    return create_subscription(customer, 1, MONDAY + timedelta(days=2), MONDAY, MONDAY + timedelta(weeks=12),
+                               [(item, 2.0)])
+
+
+def test_range_queries_match_the_weeks(weekly_subscription):
+    end = MONDAY + timedelta(weeks=4, days=-1)
+    deliveries = split_weeks(get_delivery_range(MONDAY, end))
+    production = split_weeks(get_production_range(MONDAY, end))
+    for week in range(4):
+        monday = MONDAY + timedelta(weeks=week)
+        assert deliveries[monday] == get_delivery_week(monday)
+        assert production[monday] == get_production_week(monday)
+
+
+def test_export_writes_one_file_per_week_and_type(weekly_subscription, tmp_path, query_log):
+    printer = SchedulePrinter(str(tmp_path))
+    calls = []
+
+    paths = printer.export_weeks(MONDAY + timedelta(days=3), MONDAY + timedelta(weeks=2, days=1),
+                                 ["delivery", "transfer"], progress=lambda done, total: calls.append((done, total)),
+                                 max_workers=2)
+
+    assert [p.split('/')[-1].rsplit('_', 1)[0] for p in paths] == [
+        'delivery_schedule_20240304', 'transfer_schedule_20240304',
+        'delivery_schedule_20240311', 'transfer_schedule_20240311',
+        'delivery_schedule_20240318', 'transfer_schedule_20240318',
+    ]
+    assert all(page_count(path) >= 1 for path in paths)
+    assert calls == [(n, 6) for n in range(1, 7)]
+
+    # Unchanged weeks are not rendered again
+    calls.clear()
+    assert printer.export_weeks(MONDAY, MONDAY + timedelta(weeks=2),
+                                ["delivery", "transfer"], progress=lambda done, total: calls.append((done, total)),
+                                max_workers=2) == paths
+    assert calls == [(6, 6)]
+
+
+def test_export_reads_each_type_with_one_range_query(weekly_subscription, tmp_path, query_log):
+    printer = SchedulePrinter(str(tmp_path))
+    printer.export_weeks(MONDAY, MONDAY + timedelta(days=6), max_workers=1)
+    one_week = len(query_log)
+    query_log.clear()
+
+    printer.export_weeks(MONDAY, MONDAY + timedelta(weeks=10), max_workers=2)
+
+    assert 0 < len(query_log) == one_week
+
+
+def test_merged_export_has_the_pages_of_all_weeks(weekly_subscription, tmp_path):
+    """The merged document is put together from the cached week files, nothing is rendered again"""
+    printer = SchedulePrinter(str(tmp_path))
+    end = MONDAY + timedelta(weeks=3, days=-1)
+    single = printer.export_weeks(MONDAY, end, max_workers=2)
+    calls = []
+
+    merged = printer.export_weeks(MONDAY, end, merge=True, max_workers=2,
+                                  progress=lambda done, total: calls.append((done, total)))
+
+    assert calls == [(9, 9)]
+    assert re.fullmatch(r'schedules_delivery-production-transfer_20240304_20240324_[0-9a-f]{16}\.pdf',
+                        merged[0].split('/')[-1])
+    assert page_count(merged[0]) == sum(page_count(path) for path in single)
+    assert printer.export_weeks(MONDAY, end, merge=True, max_workers=2) == merged
+
+
+def test_merged_export_depends_on_types_and_data(weekly_subscription, sample_data, tmp_path):
+    printer = SchedulePrinter(str(tmp_path))
+    end = MONDAY + timedelta(weeks=2, days=-1)
+    merged = printer.export_weeks(MONDAY, end, merge=True, max_workers=1)
+
+    deliveries = printer.export_weeks(MONDAY, end, ["delivery"], merge=True, max_workers=1)
+    assert deliveries != merged
+    assert deliveries[0].split('/')[-1].startswith('schedules_delivery_20240304_20240317_')
+    assert page_count(deliveries[0]) < page_count(merged[0])
+
+    create_subscription(sample_data['customers'][1], 1, MONDAY + timedelta(days=4), MONDAY,
+                        MONDAY + timedelta(weeks=4), [(sample_data['items'][0], 1.0)])
+    assert printer.export_weeks(MONDAY, end, merge=True, max_workers=1) != merged
+
+
+def test_append_pages_maps_font_numbers():
+    first, second = FPDF(), FPDF()
+    first.add_page('L')
+    first.set_font('Arial', 'B', 12)
+    first.cell(10, 10, 'A')
+    second.add_page()
+    second.set_font('Courier', '', 10)
+    second.cell(10, 10, 'B')
+    second.set_font('Arial', 'B', 12)
+    second.cell(10, 10, 'C')
+
+    target = FPDF()
+    _append_pages(target, first)
+    _append_pages(target, second)
+
+    courier, arial = target.fonts['courier']['i'], target.fonts['helveticaB']['i']
+    assert target.page == 2 and 1 in target.orientation_changes and 2 not in target.orientation_changes
+    assert f'BT /F{arial} 12.00 Tf ET' in target.pages[1]
+    assert f'BT /F{courier} 10.00 Tf ET' in target.pages[2]
+    assert f'BT /F{arial} 12.00 Tf ET' in target.pages[2]
+
+
+def test_read_pages_of_a_written_pdf(tmp_path):
+    """A PDF file gives _append_pages the same pages and fonts as the FPDF that wrote it"""
+    pdf = FPDF()
+    pdf.add_page('L')
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(10, 10, 'Größe')
+    pdf.add_page()
+    pdf.set_font('Courier', '', 10)
+    pdf.cell(10, 10, 'B')
+    path = str(tmp_path / 'pages.pdf')
+    pdf.output(path)
+
+    source = _read_pages(path)
+
+    assert source.page == 2 and source.orientation_changes == {1}
+    assert source.pages == pdf.pages
+    assert source.fonts == {key: {'i': font['i']} for key, font in pdf.fonts.items()}
@@ -0,0 +1,46 @@
+import pytest
+from weekly_view import CardPool
+
+
+class FakeCard:
+    created = 0
+    destroyed = 0
+
+    def __init__(self, parent):
+        FakeCard.created += 1
+        self.record = None
+
+    def show(self, record):
+        self.record = record
+
+    def destroy(self):
+        FakeCard.destroyed += 1
+
+
+@pytest.fixture
+def pool():
+    FakeCard.created = FakeCard.destroyed = 0
+    return CardPool(parent=None, factory=FakeCard)
+
+
+def test_cards_are_reused(pool):
+    """Redrawing the same number of records only reconfigures the cards"""
+    pool.show(['a', 'b', 'c'])
+    first_cards = list(pool.cards)
+
+    pool.show(['a', 'x', 'c'])
+
+    assert pool.cards == first_cards
+    assert [card.record for card in pool.cards] == ['a', 'x', 'c']
+    assert (FakeCard.created, FakeCard.destroyed) == (3, 0)
+
+
+def test_card_count_follows_records(pool):
+    """Cards are only created or destroyed when the count changes"""
+    pool.show(['a', 'b', 'c'])
+    pool.show(['a'])
+    assert (FakeCard.created, FakeCard.destroyed) == (3, 2)
+
+    pool.show(['a', 'b'])
+    assert (FakeCard.created, FakeCard.destroyed) == (4, 2)
+    assert [card.record for card in pool.cards] == ['a', 'b']
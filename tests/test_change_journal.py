@@ -0,0 +1,73 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import Customer, Item, Order, OrderItem, Subscription
+from changes import ALL_DAYS, day_versions, dirty_days, stamp_days
+
+MONDAY = datetime(2024, 3, 4).date()
+SUNDAY = MONDAY + timedelta(days=6)
+
+
+@pytest.fixture
+def week(test_db):
+    """One order delivered on Tuesday with one item (transfer 3 days after production)"""
+    customer = Customer.create(name="Journal Customer")
+    item = Item.create(name="Journal Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+    order = Order.create(customer=customer, delivery_date=MONDAY + timedelta(days=1),
+                         production_date=MONDAY - timedelta(days=2), order_id=uuid.uuid4())
+    order_item = OrderItem.create(order=order, item=item, amount=1.0)
+    return {'customer': customer, 'item': item, 'order': order, 'order_item': order_item}
+
+
+def versions(kind):
+    return day_versions(kind, MONDAY - timedelta(days=7), SUNDAY)
+
+
+def test_order_item_change_bumps_its_dates(week):
+    """Changing one amount bumps exactly the delivery, production and transfer date of the order"""
+    before = {kind: versions(kind) for kind in ('delivery', 'production', 'transfer')}
+
+    OrderItem.update(amount=2.0).where(OrderItem.id == week['order_item'].id).execute()
+
+    def changed(kind):
+        after = versions(kind)
+        return {day for day in after if after[day] != before[kind].get(day)}
+
+    assert changed('delivery') == {MONDAY + timedelta(days=1)}
+    assert changed('production') == {MONDAY - timedelta(days=2)}
+    assert changed('transfer') == {MONDAY + timedelta(days=1)}
+
+
+def test_moving_an_order_bumps_old_and_new_date(week):
+    """A moved delivery must disappear from the old day and appear on the new one"""
+    before = versions('delivery')
+
+    Order.update(delivery_date=MONDAY + timedelta(days=3)).where(Order.id == week['order'].id).execute()
+
+    after = versions('delivery')
+    assert {day for day in after if after[day] != before.get(day)} == {
+        MONDAY + timedelta(days=1), MONDAY + timedelta(days=3)}
+
+
+def test_rules_and_catalog_changes_bump_all_days(week):
+    """Subscription rules, item and customer edits can affect any day"""
+    start = versions('delivery').get(ALL_DAYS, 0)
+
+    Item.update(name="Renamed").where(Item.id == week['item'].id).execute()
+    Customer.update(name="Renamed").where(Customer.id == week['customer'].id).execute()
+    Subscription.create(customer=week['customer'], subscription_type=1, anchor_date=MONDAY,
+                        from_date=MONDAY, to_date=SUNDAY)
+
+    assert versions('delivery')[ALL_DAYS] == start + 3
+
+
+def test_dirty_days():
+    """Only days whose version moved are dirty, unless the ALL_DAYS version moved"""
+    days = [MONDAY + timedelta(days=i) for i in range(7)]
+    drawn = stamp_days({MONDAY: 2, ALL_DAYS: 1}, days)
+
+    assert dirty_days({}, {}, days) == days
+    assert dirty_days(drawn, {MONDAY: 2, ALL_DAYS: 1}, days) == []
+    assert dirty_days(drawn, {MONDAY: 2, SUNDAY: 1, ALL_DAYS: 1}, days) == [SUNDAY]
+    assert dirty_days(drawn, {MONDAY: 2, ALL_DAYS: 2}, days) == days
@@ -0,0 +1,95 @@
+import pytest
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import date, timedelta
+import kleinblatt
+from kleinblatt import main, parse_week, week_label, format_table
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture
+def cli(test_db, monkeypatch):
+    """Run the command line against the test database"""
+    monkeypatch.setattr(kleinblatt, 'open_database', lambda path: None)
+    return main
+
+
+def delivery_week(sample_data):
+    delivery = sample_data['orders'][0].delivery_date
+    return week_label(delivery - timedelta(days=delivery.weekday()))
+
+
+def test_parse_week():
+    assert parse_week('2024-W10') == date(2024, 3, 4)
+    assert parse_week('2024w1') == date(2024, 1, 1)
+    assert parse_week('2020-W53') == date(2020, 12, 28)
+    for value in ['2024-W54', '2021-W53', '2024-10', 'KW10']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_week(value)
+    assert week_label(date(2024, 12, 30)) == '2025-W01'
+
+
+def test_format_table_pads_columns():
+    assert format_table(["Item", "Menge"], [["Erbse", "2"], ["Brokkoli", "10"]]).splitlines() == [
+        "Item      Menge",
+        "--------  -----",
+        "Erbse     2",
+        "Brokkoli  10",
+    ]
+
+
+def test_delivery_table_and_json(cli, sample_data, capsys):
+    week = delivery_week(sample_data)
+
+    assert cli(['delivery', '--week', week]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["Datum", "Kunde", "Items", "Halbe", "Channel"]
+    assert "Test Customer 1" in lines[2] and "Microgreen A: 2.5, Microgreen B: 1.5" in lines[2]
+    assert lines[2].endswith("Nein") and lines[3].endswith("Ja")
+
+    assert cli(['delivery', '--week', week, '--json']) == 0
+    document = json.loads(capsys.readouterr().out)
+    assert (document['type'], document['week']) == ('delivery', week)
+    assert document['records'][0]['date'] == sample_data['orders'][0].delivery_date.isoformat()
+    assert document['records'][0]['items'] == [{'item': "Microgreen A", 'amount': 2.5},
+                                               {'item': "Microgreen B", 'amount': 1.5}]
+
+
+def test_empty_week(cli, sample_data, capsys):
+    assert cli(['transfer', '--week', '2001-W01']) == 0
+    assert capsys.readouterr().out.strip() == "Keine Einträge in 2001-W01"
+
+
+def test_print_writes_the_pdfs(cli, sample_data, tmp_path, capsys):
+    assert cli(['print', '--week', delivery_week(sample_data), '--types', 'delivery,production',
+                '--workers', '1', '--output', str(tmp_path)]) == 0
+    paths = capsys.readouterr().out.split()
+    assert [os.path.basename(path).split('_')[0] for path in paths] == ['delivery', 'production']
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_import_dry_run(cli, sample_data, tmp_path, capsys):
+    path = tmp_path / 'Orders.csv'
+    path.write_text('"Kunde","Item","Menge","Lieferdatum","Ansaehen","Woche_Wdh","Von","Bis","Preis"\n'
+                    '"Test Customer 1","Microgreen A","1","04.03.24","","0","","","5"\n'
+                    '"Test Customer 1","Unbekannt","1","04.03.24","","0","","","5"\n', encoding='utf-8')
+
+    assert cli(['import', str(path), '--dry-run', '--workers', '1']) == 1
+    out = capsys.readouterr().out
+    assert "Zeile 3, Item: unbekanntes Item 'Unbekannt'" in out
+    assert "1 neu" in out
+
+
+def test_runs_without_tkinter():
+    """The command line must work on machines without a display or Tk"""
+    code = ("import sys, kleinblatt, print_schedules; "
+            "print(sorted(m for m in ('tkinter', 'fpdf') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "['fpdf']"
+    out = subprocess.run([sys.executable, '-c', code.replace(', print_schedules', '')],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
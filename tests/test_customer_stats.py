@@ -0,0 +1,111 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import Customer, Item, Order, OrderItem, CustomerStats
+from customer_stats import check_customer_stats, rebuild_customer_stats, customer_overview
+from database import create_subscription, override_occurrence
+
+
+def stats(customer):
+    row = CustomerStats.get(CustomerStats.customer == customer)
+    return row.order_count, round(row.revenue, 6), row.last_delivery
+
+
+@pytest.fixture
+def past_orders(test_db, sample_data):
+    """Two past orders of the first customer, with two and one items"""
+    today = datetime.now().date()
+    customer = sample_data['customers'][0]
+    item_a, item_b = sample_data['items']
+    orders = []
+    for days, amounts in [(14, [(item_a, 1.0), (item_b, 2.0)]), (7, [(item_a, 3.0)])]:
+        order = Order.create(customer=customer, delivery_date=today - timedelta(days=days),
+                             production_date=today - timedelta(days=days + 5), order_id=uuid.uuid4())
+        for item, amount in amounts:
+            OrderItem.create(order=order, item=item, amount=amount)
+        orders.append(order)
+    return {**sample_data, 'past': orders, 'today': today}
+
+
+def test_stats_count_orders_not_items(past_orders):
+    """Orders with several items count once, future orders don't count"""
+    customer = past_orders['customers'][0]
+    today = past_orders['today']
+
+    # 1*5 + 2*7 + 3*5
+    assert stats(customer) == (2, 34.0, today - timedelta(days=7))
+    assert check_customer_stats() == []
+
+
+def test_customers_without_orders_have_a_row(past_orders):
+    """The Bestellungen tab lists every customer, also without past orders"""
+    new_customer = Customer.create(name="No Orders Yet")
+    assert stats(new_customer) == (0, 0.0, None)
+    assert stats(past_orders['customers'][1]) == (0, 0.0, None)
+
+
+def test_stats_follow_writes(past_orders):
+    """Amount, price and date edits and deletions update the customer's row"""
+    customer = past_orders['customers'][0]
+    today = past_orders['today']
+    latest = past_orders['past'][1]
+
+    OrderItem.update(amount=4.0).where(OrderItem.order == latest).execute()
+    assert stats(customer)[1] == 39.0
+
+    Item.update(price=10.0).where(Item.id == past_orders['items'][0].id).execute()
+    assert stats(customer)[1] == 64.0
+
+    latest.delivery_date = today - timedelta(days=1)
+    latest.save()
+    assert stats(customer)[2] == today - timedelta(days=1)
+
+    latest.delete_instance(recursive=True)
+    assert stats(customer) == (1, 24.0, today - timedelta(days=14))
+    assert check_customer_stats() == []
+
+
+def test_customer_list_is_one_index_scan(past_orders, test_db):
+    """The customer list reads customer_stats along its order_count index"""
+    test_db.execute_sql('ANALYZE')
+    query = (CustomerStats
+             .select(Customer.name, CustomerStats.order_count)
+             .join(Customer)
+             .order_by(CustomerStats.order_count.desc()))
+    sql, params = query.sql()
+    plan = [row[-1] for row in test_db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+
+    assert any('customerstats_order_count' in line for line in plan)
+    assert not any('TEMP B-TREE' in line for line in plan)
+
+
+def test_subscription_deliveries_count(past_orders):
+    """A customer with only a year-long weekly subscription has its past deliveries listed"""
+    today = past_orders['today']
+    item_a = past_orders['items'][0]
+    customer = Customer.create(name="Subscription Only")
+    start = today - timedelta(weeks=51)
+    rule = create_subscription(customer, 1, start, start, start + timedelta(weeks=52), [(item_a, 2.0)])
+    override_occurrence(rule, start + timedelta(weeks=1), items=[])
+    override_occurrence(rule, start + timedelta(weeks=2), items=[(item_a, 3.0)])
+
+    overview = {name: rest for name, *rest in customer_overview()}
+
+    # 52 deliveries up to today, one cancelled, one with 3 instead of 2 at 5.0
+    assert overview["Subscription Only"] == [51, 50 * 10.0 + 15.0, today]
+    assert overview[past_orders['customers'][0].name] == [2, 34.0, today - timedelta(days=7)]
+    assert customer_overview()[0][0] == "Subscription Only"
+    # The table holds only plain orders, the overrides don't count twice
+    assert stats(customer) == (0, 0.0, None)
+    assert check_customer_stats() == []
+
+
+def test_check_and_rebuild_repair_inconsistencies(past_orders):
+    customer = past_orders['customers'][0]
+    CustomerStats.update(order_count=99).where(CustomerStats.customer == customer).execute()
+
+    mismatches = check_customer_stats()
+    assert [(customer_id, have[0]) for customer_id, want, have in mismatches] == [(customer.id, 99)]
+
+    assert rebuild_customer_stats() == 2
+    assert check_customer_stats() == []
@@ -2,7 +2,7 @@ import pytest
 from datetime import datetime, timedelta
 import uuid
 from models import Customer, Item, Order, OrderItem
-from database import calculate_production_date, generate_subscription_orders, get_delivery_schedule
+from database import calculate_production_date, generate_subscription_orders, get_delivery_schedule, get_delivery_week
 from database import get_production_plan, get_transfer_schedule
 
 
@@ -332,4 +332,73 @@ def test_get_transfer_schedule(test_db, sample_data):
             found_transfer = True
             break
     
-    assert found_transfer, "Expected transfer not found in schedule" 
\ No newline at end of file
+    assert found_transfer, "Expected transfer not found in schedule" 
+
+def test_get_delivery_week(test_db, sample_data):
+    """Test the week snapshot returns sorted lightweight delivery records"""
+    today = datetime.now().date()
+    next_week = today + timedelta(days=7)
+    monday = next_week - timedelta(days=next_week.weekday())
+    
+    deliveries = get_delivery_week(monday)
+    
+    assert [d['customer'] for d in deliveries] == ["Test Customer 1", "Test Customer 2"]
+    first, second = deliveries
+    assert first['id'] == sample_data['orders'][0].id
+    assert first['date'] == next_week
+    assert first['halbe_channel'] is False
+    assert first['items'] == [("Microgreen A", 2.5), ("Microgreen B", 1.5)]
+    assert second['halbe_channel'] is True
+    assert second['items'] == [("Microgreen A", 3.0)]
+
+
+def test_get_delivery_week_constant_queries(test_db, sample_data, query_log):
+    """The week snapshot must not issue per-order or per-item queries"""
+    customer = sample_data['customers'][0]
+    items = sample_data['items']
+    monday = datetime(2024, 3, 4).date()
+    
+    for i in range(30):
+        order = Order.create(customer=customer, delivery_date=monday + timedelta(days=i % 7),
+                             production_date=monday, order_id=uuid.uuid4())
+        for item in items:
+            OrderItem.create(order=order, item=item, amount=1.0)
+    # An order without items is reported with an empty item list
+    Order.create(customer=customer, delivery_date=monday, production_date=monday,
+                 order_id=uuid.uuid4())
+    
+    query_log.clear()
+    deliveries = get_delivery_week(monday)
+    
+    # One query for the orders, one for the subscription rules of the week
+    assert len(query_log) == 2
+    assert len(deliveries) == 31
+    assert sum(1 for d in deliveries if not d['items']) == 1
+    assert all(len(d['items']) == 2 for d in deliveries if d['items'])
+
+
+def test_get_transfer_schedule_window(test_db, sample_data):
+    """Transfer dates are computed per item offset and clipped to the requested range"""
+    customer = sample_data['customers'][0]
+    item_a, item_b = sample_data['items']  # offsets 3 and 5 days
+    production_date = datetime(2024, 3, 1).date()
+    
+    order = Order.create(customer=customer, delivery_date=production_date + timedelta(days=10),
+                         production_date=production_date, order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=item_a, amount=2.0)
+    OrderItem.create(order=order, item=item_b, amount=4.0)
+    # Production far outside the window must not show up
+    old = Order.create(customer=customer, delivery_date=datetime(2020, 1, 10).date(),
+                       production_date=datetime(2020, 1, 1).date(), order_id=uuid.uuid4())
+    OrderItem.create(order=old, item=item_a, amount=1.0)
+    
+    monday = datetime(2024, 3, 4).date()
+    transfers = get_transfer_schedule(monday, monday + timedelta(days=6))
+    
+    assert [(t['date'], t['item'], t['amount']) for t in transfers] == [
+        (datetime(2024, 3, 4).date(), "Microgreen A", 2.0),
+        (datetime(2024, 3, 6).date(), "Microgreen B", 4.0),
+    ]
+    # Only the first item falls into a range ending before the second transfer
+    transfers = get_transfer_schedule(monday, monday + timedelta(days=1))
+    assert [t['item'] for t in transfers] == ["Microgreen A"]
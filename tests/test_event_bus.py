@@ -0,0 +1,131 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import Customer, Item, Order, OrderItem
+from changes import day_versions, stamp_days
+from events import EventBus, OrderChanged, ItemChanged, CustomerChanged
+from database import create_subscription, override_occurrence
+from weekly_view import WeeklyDeliveryView, WeeklyProductionView, occurrence_order_dates
+
+MONDAY = datetime(2024, 3, 4).date()
+SUNDAY = MONDAY + timedelta(days=6)
+
+
+class FakeTk:
+    """Collects after_idle() callbacks so the test decides when the Tk loop runs"""
+    def __init__(self):
+        self.idle = []
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+    def run_idle(self):
+        while self.idle:
+            self.idle.pop(0)()
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def handle(self, events):
+        self.calls.append(events)
+
+
+def test_events_are_delivered_once_per_idle():
+    """Several writes of one user action reach every subscriber in one call"""
+    bus = EventBus()
+    tk = FakeTk()
+    bus.attach(tk)
+    orders, catalog = Recorder(), Recorder()
+    bus.subscribe(orders.handle, OrderChanged)
+    bus.subscribe(catalog.handle, ItemChanged, CustomerChanged)
+
+    bus.publish(OrderChanged(frozenset({MONDAY})))
+    bus.publish(OrderChanged(), ItemChanged(frozenset({1})))
+    assert orders.calls == [] and len(tk.idle) == 1
+    tk.run_idle()
+
+    assert orders.calls == [[OrderChanged(frozenset({MONDAY})), OrderChanged()]]
+    assert catalog.calls == [[ItemChanged(frozenset({1}))]]
+
+
+def test_collected_views_are_unsubscribed():
+    """Bound methods are held weakly, a dropped view gets no events"""
+    bus = EventBus()
+    recorder = Recorder()
+    bus.subscribe(recorder.handle, OrderChanged)
+    del recorder
+
+    bus.publish(OrderChanged())
+
+    assert bus.subscribers == []
+
+
+def test_order_changed_scope():
+    """An order touches every day between its production and delivery date"""
+    change = OrderChanged(frozenset({MONDAY - timedelta(days=9), MONDAY - timedelta(days=1)}))
+    assert not change.touches(MONDAY, SUNDAY)
+    assert change.touches(MONDAY - timedelta(days=7), MONDAY - timedelta(days=1))
+    assert OrderChanged().touches(MONDAY, SUNDAY)
+
+
+def test_occurrence_dates_of_unsaved_deliveries(test_db, sample_data):
+    """A subscription delivery without an override still reports its production date"""
+    item = sample_data['items'][0]
+    wednesday = MONDAY + timedelta(days=2)
+    rule = create_subscription(sample_data['customers'][0], 1, wednesday, MONDAY, wednesday + timedelta(weeks=4),
+                               [(item, 1.0)])
+    stand_in = Order(customer=rule.customer, delivery_date=wednesday, subscription=rule, occurrence_date=wednesday)
+    production = wednesday - timedelta(days=item.total_days)
+
+    assert occurrence_order_dates(rule, stand_in) == frozenset({wednesday, production})
+    override = override_occurrence(rule, wednesday, wednesday + timedelta(days=1))
+    assert occurrence_order_dates(rule, override) == frozenset({override.delivery_date, override.production_date})
+
+
+@pytest.fixture
+def drawn_view(test_db):
+    """Views of the week of MONDAY as if drawn, counting their refreshes"""
+    customer = Customer.create(name="Bus Customer")
+    item = Item.create(name="Bus Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+    order = Order.create(customer=customer, delivery_date=MONDAY + timedelta(days=2),
+                         production_date=MONDAY - timedelta(days=4), order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=item, amount=1.0)
+
+    views = []
+    for view_class in (WeeklyDeliveryView, WeeklyProductionView):
+        # Skip the Tk widgets, on_change only needs the week and the drawn versions
+        view = view_class.__new__(view_class)
+        view.current_week = MONDAY
+        view.refreshes = 0
+        view.refresh = lambda view=view: setattr(view, 'refreshes', view.refreshes + 1)
+        view.drawn_versions = stamp_days(day_versions(view.journal_kind, MONDAY, SUNDAY),
+                                         [MONDAY + timedelta(days=i) for i in range(7)])
+        views.append(view)
+    return {'views': views, 'order': order, 'item': item, 'customer': customer}
+
+
+def test_views_refresh_only_when_their_days_changed(drawn_view):
+    """A delivery change refreshes the delivery view, not the production view of another week"""
+    delivery, production = drawn_view['views']
+    OrderItem.update(amount=2.0).execute()
+    events = [OrderChanged(frozenset({MONDAY + timedelta(days=2), MONDAY - timedelta(days=4)}))]
+
+    delivery.on_change(events)
+    production.on_change(events)
+
+    assert (delivery.refreshes, production.refreshes) == (1, 0)
+
+
+def test_new_customer_does_not_refresh_weeks(drawn_view):
+    """Creating a customer shows up nowhere in the weeks, renaming one does"""
+    delivery, _ = drawn_view['views']
+    Customer.create(name="Another Customer")
+    delivery.on_change([CustomerChanged()])
+    assert delivery.refreshes == 0
+
+    Customer.update(name="Renamed").where(Customer.id == drawn_view['customer'].id).execute()
+    delivery.on_change([CustomerChanged(frozenset({drawn_view['customer'].id}))])
+    assert delivery.refreshes == 1
@@ -0,0 +1,254 @@
+import pytest
+from datetime import date
+from models import Customer, Order, OrderItem, Subscription, SubscriptionItem
+from rollups import check_rollups, TRIGGERS
+from customer_stats import check_customer_stats
+from changes import ALL_DAYS, day_versions
+import json
+from importer import OrderImporter, RowError, parse_date, _parse_date, parse_row
+
+HEADER = '"Kunde","Item","Menge","Lieferdatum","Ansaehen","Woche_Wdh","Von","Bis","Preis"\n'
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / 'Orders.csv'
+    # Exports from Excel start with a byte order mark
+    path.write_text(HEADER + ''.join(f'{row}\n' for row in rows), encoding='utf-8-sig')
+    return str(path)
+
+
+def test_parse_date_formats():
+    assert parse_date('04.03.24') == date(2024, 3, 4)
+    assert parse_date(' 04.03.2024 ') == date(2024, 3, 4)
+    with pytest.raises(ValueError):
+        parse_date('2024-03-04')
+
+
+def test_parse_date_is_memoized():
+    _parse_date.cache_clear()
+    for _ in range(3):
+        parse_date('11.03.24')
+    assert (_parse_date.cache_info().misses, _parse_date.cache_info().hits) == (1, 2)
+
+
+def test_parse_row_reports_line():
+    with pytest.raises(RowError) as error:
+        parse_row(7, ['Kunde', 'Item', 'viel', '04.03.24', '', '0', '', ''])
+    assert (error.value.line, error.value.column) == (7, "Menge")
+    assert "viel" in str(error.value)
+    # A subscription needs its period
+    with pytest.raises(RowError):
+        parse_row(8, ['Kunde', 'Item', '1', '04.03.24', '', '1', '', ''])
+
+
+def test_import_groups_rows_into_orders(test_db, sample_data, tmp_path):
+    path = write_csv(tmp_path, [
+        '"Test Customer 1","Microgreen A","1,5","04.03.24","","0","","","5"',
+        '"Test Customer 1","Microgreen B","2","04.03.24","","0","","","5"',
+        '"Neuer Kunde","Microgreen A","1","11.03.24","01.03.24","0","","","5"',
+        '"Test Customer 2","Microgreen B","3","04.03.24","","1","04.03.24","30.12.24","5"',
+        '"Test Customer 2","Microgreen A","1","04.03.24","","1","04.03.24","30.12.24","5"',
+        '"Test Customer 2","Unbekannt","1","04.03.24","","0","","","5"',
+        '"Test Customer 2","Microgreen A","x","04.03.24","","0","","","5"',
+    ])
+    errors = []
+    orders_before = Order.select().count()
+
+    stats = OrderImporter(on_error=errors.append).run(path)
+
+    assert stats == {'rows': 7, 'skipped': 2, 'duplicates': 0, 'inserted': 5, 'updated': 0, 'deleted': 0,
+                     'unchanged': 0, 'orders': 2, 'subscriptions': 1, 'customers': 1}
+    assert [error.line for error in errors] == [7, 8]
+    assert Order.select().count() == orders_before + 2
+    first = Order.get((Order.customer == sample_data['customers'][0]) & (Order.delivery_date == date(2024, 3, 4)))
+    assert sorted(oi.amount for oi in first.order_items) == [1.5, 2.0]
+    assert not first.is_future
+    new_order = Order.get(Order.customer == Customer.get(Customer.name == "Neuer Kunde"))
+    assert new_order.production_date == date(2024, 3, 1)
+    subscription = Subscription.get()
+    assert (subscription.subscription_type, subscription.to_date) == (1, date(2024, 12, 30))
+    assert SubscriptionItem.select().where(SubscriptionItem.subscription == subscription).count() == 2
+
+
+def test_rows_of_one_order_across_batches(test_db, sample_data, tmp_path):
+    """Rows of an order written in an earlier batch are attached to it"""
+    rows = [f'"Test Customer 1","Microgreen {name}","1","04.03.24","","0","","","5"' for name in "AB"]
+    rows += [f'"Test Customer 2","Microgreen {name}","2","04.03.24","","2","04.03.24","30.12.24","5"'
+             for name in "AB"]
+    progress = []
+
+    importer = OrderImporter(batch_size=1, progress=progress.append)
+    importer.chunk_rows = 2
+    stats = importer.run(write_csv(tmp_path, rows))
+
+    assert (stats['orders'], stats['subscriptions']) == (1, 1)
+    order = Order.get(Order.delivery_date == date(2024, 3, 4))
+    assert OrderItem.select().where(OrderItem.order == order).count() == 2
+    assert SubscriptionItem.select().count() == 2
+    assert progress == [2, 4]
+
+
+def test_reimport_is_a_noop(test_db, sample_data, tmp_path, query_log):
+    rows = [f'"Test Customer {n % 2 + 1}","Microgreen {"AB"[n % 3 % 2]}","{n}","{n % 28 + 1:02d}.02.24",'
+            f'"","{n % 3 % 2}","01.02.24","30.12.24","5"' for n in range(60)]
+    path = write_csv(tmp_path, rows)
+    first = OrderImporter().run(path)
+    query_log.clear()
+
+    again = OrderImporter().run(path)
+
+    assert again['unchanged'] == first['inserted'] == 60 - first['duplicates']
+    assert (again['inserted'], again['updated'], again['deleted']) == (0, 0, 0)
+    writes = [sql for sql in query_log if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))
+              and 'import_stage' not in sql]
+    assert writes == []
+
+
+def test_delta_applies_only_changes(test_db, sample_data, tmp_path):
+    """Changed, new and vanished rows are written; manual edits elsewhere stay"""
+    first = [
+        '"Test Customer 1","Microgreen A","1","04.03.24","","0","","","5"',
+        '"Test Customer 1","Microgreen B","2","04.03.24","","0","","","5"',
+        '"Test Customer 2","Microgreen A","3","05.03.24","","0","","","5"',
+        '"Test Customer 2","Microgreen B","4","05.03.24","","1","05.03.24","30.12.24","5"',
+    ]
+    OrderImporter().run(write_csv(tmp_path, first))
+    # Manual edit of an imported order the export doesn't change
+    other = Order.get(Order.customer == sample_data['customers'][1], Order.delivery_date == date(2024, 3, 5))
+    OrderItem.update(amount=9.0).where(OrderItem.order == other).execute()
+    orders_before = Order.select().count()
+
+    stats = OrderImporter().run(write_csv(tmp_path, [
+        '"Test Customer 1","Microgreen A","1,5","04.03.24","","0","","","5"',
+        '"Test Customer 2","Microgreen A","3","05.03.24","","0","","","5"',
+        '"Test Customer 2","Microgreen A","5","05.03.24","","1","05.03.24","30.12.24","5"',
+        '"Test Customer 2","Microgreen B","4","05.03.24","","1","05.03.24","30.12.24","5"',
+        '"Test Customer 2","Microgreen B","6","05.03.24","","1","05.03.24","30.12.24","5"',
+    ]))
+
+    assert {k: stats[k] for k in ('inserted', 'updated', 'deleted', 'unchanged', 'duplicates')} == \
+        {'inserted': 1, 'updated': 2, 'deleted': 1, 'unchanged': 1, 'duplicates': 1}
+    changed = Order.get(Order.customer == sample_data['customers'][0], Order.delivery_date == date(2024, 3, 4))
+    assert [(oi.item.name, oi.amount) for oi in changed.order_items] == [("Microgreen A", 1.5)]
+    assert [oi.amount for oi in other.order_items] == [9.0]
+    # The new item went to the existing rule, the amounts of the duplicate rows add up
+    assert sorted((si.item.name, si.amount) for si in SubscriptionItem.select()) == \
+        [("Microgreen A", 5.0), ("Microgreen B", 10.0)]
+    assert Order.select().count() == orders_before
+    assert check_rollups() == []
+    assert check_customer_stats() == []
+
+
+def test_rows_with_the_same_key_add_up(test_db, sample_data, tmp_path):
+    """Two lines of the same item in one order (like Orders.csv has) keep their total amount"""
+    rows = [
+        '"Test Customer 1","Microgreen A","5","13.01.25","","0","","","5"',
+        '"Test Customer 1","Microgreen B","1","13.01.25","","0","","","5"',
+        '"Test Customer 1","Microgreen A","3","13.01.25","","0","","","5"',
+    ]
+    path = write_csv(tmp_path, rows)
+
+    stats = OrderImporter(batch_size=2).run(path)
+
+    assert (stats['inserted'], stats['duplicates']) == (2, 1)
+    order = Order.get(Order.delivery_date == date(2025, 1, 13))
+    assert sorted((oi.item.name, oi.amount) for oi in order.order_items) == \
+        [("Microgreen A", 8.0), ("Microgreen B", 1.0)]
+    assert check_rollups() == []
+
+    # The same file again changes nothing, a changed line changes the total
+    assert OrderImporter().run(path)['unchanged'] == 2
+    rows[2] = rows[2].replace('"3"', '"4"')
+    assert OrderImporter().run(write_csv(tmp_path, rows))['updated'] == 1
+    assert OrderItem.get(OrderItem.order == order, OrderItem.item == sample_data['items'][0]).amount == 9.0
+
+
+def test_vanished_rows_remove_emptied_orders_only(test_db, sample_data, tmp_path):
+    row = '"Test Customer 1","Microgreen A","1","04.03.24","","0","","","5"'
+    OrderImporter().run(write_csv(tmp_path, [row, row.replace('04.03.24', '11.03.24')]))
+    manual = Order.get(Order.delivery_date == date(2024, 3, 11))
+    OrderItem.create(order=manual, item=sample_data['items'][1], amount=1.0)
+
+    stats = OrderImporter().run(write_csv(tmp_path, []))
+
+    assert stats['deleted'] == 2
+    assert not Order.select().where(Order.delivery_date == date(2024, 3, 4)).exists()
+    # The manually added item keeps its order
+    assert [oi.item.name for oi in manual.order_items] == ["Microgreen B"]
+
+
+def test_rows_matching_existing_orders_are_adopted(test_db, sample_data, tmp_path):
+    """Orders written before the import tracked its rows are not duplicated"""
+    order = sample_data['orders'][0]
+    line = sample_data['order_items'][0]
+    delivery = order.delivery_date.strftime('%d.%m.%Y')
+    path = write_csv(tmp_path, [f'"{order.customer.name}","{line.item.name}","7","{delivery}","","0","","","5"'])
+    orders_before = Order.select().count()
+
+    stats = OrderImporter().run(path)
+
+    assert (stats['inserted'], stats['orders']) == (1, 0)
+    assert Order.select().count() == orders_before
+    assert OrderItem.get_by_id(line.id).amount == 7.0
+
+
+INVALID = [
+    '"Test Customer 1","Microgreen A","1","04.03.24","","0","","","5"',
+    '"Test Customer 1","Microgreen X","1","04.03.24","","0","","","5"',
+    '"Neuer Kunde","Microgreen B","2","31.02.24","","0","","","5"',
+    '"Neuer Kunde","Microgreen B","2","05.03.24","","1","","30.12.24","5"',
+    '"Neuer Kunde","Microgreen B","2","05.03.24","","0","","","5"',
+]
+
+
+def test_dry_run_writes_nothing(test_db, sample_data, tmp_path, query_log):
+    """Validation and the diff run without writing; the counts tell what would happen"""
+    query_log.clear()
+    importer = OrderImporter()
+
+    stats = importer.run(write_csv(tmp_path, INVALID), dry_run=True)
+
+    assert {k: stats[k] for k in ('rows', 'skipped', 'inserted', 'customers')} == \
+        {'rows': 5, 'skipped': 3, 'inserted': 2, 'customers': 1}
+    writes = [sql for sql in query_log if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))
+              and 'import_stage' not in sql]
+    assert writes == []
+    assert not Customer.select().where(Customer.name == "Neuer Kunde").exists()
+    report = json.loads(json.dumps(importer.error_report()))
+    assert report['rows'] == 5
+    assert report['errors'] == [
+        {'line': 3, 'column': 'Item', 'reason': "unbekanntes Item 'Microgreen X'"},
+        {'line': 4, 'column': 'Lieferdatum', 'reason': "ungültiges Datum '31.02.24'"},
+        {'line': 5, 'column': 'Von', 'reason': 'fehlt bei einem Abonnement'},
+    ]
+
+
+def test_parallel_validation_matches_inline(test_db, sample_data, tmp_path):
+    path = write_csv(tmp_path, INVALID * 3)
+    inline = OrderImporter(workers=1)
+    inline.run(path, dry_run=True)
+    parallel = OrderImporter(workers=2)
+    parallel.chunk_rows = 4
+
+    assert parallel.run(path, dry_run=True) == inline.stats
+    assert parallel.error_report() == inline.error_report()
+
+
+def test_derived_tables_are_rebuilt(test_db, sample_data, tmp_path):
+    """The triggers are back after the import and the derived tables match the orders"""
+    path = write_csv(tmp_path, [
+        f'"Test Customer {n % 2 + 1}","Microgreen A","{n}","{n % 28 + 1:02d}.02.24","","0","","","5"'
+        for n in range(50)
+    ])
+    version = day_versions('delivery', ALL_DAYS, ALL_DAYS).get(ALL_DAYS, 0)
+    importer = OrderImporter(batch_size=7)
+    importer.bulk_threshold = 10
+
+    importer.run(path)
+
+    assert check_rollups() == []
+    assert check_customer_stats() == []
+    installed = {row[0] for row in test_db.execute_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert set(TRIGGERS) <= installed
+    # Open weekly views redraw everything
+    assert day_versions('delivery', ALL_DAYS, ALL_DAYS)[ALL_DAYS] > version
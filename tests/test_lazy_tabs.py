@@ -0,0 +1,73 @@
+import pytest
+import time
+import tkinter as tk
+from events import bus
+
+main = pytest.importorskip("main")
+
+LAZY_ATTRIBUTES = ['production_view', 'transfer_view', 'customer_view', 'item_view', 'customer_tree', 'item_combo']
+
+
+class FakeNotebook:
+    def __init__(self, selected):
+        self.selected = selected
+
+    def select(self):
+        return self.selected
+
+
+class FakeApp:
+    """Just the state build_tab and on_tab_changed use"""
+    build_tab = main.ProductionApp.build_tab
+    on_tab_changed = main.ProductionApp.on_tab_changed
+
+    def __init__(self):
+        self.built = []
+        self.notebook = FakeNotebook('.!notebook.!frame2')
+        self.tab_builders = {
+            '.!notebook.!frame2': lambda: self.built.append('delivery'),
+            '.!notebook.!frame7': lambda: self.built.append('orders'),
+        }
+
+
+def test_tabs_are_built_once_on_first_selection():
+    app = FakeApp()
+    app.on_tab_changed()
+    app.notebook.selected = '.!notebook.!frame7'
+    app.on_tab_changed()
+    app.on_tab_changed()
+    app.notebook.selected = '.!notebook.!frame2'
+    app.on_tab_changed()
+
+    assert app.built == ['delivery', 'orders']
+    assert app.tab_builders == {}
+
+
+@pytest.fixture
+def display():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("needs a display")
+    root.destroy()
+
+
+def test_startup_builds_only_the_visible_tab(display, sample_data, query_log):
+    """Startup draws the Lieferung tab; the customer and item statistics wait for their tab"""
+    began = time.perf_counter()
+    app = main.ProductionApp()
+    app.update()
+    startup = time.perf_counter() - began
+    try:
+        assert hasattr(app, 'delivery_view')
+        assert [name for name in LAZY_ATTRIBUTES if hasattr(app, name)] == []
+        assert not [sql for sql in query_log if 'customer_stats' in sql]
+        assert startup < 2.0
+
+        app.notebook.select(app.tab7)
+        app.update()
+        assert hasattr(app, 'customer_tree')
+        assert [sql for sql in query_log if 'customer_stats' in sql]
+    finally:
+        app.destroy()
+        bus.attach(None)
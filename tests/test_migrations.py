@@ -0,0 +1,164 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import db, Customer, Item, Subscription, Order, OrderItem, ProductionRollup
+from migrations import migrate, get_schema_version, MIGRATIONS, derived_triggers, sync_derived_triggers
+
+
+@pytest.fixture
+def legacy_db():
+    """An unversioned database as created before the migration subsystem existed"""
+    db.init(':memory:')
+    db.connect()
+    # Order references subscription, which must exist for inserts under foreign key enforcement
+    db.create_tables([Customer, Item, Subscription, Order, OrderItem])
+
+    customer = Customer.create(name="Legacy Customer")
+    item = Item.create(name="Legacy Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+
+    yield {'db': db, 'customer': customer, 'item': item}
+
+    db.close()
+
+
+def explain(test_db, query):
+    """Return the EXPLAIN QUERY PLAN detail lines for a peewee query"""
+    sql, params = query.sql()
+    return [row[-1] for row in test_db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def delivery_week_query(monday):
+    # Same shape as database.get_delivery_schedule
+    return (Order
+            .select(Order, Customer)
+            .join(Customer)
+            .where((Order.delivery_date >= monday) &
+                   (Order.delivery_date <= monday + timedelta(days=6)))
+            .order_by(Order.delivery_date))
+
+
+def production_week_query(monday):
+    return (Order
+            .select(Order.production_date)
+            .where((Order.production_date >= monday) &
+                   (Order.production_date <= monday + timedelta(days=6))))
+
+
+def test_migrate_unversioned_database(legacy_db):
+    """An existing database without schema_version is upgraded to the latest version"""
+    test_db = legacy_db['db']
+    order = Order.create(customer=legacy_db['customer'], delivery_date=datetime(2024, 3, 8).date(),
+                         production_date=datetime(2024, 3, 2).date(), order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=legacy_db['item'], amount=2.0)
+    assert get_schema_version(test_db) == 0
+
+    applied = migrate(test_db)
+
+    assert applied == [version for version, _, _ in MIGRATIONS]
+    assert get_schema_version(test_db) == MIGRATIONS[-1][0]
+
+    index_names = {index.name for index in test_db.get_indexes('order')}
+    assert 'order_delivery_date' in index_names
+    assert 'order_production_date' in index_names
+    assert 'order_customer_id_from_date_to_date' in index_names
+
+    # Existing data survives the upgrade and is rolled up
+    assert Order.select().count() == 1
+    assert OrderItem.select().count() == 1
+    assert ProductionRollup.get().total_amount == 2.0
+
+
+def test_migrate_is_idempotent(legacy_db):
+    """Running migrate on an up-to-date database does nothing"""
+    migrate(legacy_db['db'])
+    assert migrate(legacy_db['db']) == []
+
+
+def test_week_queries_use_date_indexes(legacy_db):
+    """EXPLAIN QUERY PLAN before and after the index migration"""
+    test_db = legacy_db['db']
+    customer = legacy_db['customer']
+    item = legacy_db['item']
+    start = datetime(2024, 1, 1).date()
+    for i in range(200):
+        delivery_date = start + timedelta(days=i)
+        order = Order.create(customer=customer, delivery_date=delivery_date,
+                             production_date=delivery_date - timedelta(days=item.total_days),
+                             order_id=uuid.uuid4())
+        OrderItem.create(order=order, item=item, amount=1.0)
+    test_db.execute_sql('ANALYZE')
+
+    monday = datetime(2024, 3, 4).date()
+
+    before_delivery = explain(test_db, delivery_week_query(monday))
+    before_production = explain(test_db, production_week_query(monday))
+    print("Delivery plan before:", before_delivery)
+    print("Production plan before:", before_production)
+    # Without date indexes every order row is visited and sorted afterwards
+    assert not any('order_delivery_date' in line for line in before_delivery)
+    assert any('TEMP B-TREE' in line for line in before_delivery)
+    assert any(line.startswith('SCAN') for line in before_production)
+
+    migrate(test_db)
+    test_db.execute_sql('ANALYZE')
+
+    after_delivery = explain(test_db, delivery_week_query(monday))
+    after_production = explain(test_db, production_week_query(monday))
+    print("Delivery plan after:", after_delivery)
+    print("Production plan after:", after_production)
+    assert any('USING INDEX order_delivery_date' in line for line in after_delivery)
+    assert any('order_production_date' in line for line in after_production)
+
+
+
+def test_migrate_adds_subscription_columns(legacy_db):
+    """Order tables from before the subscription rules get the override columns"""
+    test_db = legacy_db['db']
+    # Order table as created by the models before the rules existed
+    test_db.drop_tables([OrderItem, Order])
+    test_db.execute_sql(
+        'CREATE TABLE "order" ("id" INTEGER NOT NULL PRIMARY KEY, "customer_id" INTEGER NOT NULL, '
+        '"delivery_date" DATE NOT NULL, "production_date" DATE NOT NULL, "from_date" DATE, "to_date" DATE, '
+        '"subscription_type" INTEGER NOT NULL, "halbe_channel" INTEGER NOT NULL, "order_id" TEXT NOT NULL, '
+        '"is_future" INTEGER NOT NULL, "created_at" DATETIME NOT NULL, '
+        'FOREIGN KEY ("customer_id") REFERENCES "customer" ("id"))'
+    )
+    # models.create_tables() runs on the old table before migrating
+    test_db.create_tables([Order, OrderItem])
+
+    migrate(test_db)
+
+    columns = {column.name for column in test_db.get_columns('order')}
+    assert {'subscription_id', 'occurrence_date'} <= columns
+    index = test_db.execute_sql(
+        "SELECT sql FROM sqlite_master WHERE name = 'order_subscription_id'").fetchone()[0]
+    assert index == 'CREATE INDEX "order_subscription_id" ON "order" ("subscription_id")'
+    assert {'subscription', 'subscriptionitem'} <= set(test_db.get_tables())
+
+
+def installed_triggers(test_db):
+    return dict(test_db.execute_sql("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+
+
+def test_migrate_syncs_derived_triggers(legacy_db):
+    """migrate installs the triggers of the code and replaces edited or leftover ones on later starts"""
+    test_db = legacy_db['db']
+    migrate(test_db)
+    assert set(installed_triggers(test_db)) == set(derived_triggers())
+    assert sync_derived_triggers(test_db) == []
+
+    # A trigger as an older version installed it, and one the code no longer defines
+    test_db.execute_sql('DROP TRIGGER "production_rollup_orderitem_insert"')
+    test_db.execute_sql('CREATE TRIGGER "production_rollup_orderitem_insert" AFTER INSERT ON orderitem '
+                        'BEGIN SELECT 1; END')
+    test_db.execute_sql('CREATE TRIGGER "customer_stats_obsolete" AFTER INSERT ON item BEGIN SELECT 1; END')
+
+    assert migrate(test_db) == []
+    assert set(installed_triggers(test_db)) == set(derived_triggers())
+
+    # The reinstalled trigger rolls up again
+    order = Order.create(customer=legacy_db['customer'], delivery_date=datetime(2024, 5, 6).date(),
+                         production_date=datetime(2024, 5, 1).date(), order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=legacy_db['item'], amount=3.0)
+    assert ProductionRollup.get(ProductionRollup.production_date == order.production_date).total_amount == 3.0
@@ -0,0 +1,83 @@
+import pytest
+import os
+import time
+from datetime import date, timedelta
+from models import OrderItem
+import print_schedules
+from print_schedules import SchedulePrinter
+
+
+@pytest.fixture
+def printer(tmp_path, monkeypatch):
+    printer = SchedulePrinter(str(tmp_path))
+    rendered = []
+    render_week = printer.render_week
+    monkeypatch.setattr(printer, 'render_week', lambda *args: rendered.append(args[1]) or render_week(*args))
+    printer.rendered = rendered
+    return printer
+
+
+def test_unchanged_week_returns_the_printed_file(sample_data, printer):
+    week = sample_data['orders'][0].delivery_date
+
+    first = printer.print_week_schedule("delivery", week)
+    second = printer.print_week_schedule("delivery", week + timedelta(days=1))
+
+    assert first == second
+    assert printer.rendered == ["delivery"]
+    assert os.path.basename(first).startswith(
+        f"delivery_schedule_{(week - timedelta(days=week.weekday())).strftime('%Y%m%d')}_")
+
+
+def test_changed_data_or_renderer_prints_again(sample_data, printer, monkeypatch):
+    week = sample_data['orders'][0].delivery_date
+    first = printer.print_week_schedule("delivery", week)
+
+    OrderItem.update(amount=4.0).where(OrderItem.id == sample_data['order_items'][0].id).execute()
+    changed = printer.print_week_schedule("delivery", week)
+    monkeypatch.setattr(print_schedules, 'RENDERER_VERSION', print_schedules.RENDERER_VERSION + 1)
+    new_renderer = printer.print_week_schedule("delivery", week)
+
+    assert len({first, changed, new_renderer}) == 3
+    assert printer.rendered == ["delivery"] * 3
+
+
+def test_all_schedules_are_cached(sample_data, printer):
+    week = sample_data['orders'][0].delivery_date
+    assert printer.print_all_schedules(week) == printer.print_all_schedules(week)
+    assert len(os.listdir(printer.output_dir)) == 1
+
+
+def test_eviction_by_age_and_size(tmp_path):
+    printer = SchedulePrinter(str(tmp_path))
+    printer.max_bytes = 3000
+    now = time.time()
+
+    def pdf(name, size, age_days):
+        path = os.path.join(printer.output_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+        return path
+
+    expired = pdf('expired.pdf', 10, 100)
+    oldest = pdf('oldest.pdf', 1000, 5)
+    older = pdf('older.pdf', 1000, 4)
+    kept = pdf('kept.pdf', 1000, 3)
+    newest = pdf('newest.pdf', 1000, 1)
+    other = pdf('notes.txt', 5000, 200)
+
+    assert printer.evict(keep={oldest}) == [expired, older]
+    assert sorted(os.listdir(printer.output_dir)) == ['kept.pdf', 'newest.pdf', 'notes.txt', 'oldest.pdf']
+
+
+def test_cache_hit_counts_as_use(sample_data, printer):
+    week = sample_data['orders'][0].delivery_date
+    path = printer.print_week_schedule("delivery", week)
+    old = time.time() - 200 * 86400
+    os.utime(path, (old, old))
+
+    printer.print_week_schedule("delivery", week)
+
+    assert printer.evict() == []
+    assert os.path.exists(path)
@@ -0,0 +1,64 @@
+import pytest
+from peewee import SqliteDatabase, OperationalError
+from models import (PRAGMA_PROFILES, DEFAULT_PROFILE, PROFILE_ENV, KleinblattDatabase, pragma_profile,
+                    configure_database, describe_database)
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """A separate database on disk, so the shared db keeps its profile"""
+    database = SqliteDatabase(str(tmp_path / 'profile.db'))
+    yield database
+    database.close()
+
+
+def test_profile_selection(monkeypatch):
+    """Explicit name first, then the environment variable, then the default"""
+    monkeypatch.delenv(PROFILE_ENV, raising=False)
+    assert pragma_profile() == DEFAULT_PROFILE
+    monkeypatch.setenv(PROFILE_ENV, 'fast')
+    assert pragma_profile() == 'fast'
+    assert pragma_profile('safe') == 'safe'
+    monkeypatch.setenv(PROFILE_ENV, 'turbo')
+    with pytest.raises(ValueError):
+        pragma_profile()
+
+
+@pytest.mark.parametrize('profile', ['safe', 'fast'])
+def test_profile_applied_on_connect(file_db, profile):
+    """Every pragma of the profile is in effect on a new connection"""
+    assert configure_database(profile, database=file_db) == profile
+    file_db.connect()
+
+    effective = describe_database(file_db)
+
+    for name, value in PRAGMA_PROFILES[profile].items():
+        assert effective[name] == value
+
+
+def test_readonly_report_is_not_a_main_profile(monkeypatch, file_db):
+    """The main connection migrates and saves, the read-only profile is refused with a clear error"""
+    with pytest.raises(ValueError, match="only used by the read-only reporting connections"):
+        configure_database('readonly-report', database=file_db)
+    monkeypatch.setenv(PROFILE_ENV, 'readonly-report')
+    with pytest.raises(ValueError, match="expected one of: safe, fast"):
+        pragma_profile()
+
+
+def test_reporting_connection_uses_readonly_report(tmp_path):
+    """db.reporting() connections get the readonly-report pragmas and can read but not write"""
+    database = KleinblattDatabase(str(tmp_path / 'report.db'))
+    configure_database('fast', database=database)
+    database.execute_sql('CREATE TABLE note (text TEXT)')
+    database.execute_sql("INSERT INTO note VALUES ('hello')")
+    try:
+        with database.reporting():
+            effective = describe_database(database)
+            assert effective['query_only'] == 1
+            assert effective['cache_size'] == PRAGMA_PROFILES['readonly-report']['cache_size']
+            assert database.execute_sql('SELECT text FROM note').fetchall() == [('hello',)]
+            with pytest.raises(OperationalError):
+                database.execute_sql("INSERT INTO note VALUES ('again')")
+    finally:
+        database.close_reporting()
+        database.close()
@@ -0,0 +1,147 @@
+import pytest
+from datetime import datetime, timedelta
+from peewee import IntegrityError
+import uuid
+from models import Customer, Item, Order, OrderItem, ProductionRollup
+from database import get_production_plan, get_production_week
+from rollups import check_rollups, rebuild_rollups
+
+
+def rollup_totals(start_date, end_date):
+    """Rollup contents as {(date, item name): amount}"""
+    return {
+        (row.production_date, row.item.name): row.total_amount
+        for row in ProductionRollup.select().where(
+            (ProductionRollup.production_date >= start_date) &
+            (ProductionRollup.production_date <= end_date))
+    }
+
+
+def plan_totals(start_date, end_date):
+    """get_production_plan contents as {(date, item name): amount}"""
+    return {
+        (row.order.production_date, row.item.name): row.total_amount
+        for row in get_production_plan(start_date, end_date)
+    }
+
+
+def test_rollup_filled_for_existing_orders(test_db, sample_data):
+    """Orders written through the ORM are reflected in the rollup"""
+    today = datetime.now().date()
+
+    assert rollup_totals(today, today) == plan_totals(today, today)
+    assert rollup_totals(today, today)[(today, "Microgreen A")] == 5.5
+    assert check_rollups() == []
+
+
+def test_rollup_follows_item_and_order_edits(test_db, sample_data):
+    """Item amount changes, date changes and deletions keep the rollup consistent"""
+    today = datetime.now().date()
+    order = sample_data['orders'][0]
+
+    # Change an item amount
+    order_item = sample_data['order_items'][0]
+    order_item.amount = 10.0
+    order_item.save()
+    assert rollup_totals(today, today)[(today, "Microgreen A")] == 13.0
+
+    # Move the order to another production date
+    order.production_date = today + timedelta(days=1)
+    order.save()
+    assert rollup_totals(today, today)[(today, "Microgreen A")] == 3.0
+    assert (today, "Microgreen B") not in rollup_totals(today, today)
+    tomorrow = today + timedelta(days=1)
+    assert rollup_totals(tomorrow, tomorrow) == {(tomorrow, "Microgreen A"): 10.0,
+                                                 (tomorrow, "Microgreen B"): 1.5}
+
+    # Recursive delete removes the items first, then the order
+    order.delete_instance(recursive=True)
+    assert rollup_totals(tomorrow, tomorrow) == {}
+    assert check_rollups() == []
+
+
+def test_rollup_follows_bulk_writes(test_db, sample_data):
+    """Bulk updates and bare Order.delete() calls leaving orphaned items"""
+    today = datetime.now().date()
+    sub_order = sample_data['orders'][1]
+
+    # Moving the subscription range so the delivery falls outside uncounts the order
+    Order.update(from_date=today + timedelta(days=20)).where(Order.id == sub_order.id).execute()
+    assert rollup_totals(today, today)[(today, "Microgreen A")] == 2.5
+
+    # With foreign keys enforced an order can't be deleted before its items
+    with pytest.raises(IntegrityError):
+        Order.delete().where(Order.id == sample_data['orders'][0].id).execute()
+
+    # Databases written without enforcement may hold orphaned items, they must not count
+    test_db.pragma('foreign_keys', 0)
+    Order.delete().where(Order.id == sample_data['orders'][0].id).execute()
+    test_db.pragma('foreign_keys', 1)
+    assert rollup_totals(today, today) == {}
+    assert check_rollups() == []
+
+
+def test_rollup_bulk_insert(test_db, sample_data):
+    """insert_many of order items fires the triggers for every row"""
+    customer = sample_data['customers'][0]
+    item = sample_data['items'][1]
+    production_date = datetime(2024, 3, 4).date()
+
+    order = Order.create(customer=customer, delivery_date=production_date + timedelta(days=10),
+                         production_date=production_date, order_id=uuid.uuid4())
+    OrderItem.insert_many([{'order': order, 'item': item, 'amount': 1.0} for _ in range(5)]).execute()
+
+    assert rollup_totals(production_date, production_date) == {(production_date, "Microgreen B"): 5.0}
+
+
+def test_get_production_week(test_db, sample_data):
+    """Week reads come from the rollup, sorted by date and item name"""
+    today = datetime.now().date()
+    monday = today - timedelta(days=today.weekday())
+
+    week = get_production_week(monday)
+
+    assert [(p['date'], p['item'], p['amount']) for p in week] == [
+        (today, "Microgreen A", 5.5),
+        (today, "Microgreen B", 1.5),
+    ]
+    assert week[1]['seed_quantity'] == 0.15
+    assert week[1]['substrate'] == "Substrate 2"
+
+
+def test_production_week_is_index_range_scan(test_db, sample_data):
+    """The week read is a single range scan over the rollup index"""
+    monday = datetime(2024, 3, 4).date()
+    item = sample_data['items'][0]
+    ProductionRollup.insert_many([
+        {'production_date': monday + timedelta(days=i), 'item': item, 'total_amount': 1.0}
+        for i in range(-200, 200)
+    ]).execute()
+    test_db.execute_sql('ANALYZE')
+
+    query = (ProductionRollup
+             .select(ProductionRollup.production_date, ProductionRollup.total_amount)
+             .where((ProductionRollup.production_date >= monday) &
+                    (ProductionRollup.production_date <= monday + timedelta(days=6))))
+    sql, params = query.sql()
+    plan = [row[-1] for row in test_db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+
+    assert any('productionrollup_production_date_item_id' in line for line in plan)
+
+
+def test_check_and_rebuild_repair_inconsistencies(test_db, sample_data):
+    """The checker reports drift and rebuild_rollups repairs it"""
+    today = datetime.now().date()
+    item = sample_data['items'][0]
+
+    # Simulate drift, e.g. from a write made while the triggers were missing
+    ProductionRollup.update(total_amount=99.0).where(ProductionRollup.item == item).execute()
+    ProductionRollup.create(production_date=today - timedelta(days=30), item=item, total_amount=1.0)
+
+    mismatches = check_rollups()
+    assert (today, item.id, 5.5, 99.0) in mismatches
+    assert (today - timedelta(days=30), item.id, None, 1.0) in mismatches
+
+    assert rebuild_rollups() == 2
+    assert check_rollups() == []
+    assert rollup_totals(today, today) == plan_totals(today, today)
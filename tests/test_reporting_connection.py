@@ -0,0 +1,87 @@
+import pytest
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import uuid
+from peewee import OperationalError
+from models import db, Customer, Item, Order, OrderItem, create_tables
+from database import get_delivery_week
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """The shared db on a WAL database file with one order"""
+    path = str(tmp_path / 'reporting.db')
+    db.init(path)
+    create_tables()
+    customer = Customer.create(name="Report Customer")
+    item = Item.create(name="Report Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+    order = Order.create(customer=customer, delivery_date=MONDAY + timedelta(days=2),
+                         production_date=MONDAY - timedelta(days=4), order_id=uuid.uuid4())
+    OrderItem.create(order=order, item=item, amount=2.0)
+
+    yield {'path': path, 'customer': customer}
+
+    db.close_reporting()
+    db.close()
+
+
+def test_reporting_uses_read_only_connection(file_db):
+    """Reporting queries see committed data, can't write and leave the editing connection in place"""
+    editor_conn = db.connection()
+
+    with db.reporting():
+        assert db.connection() is not editor_conn
+        assert [d['customer'] for d in get_delivery_week(MONDAY)] == ["Report Customer"]
+        with pytest.raises(OperationalError):
+            Customer.create(name="Not allowed")
+
+    assert db.connection() is editor_conn
+    Customer.create(name="Allowed again")
+    # The reporting connection is kept for the next report
+    with db.reporting():
+        first = db.connection()
+    with db.reporting():
+        assert db.connection() is first
+        assert Customer.select().count() == 2
+
+
+def test_reporting_is_not_blocked_by_a_writer(file_db):
+    """A long write transaction on another connection doesn't block reports"""
+    writer = sqlite3.connect(file_db['path'], isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    writer.execute("INSERT INTO customer (name, created_at) VALUES ('Uncommitted', '2024-03-04')")
+    result = {}
+
+    def report():
+        with db.reporting():
+            result['names'] = [c.name for c in Customer.select().order_by(Customer.name)]
+        db.close_reporting()
+
+    thread = threading.Thread(target=report)
+    thread.start()
+    thread.join(timeout=2)
+
+    writer.execute('ROLLBACK')
+    writer.close()
+    assert not thread.is_alive()
+    assert result['names'] == ["Report Customer"]
+
+
+def test_reporting_inside_transaction_reads_own_writes(file_db):
+    """Inside a transaction reports stay on the editing connection"""
+    with db.atomic():
+        Customer.create(name="In transaction")
+        with db.reporting():
+            assert Customer.select().count() == 2
+
+
+def test_reporting_on_memory_database(test_db, sample_data):
+    """An in-memory database has no second connection, reports share the editing one"""
+    editor_conn = test_db.connection()
+    with test_db.reporting():
+        assert test_db.connection() is editor_conn
+        assert Customer.select().count() == 2
@@ -0,0 +1,184 @@
+import pytest
+from datetime import datetime, timedelta
+from models import Order, OrderItem, Subscription, SubscriptionItem
+from database import (
+    create_subscription, subscription_dates, expand_subscriptions, override_occurrence,
+    update_subscription, end_subscription, subscription_snapshot, restore_subscription,
+    get_delivery_week, get_production_week, get_transfer_schedule
+)
+from rollups import check_rollups
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+@pytest.fixture
+def weekly_rule(test_db, sample_data):
+    """Weekly subscription delivered on Wednesdays for 52 weeks"""
+    customer = sample_data['customers'][0]
+    item_a, item_b = sample_data['items']
+    wednesday = MONDAY + timedelta(days=2)
+    return create_subscription(customer, 1, wednesday, MONDAY, wednesday + timedelta(weeks=51),
+                               [(item_a, 2.0), (item_b, 1.0)])
+
+
+def week_deliveries(monday, customer_name="Test Customer 1"):
+    return [d for d in get_delivery_week(monday) if d['customer'] == customer_name]
+
+
+def test_create_subscription_writes_only_the_rule(weekly_rule):
+    """A year of weekly deliveries is one rule row plus its item lines"""
+    assert Subscription.select().count() == 1
+    assert SubscriptionItem.select().count() == 2
+    assert Order.select().where(Order.subscription.is_null(False)).count() == 0
+    assert len(subscription_dates(weekly_rule, MONDAY, weekly_rule.to_date)) == 52
+
+
+def test_subscription_dates_follow_anchor_and_range(weekly_rule):
+    """Occurrences keep the anchor's rhythm and stay within from/to"""
+    weekly_rule.subscription_type = 2
+    weekly_rule.from_date = MONDAY + timedelta(days=10)
+    weekly_rule.to_date = MONDAY + timedelta(days=60)
+
+    dates = subscription_dates(weekly_rule, MONDAY, MONDAY + timedelta(days=100))
+
+    assert dates[0] == weekly_rule.anchor_date + timedelta(days=14)
+    assert all((d - weekly_rule.anchor_date).days % 14 == 0 for d in dates)
+    assert dates[-1] <= weekly_rule.to_date
+    assert subscription_dates(weekly_rule, dates[1], dates[1]) == [dates[1]]
+
+
+def test_schedules_expand_occurrences(weekly_rule):
+    """Delivery, production and transfer plans see the rule's deliveries"""
+    next_monday = MONDAY + timedelta(weeks=1)
+    wednesday = next_monday + timedelta(days=2)
+
+    deliveries = week_deliveries(next_monday)
+    assert len(deliveries) == 1
+    assert deliveries[0]['id'] is None
+    assert deliveries[0]['subscription_id'] == weekly_rule.id
+    assert deliveries[0]['date'] == wednesday
+    assert deliveries[0]['items'] == [("Microgreen A", 2.0), ("Microgreen B", 1.0)]
+
+    # Microgreen B needs 10 days, so production starts 10 days before each delivery
+    production_date = wednesday - timedelta(days=10)
+    production_monday = production_date - timedelta(days=production_date.weekday())
+    production = [(p['date'], p['item'], p['amount']) for p in get_production_week(production_monday)]
+    assert (production_date, "Microgreen A", 2.0) in production
+    assert (production_date, "Microgreen B", 1.0) in production
+
+    transfers = get_transfer_schedule(production_date, production_date + timedelta(days=6))
+    assert {'date': production_date + timedelta(days=3), 'item': "Microgreen A", 'amount': 2.0} in transfers
+    assert {'date': production_date + timedelta(days=5), 'item': "Microgreen B", 'amount': 1.0} in transfers
+
+
+def test_override_replaces_single_occurrence(weekly_rule, sample_data):
+    """An "only this" edit materializes exactly one order"""
+    occurrence = MONDAY + timedelta(weeks=2, days=2)
+    item_a = sample_data['items'][0]
+
+    override = override_occurrence(weekly_rule, occurrence, occurrence + timedelta(days=1), [(item_a, 5.0)])
+
+    deliveries = week_deliveries(MONDAY + timedelta(weeks=2))
+    assert len(deliveries) == 1
+    assert deliveries[0]['id'] == override.id
+    assert deliveries[0]['subscription_id'] == weekly_rule.id
+    assert deliveries[0]['items'] == [("Microgreen A", 5.0)]
+    # Editing the override again updates it in place
+    override_occurrence(weekly_rule, occurrence, items=[(item_a, 6.0)])
+    assert Order.select().where(Order.subscription == weekly_rule).count() == 1
+    # The other weeks are untouched
+    assert week_deliveries(MONDAY + timedelta(weeks=3))[0]['id'] is None
+    assert check_rollups() == []
+
+
+def test_cancelled_occurrence_leaves_the_plans(weekly_rule):
+    """An override without items hides the delivery"""
+    occurrence = MONDAY + timedelta(weeks=2, days=2)
+
+    override_occurrence(weekly_rule, occurrence, items=[])
+
+    assert [d['items'] for d in week_deliveries(MONDAY + timedelta(weeks=2))] == [[]]
+    production = expand_subscriptions(occurrence, occurrence)
+    assert production == []
+
+
+def test_update_from_first_occurrence_is_in_place(weekly_rule, sample_data):
+    """A "this and future" edit on the first delivery rewrites the rule rows only"""
+    item_a = sample_data['items'][0]
+    first = weekly_rule.anchor_date
+    override_occurrence(weekly_rule, first + timedelta(weeks=4))
+
+    holder = update_subscription(weekly_rule, first, first + timedelta(days=1), 2,
+                                 weekly_rule.from_date, weekly_rule.to_date, [(item_a, 3.0)], True)
+
+    assert holder.id == weekly_rule.id
+    assert Subscription.select().count() == 1
+    assert Order.select().where(Order.subscription == weekly_rule).count() == 0
+    deliveries = week_deliveries(MONDAY)
+    assert deliveries[0]['date'] == first + timedelta(days=1)
+    assert deliveries[0]['items'] == [("Microgreen A", 3.0)]
+    assert deliveries[0]['halbe_channel'] is True
+    # Biweekly now
+    assert week_deliveries(MONDAY + timedelta(weeks=1)) == []
+
+
+def test_update_from_later_occurrence_splits_rule(weekly_rule, sample_data):
+    """Earlier deliveries keep the old rule, later ones follow the new one"""
+    item_b = sample_data['items'][1]
+    occurrence = weekly_rule.anchor_date + timedelta(weeks=10)
+    old_override = override_occurrence(weekly_rule, weekly_rule.anchor_date + timedelta(weeks=2))
+    later_override = override_occurrence(weekly_rule, occurrence + timedelta(weeks=2))
+
+    holder = update_subscription(weekly_rule, occurrence, occurrence, 1,
+                                 occurrence, weekly_rule.to_date, [(item_b, 4.0)], False)
+
+    weekly_rule = Subscription.get_by_id(weekly_rule.id)
+    assert holder.id != weekly_rule.id
+    assert weekly_rule.to_date == occurrence - timedelta(days=1)
+    assert Order.get_or_none(Order.id == old_override.id) is not None
+    assert Order.get_or_none(Order.id == later_override.id) is None
+
+    week_before = occurrence - timedelta(weeks=1)
+    assert week_deliveries(week_before - timedelta(days=2))[0]['items'] == [("Microgreen A", 2.0), ("Microgreen B", 1.0)]
+    assert week_deliveries(occurrence - timedelta(days=2))[0]['items'] == [("Microgreen B", 4.0)]
+
+
+def test_update_to_single_order_ends_rule(weekly_rule, sample_data):
+    """Switching to "Kein Abonnement" ends the rule and keeps one order"""
+    item_a = sample_data['items'][0]
+    occurrence = weekly_rule.anchor_date + timedelta(weeks=3)
+
+    holder = update_subscription(weekly_rule, occurrence, occurrence, 0, None, None, [(item_a, 1.0)], False)
+
+    assert isinstance(holder, Order)
+    assert holder.subscription_id is None
+    assert Subscription.get_by_id(weekly_rule.id).to_date == occurrence - timedelta(days=1)
+    assert [d['id'] for d in week_deliveries(occurrence - timedelta(days=2))] == [holder.id]
+    assert week_deliveries(occurrence + timedelta(weeks=1) - timedelta(days=2)) == []
+
+
+def test_end_subscription_before_first_deletes_rule(weekly_rule):
+    """Deleting "this and future" from the first delivery removes the rule"""
+    override_occurrence(weekly_rule, weekly_rule.anchor_date + timedelta(weeks=1))
+
+    end_subscription(weekly_rule, weekly_rule.anchor_date)
+
+    assert Subscription.select().count() == 0
+    assert SubscriptionItem.select().count() == 0
+    assert Order.select().where(Order.subscription.is_null(False)).count() == 0
+
+
+def test_snapshot_restore_roundtrip(weekly_rule, sample_data):
+    """Undo restores the rule, its items and its overrides"""
+    item_a = sample_data['items'][0]
+    override_occurrence(weekly_rule, weekly_rule.anchor_date + timedelta(weeks=1), items=[(item_a, 9.0)])
+    snapshot = subscription_snapshot(weekly_rule)
+    before = get_delivery_week(MONDAY + timedelta(weeks=1))
+
+    end_subscription(weekly_rule, weekly_rule.anchor_date)
+    restore_subscription(snapshot)
+
+    after = get_delivery_week(MONDAY + timedelta(weeks=1))
+    assert [(d['date'], d['items']) for d in after] == [(d['date'], d['items']) for d in before]
+    assert SubscriptionItem.select().count() == 2
+    assert check_rollups() == []
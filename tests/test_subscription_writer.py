@@ -0,0 +1,88 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import Order, OrderItem, Subscription, SubscriptionItem
+from database import SubscriptionWriter, calculate_production_date, generate_subscription_orders
+from rollups import check_rollups
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+def inserts(query_log, table):
+    return [sql for sql in query_log if sql.startswith(f'INSERT INTO "{table}"')]
+
+
+def test_write_returns_ids_in_order(test_db, sample_data):
+    """Orders and their items are written with the ids handed back in insertion order"""
+    customer = sample_data['customers'][0]
+    item_a, item_b = sample_data['items']
+    writer = SubscriptionWriter()
+    writer.add_order(customer, MONDAY, [(item_a, 1.0), (item_b, 2.0)])
+    writer.add_order(customer, MONDAY + timedelta(days=1), [(item_b, 3.0)],
+                     production_date=MONDAY - timedelta(days=20), halbe_channel=True, order_id=str(uuid.uuid4()))
+
+    ids = writer.write()['orders']
+
+    first, second = Order.get_by_id(ids[0]), Order.get_by_id(ids[1])
+    assert first.delivery_date == MONDAY
+    assert first.production_date == calculate_production_date(MONDAY, [OrderItem(item=item_b, amount=2.0)])
+    assert [(oi.item.name, oi.amount) for oi in first.order_items] == [("Microgreen A", 1.0), ("Microgreen B", 2.0)]
+    assert second.halbe_channel is True
+    assert second.production_date == MONDAY - timedelta(days=20)
+    assert [(oi.item.name, oi.amount) for oi in second.order_items] == [("Microgreen B", 3.0)]
+    # The queues are emptied after writing
+    assert writer.write() == {'orders': [], 'subscriptions': []}
+    assert check_rollups() == []
+
+
+def test_write_batches_inserts(test_db, sample_data, query_log, monkeypatch):
+    """Rows are inserted in chunks sized to SQLite's variable limit, not one by one"""
+    customer = sample_data['customers'][0]
+    items = sample_data['items']
+    monkeypatch.setattr(SubscriptionWriter, 'MAX_VARIABLES', 100)
+    writer = SubscriptionWriter()
+    for week in range(52):
+        writer.add_order(customer, MONDAY + timedelta(weeks=week), [(item, 1.0) for item in items])
+
+    query_log.clear()
+    ids = writer.write()
+
+    assert len(ids['orders']) == 52
+    assert OrderItem.select().where(OrderItem.order.in_(ids['orders'])).count() == 104
+    # 10 order columns -> 10 rows per statement, 3 item columns -> 33 rows per statement
+    assert len(inserts(query_log, 'order')) == 6
+    assert len(inserts(query_log, 'orderitem')) == 4
+
+
+def test_add_subscription_orders_skips_dates(test_db, sample_data):
+    """Legacy series are materialized with the given items, leaving existing dates out"""
+    order = sample_data['orders'][1]
+    item_b = sample_data['items'][1]
+    expected = [future['delivery_date'] for future in generate_subscription_orders(order)]
+    writer = SubscriptionWriter()
+
+    writer.add_subscription_orders(order, [(item_b, 4.0)], skip_dates={expected[0]})
+    ids = writer.write()['orders']
+
+    futures = list(Order.select().where(Order.id.in_(ids)).order_by(Order.delivery_date))
+    assert [f.delivery_date for f in futures] == expected[1:]
+    assert all(f.is_future and f.subscription_type == 1 for f in futures)
+    assert all([(oi.item.name, oi.amount) for oi in f.order_items] == [("Microgreen B", 4.0)] for f in futures)
+
+
+def test_write_subscriptions_and_existing_items(test_db, sample_data):
+    """Rules, their lines and items for already saved orders go into one transaction"""
+    customer = sample_data['customers'][0]
+    item_a, item_b = sample_data['items']
+    order = sample_data['orders'][0]
+    writer = SubscriptionWriter()
+    writer.add_subscription(customer, 2, MONDAY, MONDAY, MONDAY + timedelta(weeks=20), [(item_a, 1.0), (item_b, 2.0)],
+                            halbe_channel=True)
+    writer.add_items(order, [(item_b, 5.0)])
+
+    ids = writer.write()
+
+    rule = Subscription.get_by_id(ids['subscriptions'][0])
+    assert rule.anchor_date == MONDAY and rule.halbe_channel is True
+    assert SubscriptionItem.select().where(SubscriptionItem.subscription == rule).count() == 2
+    assert ("Microgreen B", 5.0) in [(oi.item.name, oi.amount) for oi in order.order_items]
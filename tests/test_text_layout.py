@@ -0,0 +1,58 @@
+import random
+from fpdf import FPDF
+from print_schedules import TextLayout, SchedulePrinter
+
+ITEM_NAMES = ["Erbse", "Sonnenblume", "Rettich", "Koriander", "Brokkoli", "Rotkohl", "Amaranth", "Senf"]
+
+
+def make_pdf(size=10):
+    pdf = FPDF()
+    pdf.add_page('L')
+    pdf.set_font('Arial', '', size)
+    return pdf
+
+
+def test_line_count_matches_multi_cell():
+    """The counted lines are the lines multi_cell writes, also for words wider than the cell"""
+    rng = random.Random(7)
+    pdf = make_pdf()
+    layout = TextLayout()
+    texts = ["", "Erbse: 2", "Supercalifragilisticexpialidocious" * 4, "Erste Zeile\nZweite Zeile\n"]
+    for _ in range(300):
+        count = rng.randint(1, 15)
+        texts.append(", ".join(f"{rng.choice(ITEM_NAMES)}: {rng.randint(1, 30)}" for _ in range(count)))
+    for width in (20, 60, 144.5):
+        for text in texts:
+            expected = len(pdf.multi_cell(width, 4, text, 0, 'L', split_only=True))
+            assert layout.line_count(pdf, text, width) == expected, (text, width)
+
+
+def test_line_count_is_memoized_per_font():
+    pdf = make_pdf()
+    layout = TextLayout()
+    text = ", ".join(f"{name}: 3" for name in ITEM_NAMES * 3)
+
+    assert layout.line_count(pdf, text, 60) == layout.line_count(pdf, text, 60)
+    assert len(layout.cache) == 1
+    pdf.set_font('Arial', '', 20)
+    assert layout.line_count(pdf, text, 60) > layout.line_count(make_pdf(), text, 60)
+    assert len(layout.cache) == 2
+
+
+def test_table_rows_fit_their_text(tmp_path, monkeypatch):
+    """Each delivery row is as high as its wrapped items list"""
+    monkeypatch.chdir(tmp_path)
+    printer = SchedulePrinter()
+    pdf = make_pdf()
+    short = ["Kunde A", "Erbse: 1", "Nein"]
+    long = ["Kunde B", ", ".join(f"{name}: 12" for name in ITEM_NAMES * 4), "Ja"]
+    start = pdf.get_y()
+    printer._add_table(pdf, ["Kunde", "Items", "Halbe Channel"], [short])
+    short_height = pdf.get_y() - start
+    start = pdf.get_y()
+    printer._add_table(pdf, ["Kunde", "Items", "Halbe Channel"], [long])
+    long_height = pdf.get_y() - start
+
+    lines = printer.layout.line_count(pdf, long[1], pdf.w * 0.5 - 4)
+    assert lines > 1
+    assert long_height - short_height == lines * 4 + 2 - 6
@@ -0,0 +1,186 @@
+import pytest
+from datetime import datetime, timedelta
+from models import db, Customer, Item, Order, OrderItem, Subscription, ImportedRow, UndoEntry, UndoStep, create_tables
+from database import SubscriptionWriter
+from rollups import check_rollups
+from customer_stats import check_customer_stats
+from undo import UndoLog
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+def snapshot():
+    """Everything the undo log restores, comparable with =="""
+    return {
+        'customers': list(Customer.select(Customer.id, Customer.name).order_by(Customer.id).tuples()),
+        'items': list(Item.select(Item.id, Item.name, Item.price).order_by(Item.id).tuples()),
+        'orders': list(Order.select(Order.id, Order.order_id, Order.delivery_date, Order.production_date,
+                                    Order.customer, Order.subscription, Order.is_future)
+                       .order_by(Order.id).tuples()),
+        'order_items': list(OrderItem.select(OrderItem.id, OrderItem.order, OrderItem.item, OrderItem.amount)
+                            .order_by(OrderItem.id).tuples()),
+        'subscriptions': list(Subscription.select(Subscription.id, Subscription.subscription_type,
+                                                  Subscription.to_date).order_by(Subscription.id).tuples()),
+    }
+
+
+def test_undo_restores_updates_deletes_and_inserts(test_db, sample_data):
+    """One step with all kinds of writes is reverted to the exact previous state"""
+    undo_log = UndoLog()
+    before = snapshot()
+    order = sample_data['orders'][0]
+
+    with undo_log.step("Gemischte Änderung"):
+        OrderItem.update(amount=9.0).where(OrderItem.order == order).execute()
+        order.delivery_date = order.delivery_date + timedelta(days=1)
+        order.save()
+        sample_data['orders'][1].delete_instance(recursive=True)
+        Customer.create(name="New Customer")
+        writer = SubscriptionWriter()
+        writer.add_order(sample_data['customers'][0], MONDAY, [(sample_data['items'][0], 1.0)])
+        writer.write()
+        Item.update(price=99.0).execute()
+
+    assert snapshot() != before
+    assert undo_log.undo() == ("Gemischte Änderung", ['orderitem', 'order', 'item', 'customer'], 0)
+    assert snapshot() == before
+    assert UndoEntry.select().count() == 0
+    # The trigger-maintained tables follow the replay
+    assert check_rollups() == []
+    assert check_customer_stats() == []
+
+
+def test_updates_store_only_changed_columns(test_db, sample_data):
+    undo_log = UndoLog()
+    with undo_log.step("Menge"):
+        OrderItem.update(amount=9.0).where(OrderItem.id == sample_data['order_items'][0].id).execute()
+
+    assert [(e.op, e.image) for e in UndoEntry.select()] == [('U', '{"amount":2.5}')]
+
+
+def test_steps_are_undone_newest_first(test_db, sample_data):
+    undo_log = UndoLog()
+    with undo_log.step("Erster Kunde"):
+        Customer.create(name="First")
+    with undo_log.step("Zweiter Kunde"):
+        Customer.create(name="Second")
+    with undo_log.step("Nichts geschrieben"):
+        pass
+
+    assert undo_log.last_step().description == "Zweiter Kunde"
+    undo_log.undo()
+    assert undo_log.undo()[0] == "Erster Kunde"
+    assert undo_log.undo() is None
+    assert Customer.select().count() == 2
+
+
+def test_writes_outside_steps_are_not_recorded(test_db, sample_data):
+    Customer.create(name="Unrecorded")
+    assert UndoEntry.select().count() == 0
+
+
+def test_rows_deleted_since_are_left_out(test_db, sample_data):
+    """Rows the step updated and something else deleted later can't come back from their changed columns"""
+    undo_log = UndoLog()
+    order = sample_data['orders'][0]
+    customer = sample_data['customers'][0]
+    with undo_log.step("Änderung"):
+        order.delivery_date = order.delivery_date + timedelta(days=1)
+        order.save()
+        OrderItem.update(amount=9.0).where(OrderItem.order == order).execute()
+        Customer.update(name="Renamed").where(Customer.id == customer.id).execute()
+    # Outside the undo log, as the order import or temp_data_import.clean_database do
+    order.delete_instance(recursive=True)
+
+    assert undo_log.undo() == ("Änderung", ['orderitem', 'order', 'customer'], 3)
+    assert Customer.get_by_id(customer.id).name == customer.name
+    assert not Order.select().where(Order.id == order.id).exists()
+    assert check_customer_stats() == []
+
+
+def test_undo_restores_import_links(test_db, sample_data):
+    """Deleting an imported order sets its imported_row link to NULL, undo links it again"""
+    undo_log = UndoLog()
+    order = sample_data['orders'][0]
+    line = sample_data['order_items'][0]
+    imported = ImportedRow.create(key="Test Customer 1|Microgreen A", customer=order.customer, item=line.item,
+                                  delivery_date=order.delivery_date, amount=line.amount, order=order)
+    with undo_log.step("Löschung einer Bestellung"):
+        order.delete_instance(recursive=True)
+    assert ImportedRow.get_by_id(imported.id).order is None
+
+    assert 'imported_row' in undo_log.undo()[1]
+    assert ImportedRow.get_by_id(imported.id).order_id == order.id
+    # The order comes back before its items, the derived tables count them again
+    assert OrderItem.select().where(OrderItem.order == order).count() == 2
+    assert check_rollups() == []
+    assert check_customer_stats() == []
+
+
+def test_failed_step_leaves_nothing(test_db, sample_data):
+    undo_log = UndoLog()
+    with pytest.raises(ValueError):
+        with undo_log.step("Fehler"):
+            Customer.create(name="Rolled back")
+            raise ValueError("kaputt")
+
+    assert UndoStep.select().count() == 0
+    assert not Customer.select().where(Customer.name == "Rolled back").exists()
+    with undo_log.step("Danach"):
+        Customer.create(name="Recorded")
+    assert UndoEntry.select().count() == 1
+
+
+def test_log_is_capped_by_bytes(test_db, sample_data):
+    """Old steps are dropped once the images exceed max_bytes, the newest step stays"""
+    undo_log = UndoLog()
+    undo_log.max_bytes = 300
+    for n in range(10):
+        with undo_log.step(f"Schritt {n}"):
+            Customer.update(name=f"Name {n} " + "x" * 50).where(
+                Customer.id == sample_data['customers'][0].id).execute()
+
+    steps = [step.description for step in UndoStep.select().order_by(UndoStep.id)]
+    assert steps[-1] == "Schritt 9"
+    assert 1 < len(steps) < 10
+    assert sum(step.size for step in UndoStep.select()) <= 300 + max(step.size for step in UndoStep.select())
+
+
+def test_subscription_edit_undo_is_set_based(test_db, sample_data, query_log):
+    """Undoing an edit of hundreds of orders takes a few statements, not one per row"""
+    customer, item = sample_data['customers'][0], sample_data['items'][0]
+    writer = SubscriptionWriter()
+    for week in range(400):
+        writer.add_order(customer, MONDAY + timedelta(weeks=week), [(item, 1.0)], is_future=True)
+    writer.write()
+    before = snapshot()
+    undo_log = UndoLog()
+
+    with undo_log.step("Diese und zukünftige"):
+        future = Order.select(Order.id).where(Order.delivery_date >= MONDAY)
+        OrderItem.update(amount=2.0).where(OrderItem.order.in_(future)).execute()
+        Order.update(halbe_channel=True).where(Order.id.in_(future)).execute()
+    query_log.clear()
+
+    undo_log.undo()
+
+    assert snapshot() == before
+    assert len(query_log) < 15
+
+
+def test_undo_survives_restart(tmp_path):
+    """The log is in the database file, a new session can undo the last step"""
+    path = str(tmp_path / 'undo.db')
+    db.init(path)
+    create_tables()
+    with UndoLog().step("Kunde angelegt"):
+        Customer.create(name="Persistent")
+    db.close()
+
+    db.init(path)
+    db.connect()
+    try:
+        assert UndoLog().undo()[0] == "Kunde angelegt"
+        assert Customer.select().count() == 0
+    finally:
+        db.close()
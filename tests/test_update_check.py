@@ -0,0 +1,143 @@
+import pytest
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+import updates
+from updates import check_for_updates, start_update_check, parse_version, is_newer, read_cache
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class ReleaseServer:
+    """Local stand-in for the GitHub releases API, answering If-None-Match with 304"""
+    def __init__(self):
+        self.tag = "v1.0"
+        self.delay = 0
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.headers.get('If-None-Match'))
+                time.sleep(server.delay)
+                etag = f'"{server.tag}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps({'tag_name': server.tag}).encode()
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/releases/latest"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ReleaseServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def check(server, tmp_path):
+    """check_for_updates against the stub server with a cache file in tmp_path"""
+    cache_path = str(tmp_path / 'update_check.json')
+
+    def check(**kwargs):
+        return check_for_updates(**{'current': "0.9", 'url': server.url, 'cache_path': cache_path, **kwargs})
+    check.cache_path = cache_path
+    return check
+
+
+def test_versions_compare_numerically():
+    assert parse_version("v1.10") == (1, 10)
+    assert is_newer("0.10", "0.9")
+    assert not is_newer("0.9", "0.9")
+    assert not is_newer("", "0.9")
+
+
+def test_newer_release_is_cached_for_the_ttl(server, check):
+    assert check(now=1000) == "1.0"
+    assert read_cache(check.cache_path) == {'etag': '"v1.0"', 'checked_at': 1000, 'latest': "1.0"}
+
+    # Within the TTL nothing is requested, even if a newer release appeared
+    server.tag = "v1.1"
+    assert check(now=1000 + updates.CACHE_TTL - 1) == "1.0"
+    assert len(server.requests) == 1
+
+
+def test_expired_cache_sends_the_etag(server, check):
+    check(now=1000)
+
+    assert check(now=1000 + updates.CACHE_TTL) == "1.0"
+    assert server.requests == [None, '"v1.0"']  # Answered with 304
+    assert read_cache(check.cache_path)['checked_at'] == 1000 + updates.CACHE_TTL
+
+    server.tag = "v1.1"
+    assert check(now=1000 + 2 * updates.CACHE_TTL) == "1.1"
+
+
+def test_current_version_reports_nothing(server, check):
+    assert check(current="1.0") is None
+    assert len(server.requests) == 1
+
+
+def test_slow_network_times_out(server, check):
+    server.delay = 2
+    began = time.perf_counter()
+
+    assert check(timeout=0.2) is None
+
+    assert time.perf_counter() - began < 1.5
+    # Failed checks are not cached, the next start tries again
+    assert read_cache(check.cache_path) == {}
+
+
+def test_check_runs_on_a_daemon_thread(server, check):
+    server.delay = 0.3
+    future = start_update_check(current="0.9", url=server.url, cache_path=check.cache_path)
+    assert not future.done()  # Returns right away
+    assert future.result(timeout=5) == "1.0"
+
+
+def test_app_shows_the_banner_when_done():
+    """ProductionApp.poll_update_check keeps polling with after() and only then shows the banner"""
+    import main
+    app = MagicMock()
+    future = MagicMock()
+    future.done.return_value = False
+
+    main.ProductionApp.poll_update_check(app, future)
+    app.after.assert_called_once_with(main.UPDATE_POLL_MS, app.poll_update_check, future)
+    app.show_update_banner.assert_not_called()
+
+    future.done.return_value = True
+    future.result.return_value = "1.0"
+    main.ProductionApp.poll_update_check(app, future)
+    app.show_update_banner.assert_called_once_with("1.0")
+
+
+def test_requests_is_not_imported_at_startup():
+    code = "import sys, main; print('requests' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
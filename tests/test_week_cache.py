@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+from models import db, Customer, Item, Order, OrderItem, create_tables
+from database import get_delivery_week
+from weekly_view import WeekCache
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """The shared db on a database file with one order in each of three weeks"""
+    db.init(str(tmp_path / 'cache.db'))
+    create_tables()
+    customer = Customer.create(name="Cache Customer")
+    item = Item.create(name="Cache Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+    orders = []
+    for week in range(-1, 2):
+        order = Order.create(customer=customer, delivery_date=MONDAY + timedelta(weeks=week, days=1),
+                             production_date=MONDAY + timedelta(weeks=week, days=-6), order_id=uuid.uuid4())
+        OrderItem.create(order=order, item=item, amount=1.0)
+        orders.append(order)
+
+    yield orders
+
+    db.close_reporting()
+    db.close()
+
+
+def test_snapshot_is_invalidated_by_changes_to_its_week(file_db):
+    """A cached week stays valid until one of its days changes"""
+    cache = WeekCache()
+    assert cache.get('delivery', MONDAY) is None
+    versions, data = cache.load('delivery', MONDAY, get_delivery_week)
+    assert cache.get('delivery', MONDAY) == (versions, data)
+
+    # Another week changed: still cached
+    OrderItem.update(amount=5.0).where(OrderItem.order == file_db[2]).execute()
+    assert cache.get('delivery', MONDAY) == (versions, data)
+
+    OrderItem.update(amount=5.0).where(OrderItem.order == file_db[1]).execute()
+    assert cache.get('delivery', MONDAY) is None
+
+
+def test_least_recently_used_week_is_evicted(file_db):
+    cache = WeekCache()
+    cache.maxsize = 2
+    for week in range(3):
+        cache.load('delivery', MONDAY + timedelta(weeks=week), get_delivery_week)
+    cache.get('delivery', MONDAY + timedelta(weeks=1))  # Most recently used now
+    cache.load('delivery', MONDAY + timedelta(weeks=3), get_delivery_week)
+
+    assert list(cache.entries) == [('delivery', MONDAY + timedelta(weeks=1)),
+                                   ('delivery', MONDAY + timedelta(weeks=3))]
+
+
+def test_prefetch_loads_adjacent_weeks(file_db):
+    """After a week is shown the previous and next week come from the cache"""
+    cache = WeekCache()
+    cache.prefetch('delivery', MONDAY, get_delivery_week)
+    # The prefetch thread works in order, this waits for both weeks
+    WeekCache.prefetch_executor.submit(lambda: None).result(timeout=5)
+
+    for week in (-1, 1):
+        monday = MONDAY + timedelta(weeks=week)
+        cached = cache.get('delivery', monday)
+        assert cached is not None
+        assert cached[1] == get_delivery_week(monday)
+    assert cache.prefetching == set()
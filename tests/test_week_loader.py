@@ -0,0 +1,105 @@
+import pytest
+import threading
+from datetime import datetime, timedelta
+import uuid
+from models import db, Customer, Item, Order, OrderItem, create_tables
+from database import get_delivery_week
+from weekly_view import WeekLoader
+
+MONDAY = datetime(2024, 3, 4).date()
+
+
+class FakeWidget:
+    """Collects after() callbacks so the test plays the Tk main loop"""
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback, *args):
+        self.pending.append((callback, args))
+
+    def run_until_idle(self, timeout=5):
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        while self.pending:
+            assert datetime.now() < deadline, "loader never finished"
+            callback, args = self.pending.pop(0)
+            callback(*args)
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    """The shared db on a database file, readable from the loader threads"""
+    db.init(str(tmp_path / 'loader.db'))
+    create_tables()
+    customer = Customer.create(name="Loader Customer")
+    item = Item.create(name="Loader Item", growth_days=3, soaking_days=1, germination_days=2,
+                       price=5.0, seed_quantity=0.1, substrate="Substrate 1")
+    for week in range(3):
+        order = Order.create(customer=customer, delivery_date=MONDAY + timedelta(weeks=week, days=1),
+                             production_date=MONDAY - timedelta(days=6), order_id=uuid.uuid4())
+        OrderItem.create(order=order, item=item, amount=1.0 + week)
+
+    yield db
+
+    db.close()
+
+
+def test_fetch_runs_off_the_main_thread(file_db):
+    """The query runs on a loader thread, the result is applied through after()"""
+    widget = FakeWidget()
+    loader = WeekLoader(widget)
+    fetch_threads = []
+    applied = []
+
+    def fetch(monday):
+        fetch_threads.append(threading.current_thread())
+        return get_delivery_week(monday)
+
+    loader.load(MONDAY, fetch, lambda monday, data: applied.append((monday, data)))
+    assert applied == []  # Nothing is drawn before the Tk loop polls
+    widget.run_until_idle()
+
+    assert fetch_threads[0] is not threading.current_thread()
+    assert [(monday, [d['items'] for d in data]) for monday, data in applied] == [
+        (MONDAY, [[("Loader Item", 1.0)]])]
+
+
+def test_stale_weeks_are_dropped(file_db):
+    """Clicking through several weeks only applies the last one"""
+    widget = FakeWidget()
+    loader = WeekLoader(widget)
+    applied = []
+
+    for week in range(3):
+        loader.load(MONDAY + timedelta(weeks=week), get_delivery_week,
+                    lambda monday, data: applied.append((monday, data[0]['items'])))
+    widget.run_until_idle()
+
+    assert applied == [(MONDAY + timedelta(weeks=2), [("Loader Item", 3.0)])]
+    assert loader.generation == 3
+
+
+def test_fetch_errors_go_to_handler(file_db):
+    """A failing fetch is reported instead of applied"""
+    widget = FakeWidget()
+    loader = WeekLoader(widget)
+    errors = []
+
+    def fetch(monday):
+        raise ValueError("kaputt")
+
+    loader.load(MONDAY, fetch, lambda monday, data: pytest.fail("applied"), errors.append)
+    widget.run_until_idle()
+
+    assert [str(e) for e in errors] == ["kaputt"]
+
+
+def test_memory_database_loads_inline(test_db, sample_data):
+    """In-memory databases aren't visible to other threads, so the fetch runs inline"""
+    widget = FakeWidget()
+    loader = WeekLoader(widget)
+    applied = []
+
+    loader.load(MONDAY, lambda monday: threading.current_thread(), lambda monday, data: applied.append(data))
+
+    assert applied == [threading.current_thread()]
+    assert widget.pending == []
@@ -0,0 +1,228 @@
+"""
+Persistent undo log.
+
+Writes made inside `with undo_log.step("Beschreibung"):` are recorded by
+SQLite triggers as row-level before-images in undo_log: the primary key of
+inserted rows, the old values of only the changed columns of updated rows and
+the whole old row of deleted rows. The log lives in production.db, so undo
+survives a restart. It is capped by the size of the stored images
+(max_bytes) instead of a number of steps.
+
+undo() replays the newest step set-based: the images are merged per row and
+written back with one statement per table and kind of change, so undoing a
+"this and future" edit of hundreds of orders is a handful of statements.
+"""
+import json
+from contextlib import contextmanager
+from peewee import fn
+from models import (db, Customer, Item, Subscription, SubscriptionItem, Order, OrderItem, ImportedRow, UndoStep,
+                    UndoEntry, UndoState, create_triggers)
+from database import SubscriptionWriter
+
+# Parents before children. imported_row is recorded for the links to orders and
+# rules that deleting them sets to NULL, so undo restores those links as well
+TABLES = [Customer, Item, Subscription, SubscriptionItem, Order, OrderItem, ImportedRow]
+
+_STEP = '(SELECT step FROM undo_state)'
+
+def _columns(model):
+    return [field.column_name for field in model._meta.sorted_fields]
+
+def _triggers(model):
+    table = model._meta.table_name
+    pk = model._meta.primary_key.column_name
+    columns = [c for c in _columns(model) if c != pk]
+    whole_row = 'json_object(' + ', '.join(f"'{c}', OLD.\"{c}\"" for c in _columns(model)) + ')'
+    changed = ' UNION ALL '.join(
+        f"SELECT '{c}' AS k, OLD.\"{c}\" AS v WHERE OLD.\"{c}\" IS NOT NEW.\"{c}\"" for c in columns)
+    any_changed = ' OR '.join(f'OLD."{c}" IS NOT NEW."{c}"' for c in columns)
+    recording = f'{_STEP} IS NOT NULL'
+
+    def log(row, op, image):
+        return (f'INSERT INTO undo_log (step_id, table_name, pk, op, image) '
+                f"VALUES ({_STEP}, '{table}', {row}.\"{pk}\", '{op}', {image});")
+
+    return {
+        f'undo_{table}_insert': (f'AFTER INSERT ON "{table}" WHEN {recording}', log('NEW', 'I', 'NULL')),
+        f'undo_{table}_update': (
+            f'AFTER UPDATE ON "{table}" WHEN {recording} AND ({any_changed})',
+            log('OLD', 'U', f'(SELECT json_group_object(k, v) FROM ({changed}))')
+        ),
+        f'undo_{table}_delete': (f'AFTER DELETE ON "{table}" WHEN {recording}', log('OLD', 'D', whole_row)),
+    }
+
+def triggers(models=TABLES):
+    """Name -> (event, body) of the triggers recording the undo log"""
+    result = {}
+    for model in models:
+        result.update(_triggers(model))
+    return result
+
+def install_triggers(database=db):
+    """(Re)create the triggers that record undo_log, on the tables the schema has so far"""
+    create_triggers(triggers([model for model in TABLES if database.table_exists(model._meta.table_name)]),
+                    database)
+
+def _chunks(values, size=SubscriptionWriter.MAX_VARIABLES):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class UndoLog:
+    max_bytes = 2 * 1024 * 1024
+    entry_overhead = 32  # Approximate bytes per undo_log row besides its image
+
+    def __init__(self, database=db):
+        self.database = database
+        self.active = None  # Id of the open step
+
+    @contextmanager
+    def step(self, description):
+        """
+        Record the writes of the block as one undoable step, in one transaction.
+        Nested steps are part of the outer one; steps without writes are dropped.
+        """
+        if self.active is not None:
+            with self.database.atomic():
+                yield
+            return
+        with self.database.atomic():
+            step = UndoStep.create(description=description)
+            self._set_recording(step.id)
+            self.active = step.id
+            try:
+                yield
+            finally:
+                self.active = None
+                self._set_recording(None)
+            size = (UndoEntry
+                    .select(fn.COUNT(UndoEntry.id) * self.entry_overhead +
+                            fn.COALESCE(fn.SUM(fn.LENGTH(UndoEntry.image)), 0))
+                    .where(UndoEntry.step == step)
+                    .scalar() or 0)
+            if size == 0:
+                step.delete_instance()
+                return
+            UndoStep.update(size=size).where(UndoStep.id == step.id).execute()
+            self.trim()
+
+    def _set_recording(self, step_id):
+        if UndoState.update(step=step_id).execute() == 0:
+            UndoState.create(step=step_id)
+
+    def trim(self):
+        """Drop the oldest steps beyond max_bytes, always keeping the newest step"""
+        steps = list(UndoStep.select(UndoStep.id, UndoStep.size).order_by(UndoStep.id.desc()).tuples())
+        total = 0
+        expired = []
+        for index, (step_id, size) in enumerate(steps):
+            total += size
+            if index > 0 and total > self.max_bytes:
+                expired.append(step_id)
+        if expired:
+            UndoEntry.delete().where(UndoEntry.step.in_(expired)).execute()
+            UndoStep.delete().where(UndoStep.id.in_(expired)).execute()
+
+    def last_step(self):
+        """The step undo() would revert, None if there is nothing to undo"""
+        return UndoStep.select().order_by(UndoStep.id.desc()).first()
+
+    def can_undo(self):
+        return self.last_step() is not None
+
+    def undo(self):
+        """
+        Revert the newest step.
+
+        Rows changed by the step that were deleted since, outside the undo log
+        (e.g. by the order import), can't be restored from the changed columns
+        alone and are left out.
+
+        Returns:
+        - (description, names of the tables written back, number of rows left out),
+          or None if there is nothing to undo
+        """
+        step = self.last_step()
+        if step is None:
+            return None
+        with self.database.atomic():
+            # Rows may come back in any order, the keys are checked at commit
+            self.database.execute_sql('PRAGMA defer_foreign_keys = ON')
+            tables, skipped = self._replay(step)
+            UndoEntry.delete().where(UndoEntry.step == step).execute()
+            step.delete_instance()
+        return step.description, tables, skipped
+
+    def _replay(self, step):
+        first_op = {}  # (table, pk) -> first change of the row in the step
+        images = {}  # (table, pk) -> column -> value before the step
+        whole = set()  # (table, pk) of the rows deleted by the step, their image has every column
+        entries = (UndoEntry
+                   .select(UndoEntry.table_name, UndoEntry.pk, UndoEntry.op, UndoEntry.image)
+                   .where(UndoEntry.step == step)
+                   .order_by(UndoEntry.id)
+                   .tuples())
+        for table, pk, op, image in entries:
+            key = (table, pk)
+            first_op.setdefault(key, op)
+            if op == 'D':
+                whole.add(key)
+            if image is not None:
+                values = images.setdefault(key, {})
+                # The oldest image of a column holds its value before the step
+                for column, value in json.loads(image).items():
+                    values.setdefault(column, value)
+
+        written = []
+        skipped = 0
+        restores = {}  # table -> (kind, columns) -> [(pk, values)]
+        # Rows the step inserted are deleted children first
+        for model in reversed(TABLES):
+            table = model._meta.table_name
+            pk_column = model._meta.primary_key.column_name
+            keys = [pk for (t, pk) in first_op if t == table]
+            if not keys:
+                continue
+            written.append(table)
+            existing = set()
+            for chunk in _chunks(keys):
+                existing.update(row[0] for row in self.database.execute_sql(
+                    f'SELECT "{pk_column}" FROM "{table}" WHERE "{pk_column}" IN ({", ".join("?" * len(chunk))})',
+                    chunk))
+
+            inserted = [pk for pk in keys if first_op[(table, pk)] == 'I' and pk in existing]
+            for chunk in _chunks(inserted):
+                self.database.execute_sql(
+                    f'DELETE FROM "{table}" WHERE "{pk_column}" IN ({", ".join("?" * len(chunk))})', chunk)
+
+            # Rows the step deleted come back whole, updated rows get their old column values
+            restore = restores.setdefault(table, {})
+            for pk in keys:
+                if first_op[(table, pk)] == 'I':
+                    continue
+                values = images[(table, pk)]
+                if pk in existing:
+                    restore.setdefault(('update', tuple(sorted(values))), []).append((pk, values))
+                elif (table, pk) in whole:
+                    restore.setdefault(('insert', tuple(sorted(values))), []).append((pk, values))
+                else:
+                    # Updated by the step and deleted later: only the changed columns are known
+                    skipped += 1
+
+        # Parents first, so the triggers of the derived tables find the order of a restored item
+        cursor = self.database.cursor()
+        for model in TABLES:
+            table = model._meta.table_name
+            pk_column = model._meta.primary_key.column_name
+            for (kind, columns), rows in restores.get(table, {}).items():
+                if kind == 'insert':
+                    names = ', '.join(f'"{c}"' for c in columns)
+                    sql = f'INSERT INTO "{table}" ({names}) VALUES ({", ".join("?" * len(columns))})'
+                    params = [[values[c] for c in columns] for pk, values in rows]
+                else:
+                    assignments = ', '.join(f'"{c}" = ?' for c in columns)
+                    sql = f'UPDATE "{table}" SET {assignments} WHERE "{pk_column}" = ?'
+                    params = [[values[c] for c in columns] + [pk] for pk, values in rows]
+                cursor.executemany(sql, params)
+        return written, skipped
+
+undo_log = UndoLog()
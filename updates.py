@@ -0,0 +1,112 @@
+"""
+Update check against the latest GitHub release, off the Tk main loop.
+
+check_for_updates() asks the GitHub API with a short timeout and keeps the
+answer and its ETag in a small JSON file. Within the TTL (one day) the cached
+answer is used without any network access; after it, a conditional request
+(If-None-Match) is made, which GitHub answers with an empty 304 when the
+release is unchanged. Network errors never raise, the app simply starts
+without knowing about updates.
+
+start_update_check() runs the check on a daemon thread and returns a Future,
+which the app polls with after() (see ProductionApp.poll_update_check), so a
+slow or dead network never delays startup or exit. requests is only imported
+by the check itself, not when the app starts.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+VERSION = "0.9"
+
+RELEASES_URL = "https://api.github.com/repos/GingerApe/kleinblatt/releases/latest"
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.update_check.json')
+CACHE_TTL = 24 * 60 * 60  # Seconds
+TIMEOUT = 3  # Seconds, for connecting and for reading the answer
+
+def parse_version(version):
+    """'v1.10' -> (1, 10), so 1.10 sorts after 1.9; unparsable parts count as 0"""
+    parts = []
+    for part in version.strip().lstrip('vV').split('.'):
+        digits = ''.join(char for char in part if char.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
+
+def is_newer(latest, current=VERSION):
+    return bool(latest) and parse_version(latest) > parse_version(current)
+
+def read_cache(path=CACHE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(cache, path=CACHE_PATH):
+    # Write a temporary file and rename, so a crash never leaves half a file
+    temporary = f"{path}.tmp"
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f"Update check: could not write {path}: {e}")
+
+def check_for_updates(current=VERSION, url=RELEASES_URL, cache_path=CACHE_PATH, ttl=CACHE_TTL,
+                      timeout=TIMEOUT, now=None):
+    """
+    Latest released version if it is newer than current, else None.
+
+    Blocks for at most about timeout seconds (none within the TTL), so call it
+    off the Tk thread, see start_update_check.
+    """
+    now = time.time() if now is None else now
+    cache = read_cache(cache_path)
+    if cache and 0 <= now - cache.get('checked_at', 0) < ttl:
+        latest = cache.get('latest')
+        return latest if is_newer(latest, current) else None
+
+    try:
+        import requests  # Only paid by the background check
+        headers = {'Accept': 'application/vnd.github+json'}
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            latest = cache.get('latest')
+        elif response.status_code == 200:
+            latest = response.json().get('tag_name', '').strip().lstrip('vV')
+            cache['etag'] = response.headers.get('ETag')
+        else:
+            print(f"Update check failed: HTTP {response.status_code}")
+            return None
+    except Exception as e:
+        # Offline or a flaky connection: try again on the next start
+        print(f"Update check failed: {e}")
+        return None
+
+    cache.update(checked_at=now, latest=latest)
+    write_cache(cache, cache_path)
+    return latest if is_newer(latest, current) else None
+
+def start_update_check(**kwargs):
+    """
+    Run check_for_updates on a daemon thread; returns a Future of its result.
+
+    A plain daemon thread instead of an executor: executor threads are joined
+    at exit, so closing the app would wait for a hanging request.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(check_for_updates(**kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='update-check', daemon=True).start()
+    return future
@@ -1,14 +1,230 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
-from database import get_delivery_schedule, get_production_plan, get_transfer_schedule, generate_subscription_orders, calculate_production_date  # Ensure this import is present
-from models import Order, OrderItem
+from database import get_delivery_week, get_production_week, get_transfer_schedule, calculate_production_date  # Ensure this import is present
+from database import SubscriptionWriter, create_subscription, override_occurrence, update_subscription, end_subscription
+from models import db, Order, OrderItem, Subscription
+from changes import day_versions, dirty_days, stamp_days
+from events import bus, OrderChanged, ItemChanged, CustomerChanged, order_dates
+from undo import undo_log
 from widgets import AutocompleteCombobox
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
 import ttkbootstrap as ttkb
 import uuid
-import time
+
+class WeekLoader:
+    """
+    Loads the data of a week off the Tk main loop.
+    
+    fetch(monday) runs on a shared worker thread, which has its own (read-only
+    reporting) connection. apply(monday, data) runs on the Tk thread, which
+    polls the result with after(). Every load bumps the generation counter and
+    results of older loads are dropped, so clicking "Nächste Woche" several
+    times quickly only draws the last week.
+    """
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='week-loader')
+    poll_ms = 15
+    
+    def __init__(self, widget):
+        self.widget = widget  # Anything with Tk's after()
+        self.generation = 0
+        self.future = None
+    
+    def load(self, monday, fetch, apply, on_error=None):
+        self.cancel()
+        
+        if db.in_memory or db.in_transaction():
+            # Other threads can't see an in-memory database or uncommitted writes
+            apply(monday, fetch(monday))
+            return
+        
+        self.future = self.executor.submit(self._fetch, fetch, monday)
+        self.widget.after(self.poll_ms, self._poll, self.future, self.generation, monday, apply, on_error)
+    
+    def show(self, monday, data, apply):
+        """Apply already loaded data (a WeekCache hit) right away, dropping pending loads"""
+        self.cancel()
+        apply(monday, data)
+    
+    def cancel(self):
+        self.generation += 1
+        if self.future is not None:
+            self.future.cancel()  # Not started yet: don't query a week nobody will see
+            self.future = None
+    
+    @staticmethod
+    def _fetch(fetch, monday):
+        with db.reporting():
+            return fetch(monday)
+    
+    def _poll(self, future, generation, monday, apply, on_error):
+        if generation != self.generation:
+            return  # A newer week was requested meanwhile
+        if not future.done():
+            self.widget.after(self.poll_ms, self._poll, future, generation, monday, apply, on_error)
+            return
+        self.future = None
+        try:
+            data = future.result()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+            return
+        apply(monday, data)
+
+class WeekCache:
+    """
+    Bounded LRU cache of the week snapshots of the weekly views.
+    
+    A snapshot is kept together with the change journal versions of its days
+    and only returned while they are unchanged, so any write to a week
+    invalidates it without explicit eviction. prefetch() loads the weeks
+    around the shown one in the background, so paging through the weeks while
+    planning draws from memory.
+    """
+    maxsize = 24  # 8 weeks of each of the three views
+    # One thread, so prefetching never delays a week the user asked for
+    prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='week-prefetch')
+    
+    def __init__(self):
+        self.entries = OrderedDict()  # (kind, monday) -> (versions, data)
+        self.lock = threading.Lock()  # put() runs on the loader threads
+        self.prefetching = set()
+    
+    @staticmethod
+    def versions(kind, monday):
+        return day_versions(kind, monday, monday + timedelta(days=6))
+    
+    def get(self, kind, monday):
+        """(versions, data) of the week if cached and unchanged since, else None"""
+        versions = self.versions(kind, monday)
+        with self.lock:
+            entry = self.entries.get((kind, monday))
+            if entry is None or entry[0] != versions:
+                return None
+            self.entries.move_to_end((kind, monday))
+            return entry
+    
+    def put(self, kind, monday, versions, data):
+        with self.lock:
+            self.entries[(kind, monday)] = (versions, data)
+            self.entries.move_to_end((kind, monday))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def load(self, kind, monday, fetch):
+        """Fetch and cache a week, returns (versions, data)"""
+        # Versions first: a write in between only makes the next lookup miss
+        versions = self.versions(kind, monday)
+        data = fetch(monday)
+        self.put(kind, monday, versions, data)
+        return versions, data
+    
+    def prefetch(self, kind, monday, fetch):
+        """Load the previous and next week in the background unless they are cached"""
+        if db.in_memory:
+            return  # The prefetch thread can't see an in-memory database
+        for neighbour in (monday - timedelta(weeks=1), monday + timedelta(weeks=1)):
+            with self.lock:
+                if (kind, neighbour) in self.prefetching:
+                    continue
+                self.prefetching.add((kind, neighbour))
+            self.prefetch_executor.submit(self._prefetch, kind, neighbour, fetch)
+    
+    def _prefetch(self, kind, monday, fetch):
+        # Errors are dropped, they show up when the week is actually loaded
+        try:
+            with db.reporting():
+                if self.get(kind, monday) is None:
+                    self.load(kind, monday, fetch)
+        finally:
+            with self.lock:
+                self.prefetching.discard((kind, monday))
+
+class CardPool:
+    """
+    The cards of one day column.
+    
+    show() reconfigures the existing cards in order and only creates or destroys
+    cards when their number changes, instead of rebuilding the column.
+    """
+    def __init__(self, parent, factory):
+        self.parent = parent
+        self.factory = factory  # factory(parent) -> card with show(record) and destroy()
+        self.cards = []
+    
+    def show(self, records):
+        while len(self.cards) < len(records):
+            self.cards.append(self.factory(self.parent))
+        while len(self.cards) > len(records):
+            self.cards.pop().destroy()
+        for card, record in zip(self.cards, records):
+            card.show(record)
+
+class DeliveryCard:
+    """Customer card of the delivery view: customer name and one line per item"""
+    def __init__(self, parent, on_click):
+        self.delivery = None
+        self.lines = []
+        
+        # Create a frame for each customer with a border and padding
+        self.frame = ttk.Frame(parent, relief='groove', borderwidth=1)
+        self.frame.pack(fill='x', padx=5, pady=5, ipadx=5, ipady=5)
+        
+        # Customer name header, clickable
+        self.customer_label = ttk.Label(
+            self.frame,
+            font=('Arial', 12, 'bold'),
+            style='Clickable.TLabel',
+            wraplength=200,  # Fixed width to ensure text is visible
+            anchor='w'
+        )
+        self.customer_label.pack(anchor='w', fill='x', padx=5, pady=5)
+        self.customer_label.bind("<Button-1>", lambda e: on_click(self.delivery))
+        
+        ttk.Separator(self.frame, orient='horizontal').pack(fill='x', padx=5, pady=3)
+        
+        # Frame for the item lines
+        self.items_frame = ttk.Frame(self.frame)
+        self.items_frame.pack(fill='x', padx=5, pady=5)
+        self.item_labels = []
+    
+    def show(self, delivery):
+        if self.delivery is None or delivery['customer'] != self.delivery['customer']:
+            self.customer_label.configure(text=delivery['customer'])
+        self.delivery = delivery
+        
+        # Order items are already sorted by name
+        lines = [f"{item_name}: {amount:.1f}" for item_name, amount in delivery['items']]
+        while len(self.item_labels) < len(lines):
+            label = ttk.Label(self.items_frame, font=('Arial', 11))
+            label.pack(anchor='w', padx=10, pady=2)
+            self.item_labels.append(label)
+        while len(self.item_labels) > len(lines):
+            self.item_labels.pop().destroy()
+            self.lines.pop()
+        for index, (label, text) in enumerate(zip(self.item_labels, lines)):
+            if index >= len(self.lines) or self.lines[index] != text:
+                label.configure(text=text)
+        self.lines = lines
+    
+    def destroy(self):
+        self.frame.destroy()
+
+def occurrence_order_dates(rule, occurrence):
+    """Dates for OrderChanged of a subscription delivery, also of a stand-in not saved as an override yet"""
+    if occurrence.production_date is None:
+        production_date = calculate_production_date(occurrence.delivery_date, list(rule.subscription_items))
+        return order_dates(occurrence) | {production_date}
+    return order_dates(occurrence)
 
 class WeeklyBaseView:
+    journal_kind = None  # change_journal kind of the dates the view shows
+    week_cache = WeekCache()  # Shared by all views, keyed by kind
+    
     def __init__(self, parent):
         self.parent = parent
         self.current_week = datetime.now().date()
@@ -17,7 +233,10 @@ class WeeklyBaseView:
         self.day_labels = {}
         self.button_frames = {}
         self.scrollbars = {}
+        self.loader = WeekLoader(parent)
+        self.drawn_versions = {}  # Change journal versions of the drawn days
         self.create_widgets()
+        bus.subscribe(self.on_change, OrderChanged, ItemChanged, CustomerChanged)
         
     def create_widgets(self):
         # Navigation frame
@@ -152,6 +371,51 @@ class WeeklyBaseView:
             if day in self.day_labels:
                 self.day_labels[day].configure(text=day_label)
     
+    def on_change(self, events):
+        """Bus handler: refresh once if a day of the shown week changed since it was drawn"""
+        monday = self.get_monday_of_week()
+        sunday = monday + timedelta(days=6)
+        if not any(not isinstance(event, OrderChanged) or event.touches(monday, sunday) for event in events):
+            return
+        # Item and customer edits only matter if the journal says they touched the week
+        dates = [monday + timedelta(days=i) for i in range(7)]
+        if dirty_days(self.drawn_versions, day_versions(self.journal_kind, monday, sunday), dates):
+            self.refresh()
+    
+    def load_week(self, fetch, apply):
+        """
+        Show the current week from the WeekCache, or load it with the WeekLoader,
+        marking the day columns as loading meanwhile.
+        
+        apply(monday, data, dirty) gets the dates whose change journal version
+        moved since they were last drawn and only needs to redraw those days.
+        """
+        monday = self.get_monday_of_week()
+        kind = self.journal_kind
+        
+        def apply_dirty(monday, result):
+            versions, data = result
+            dates = [monday + timedelta(days=i) for i in range(7)]
+            apply(monday, data, set(dirty_days(self.drawn_versions, versions, dates)))
+            self.drawn_versions = stamp_days(versions, dates)
+            # Have the neighbouring weeks ready for the week buttons
+            self.week_cache.prefetch(kind, monday, fetch)
+        
+        cached = self.week_cache.get(kind, monday)
+        if cached is not None:
+            self.loader.show(monday, cached, apply_dirty)
+            return
+        
+        for i, day in enumerate(self.day_labels):
+            date = monday + timedelta(days=i)
+            self.day_labels[day].configure(text=f"{day} ({date.strftime('%d.%m')}) – lädt…")
+        self.loader.load(monday, lambda monday: self.week_cache.load(kind, monday, fetch),
+                         apply_dirty, self.show_load_error)
+    
+    def show_load_error(self, error):
+        self.update_day_labels()
+        messagebox.showerror("Fehler", f"Die Woche konnte nicht geladen werden: {error}")
+    
     def update_week_label(self):
         monday = self.current_week - timedelta(days=self.current_week.weekday())
         sunday = monday + timedelta(days=6)
@@ -160,9 +424,12 @@ class WeeklyBaseView:
         )
     
     def clear_day_frames(self):
-        for day, frame in self.day_frames.items():
-            for widget in frame.winfo_children():
-                widget.destroy()
+        for day in self.day_frames:
+            self.clear_day_frame(day)
+    
+    def clear_day_frame(self, day):
+        for widget in self.day_frames[day].winfo_children():
+            widget.destroy()
     
     def get_monday_of_week(self):
         return self.current_week - timedelta(days=self.current_week.weekday())
@@ -194,12 +461,13 @@ class WeeklyBaseView:
                 frame.configure(background='green')
 
 class WeeklyDeliveryView(WeeklyBaseView):
+    journal_kind = 'delivery'
+    
     def __init__(self, parent, app, db):
         super().__init__(parent)
         self.app = app  # Reference to the ProductionApp instance
         self.new_order_widgets = {}  # Will hold new order widgets for each day
         self.db = db
-        self.edit_callback = None  # Callback for notifying app of edits
 
         # Define a custom style for clickable labels using ttkbootstrap
         style = ttkb.Style('darkly')
@@ -214,17 +482,21 @@ class WeeklyDeliveryView(WeeklyBaseView):
         # Optional: Change background on hover/active state
         style.map('Clickable.TLabel', background=[('active', '#0056b3')])
 
-        # Add a "+" button to each day frame to add a new order
-        for day, frame in self.day_frames.items():
-            add_order_button = ttk.Button(frame, text="+", command=lambda day=day: self.open_new_order_window(day))
-            add_order_button.pack(side='top', anchor='ne', padx=5, pady=5)
-
-    def set_edit_callback(self, callback):
-        """Set a callback function to be called when an order is edited
-        The callback should accept two arguments: old_data and new_data
-        """
-        self.edit_callback = callback
-        print("Edit callback set in WeeklyDeliveryView")
+        # Add a "+" button to each day to add a new order; it stays for the lifetime of the view
+        for day, button_frame in self.button_frames.items():
+            add_order_button = ttk.Button(
+                button_frame,
+                text="+",
+                width=3,
+                command=lambda d=day: self.open_new_order_window(d)
+            )
+            add_order_button.pack(side='right', padx=5, pady=5)
+        
+        # Customer cards are reused across refreshes
+        self.card_pools = {
+            day: CardPool(frame, lambda parent: DeliveryCard(parent, self.open_delivery))
+            for day, frame in self.day_frames.items()
+        }
 
     def open_new_order_window(self, day):
         """Open a new window to create an order for the specified day."""
@@ -380,47 +652,34 @@ class WeeklyDeliveryView(WeeklyBaseView):
                 max_days = max(item['item'].total_days for item in order_items)
                 production_date = delivery_date_value - timedelta(days=max_days)
                 
-                with self.db.atomic():
-                    # Create order
-                    order = Order.create(
-                        customer=customer,
-                        delivery_date=delivery_date_value,
+                if sub_var.get() > 0:
+                    # Subscriptions are stored as one rule, the views expand the deliveries
+                    changed = OrderChanged()
+                    with undo_log.step("Erstellung eines Abonnements"):
+                        create_subscription(
+                            customer,
+                            sub_var.get(),
+                            delivery_date_value,
+                            self.app.get_date_from_entry(from_date),
+                            self.app.get_date_from_entry(to_date),
+                            [(item_data['item'], item_data['amount']) for item_data in order_items],
+                            halbe_channel=halbe_var.get()
+                        )
+                else:
+                    writer = SubscriptionWriter()
+                    writer.add_order(
+                        customer, delivery_date_value,
+                        [(item_data['item'], item_data['amount']) for item_data in order_items],
                         production_date=production_date,
-                        from_date=self.app.get_date_from_entry(from_date) if sub_var.get() else None,
-                        to_date=self.app.get_date_from_entry(to_date) if sub_var.get() else None,
-                        subscription_type=sub_var.get(),
-                        halbe_channel=halbe_var.get(),
-                        order_id=uuid.uuid4(),
-                        is_future=False
+                        halbe_channel=halbe_var.get()
                     )
-                    
-                    # Create order items
-                    for item_data in order_items:
-                        OrderItem.create(
-                            order=order,
-                            item=item_data['item'],
-                            amount=item_data['amount']
-                        )
-                    
-                    # Generate subscription orders if applicable
-                    if sub_var.get() > 0:
-                        future_orders = generate_subscription_orders(order)
-                        for future_order_data in future_orders:
-                            future_order = Order.create(
-                                **future_order_data,
-                                order_id=uuid.uuid4()
-                            )
-                            # Copy items to future order
-                            for item_data in order_items:
-                                OrderItem.create(
-                                    order=future_order,
-                                    item=item_data['item'],
-                                    amount=item_data['amount']
-                                )
+                    with undo_log.step("Erstellung einer Bestellung"):
+                        writer.write()
+                    changed = OrderChanged(frozenset({delivery_date_value, production_date}))
                 
                 messagebox.showinfo("Erfolg", "Bestellung erfolgreich gespeichert!")
                 new_order_window.destroy()
-                self.refresh()
+                bus.publish(changed)
                 
             except Exception as e:
                 messagebox.showerror("Fehler", str(e))
@@ -430,11 +689,10 @@ class WeeklyDeliveryView(WeeklyBaseView):
                   command=save_order).pack(pady=10)
 
     def refresh(self):
-        self.clear_day_frames()
-        monday = self.get_monday_of_week()
-        end_of_week = monday + timedelta(days=6)
-        deliveries = get_delivery_schedule(monday, end_of_week)
-
+        self.load_week(get_delivery_week, self.show_week)
+    
+    def show_week(self, monday, deliveries, dirty):
+        """Apply phase of refresh(): draw the deliveries of the dirty days into the card pools"""
         days = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
         for i, day in enumerate(days):
             date = monday + timedelta(days=i)
@@ -445,101 +703,23 @@ class WeeklyDeliveryView(WeeklyBaseView):
             if day in self.day_labels:
                 self.day_labels[day].configure(text=day_label)
         
-        # Clear button frames and add + buttons
-        for day in days:
-            # Clear existing buttons
-            for widget in self.button_frames[day].winfo_children():
-                widget.destroy()
-                
-            # Add new + button
-            add_order_button = ttk.Button(
-                self.button_frames[day],
-                text="+",
-                width=3,
-                command=lambda d=day: self.open_new_order_window(d)
-            )
-            add_order_button.pack(side='right', padx=5, pady=5)
-                            
-        # Group deliveries by day name
+        # Group deliveries by day name, skipping orders with no items
         deliveries_by_day = {day: [] for day in days}
         for delivery in deliveries:
-            day_name = days[delivery.delivery_date.weekday()]
-            deliveries_by_day[day_name].append(delivery)
+            if delivery['items']:
+                day_name = days[delivery['date'].weekday()]
+                deliveries_by_day[day_name].append(delivery)
         
-        # Display deliveries for each day
-        for day in days:
-            frame = self.day_frames[day]
-            
-            # Sort deliveries by customer name alphabetically
-            day_deliveries = sorted(deliveries_by_day[day], key=lambda d: d.customer.name.lower())
-            
-            # Display existing orders for this day in the scrollable frame
-            for delivery in day_deliveries:
-                # Skip orders with no items
-                if not delivery.order_items.exists():
-                    continue
-
-                # Create a frame for each customer with a border and padding
-                customer_frame = ttk.Frame(frame, relief='groove', borderwidth=1)
-                customer_frame.pack(fill='x', padx=5, pady=5, ipadx=5, ipady=5)
-                
-                # Customer name header
-                customer_label = ttk.Label(
-                    customer_frame,
-                    text=delivery.customer.name,
-                    font=('Arial', 12, 'bold'),
-                    style='Clickable.TLabel',
-                    wraplength=200,  # Fixed width to ensure text is visible
-                    anchor='w'
-                )
-                customer_label.pack(anchor='w', fill='x', padx=5, pady=5)
-
-                # Make label clickable
-                customer_label.bind(
-                    "<Button-1>", 
-                    lambda e, order=delivery: self.open_order_editor(delivery.delivery_date, order)
-                )
-                
-                # Add a separator
-                ttk.Separator(customer_frame, orient='horizontal').pack(fill='x', padx=5, pady=3)
-                
-                # Create a frame for items
-                items_frame = ttk.Frame(customer_frame)
-                items_frame.pack(fill='x', padx=5, pady=5)
-                
-                # Sort order items alphabetically by name
-                sorted_items = sorted(delivery.order_items, key=lambda item: item.item.name.lower())
-                
-                # List order items in a clean layout
-                for index, order_item in enumerate(sorted_items):
-                    item_frame = ttk.Frame(items_frame)
-                    item_frame.pack(fill='x', pady=2)
-                    
-                    item_text = f"{order_item.item.name}: {order_item.amount:.1f}"
-                    ttk.Label(
-                        item_frame, 
-                        text=item_text,
-                        font=('Arial', 11)
-                    ).pack(anchor='w', padx=10)
+        # Display deliveries for each changed day (already sorted by customer name alphabetically)
+        for i, day in enumerate(days):
+            if monday + timedelta(days=i) not in dirty:
+                continue
+            self.card_pools[day].show(deliveries_by_day[day])
 
             # Make sure canvases are properly configured for scrolling
             if day in self.canvases:
                 self.canvases[day].update_idletasks()
                 self.canvases[day].configure(scrollregion=self.canvases[day].bbox("all"))
-        
-        # After refreshing delivery view, request refreshes for other views
-        self.refresh_other_views()
-        
-    def refresh_other_views(self):
-        """Tell the main app to refresh production and transfer views"""
-        # Only refresh other views if we have an app reference
-        if hasattr(self, 'app') and self.app is not None:
-            # Use the throttled refresh mechanism if available
-            if hasattr(self.app, 'throttled_refresh'):
-                self.app.throttled_refresh()
-            else:
-                # Fallback to the old method if throttled_refresh isn't available
-                self.app.after(100, self.app.refresh_tables)
 
     def create_or_update_new_order_widget(self, day):
         frame = self.day_frames[day]
@@ -579,39 +759,47 @@ class WeeklyDeliveryView(WeeklyBaseView):
         # Open the order editor in "create" mode (order=None) with an optional prefilled customer name
         self.open_order_editor(delivery_date, order=None, prefill_customer=customer_name)
 
+    def open_delivery(self, delivery):
+        """Open the editor for a clicked customer card"""
+        if delivery['id'] is not None:
+            self.open_order_editor_by_id(delivery['id'])
+        else:
+            self.open_occurrence_editor(delivery['subscription_id'], delivery['date'])
+    
+    def open_order_editor_by_id(self, order_id):
+        """Open the editor for the order behind a delivery card"""
+        order = Order.get_or_none(Order.id == order_id)
+        if order is None:
+            # Deleted since the last refresh
+            self.refresh()
+            return
+        self.open_order_editor(order.delivery_date, order)
+
+    def open_occurrence_editor(self, subscription_id, occurrence_date):
+        """Open the editor for a subscription delivery that has no order of its own"""
+        subscription = Subscription.get_or_none(Subscription.id == subscription_id)
+        if subscription is None:
+            self.refresh()
+            return
+        # Unsaved stand-in: saving overrides the occurrence or updates the rule
+        occurrence = Order(
+            customer=subscription.customer,
+            delivery_date=occurrence_date,
+            halbe_channel=subscription.halbe_channel,
+            subscription=subscription,
+            occurrence_date=occurrence_date
+        )
+        self.open_order_editor(occurrence_date, occurrence)
+
     def open_order_editor(self, delivery_date, order=None, prefill_customer=None):
         """
         Opens a Toplevel window for creating a new order (if order is None) or editing an existing order.
         The delivery_date is pre-set; if prefill_customer is provided (for new orders), that value pre-fills the customer field.
         Now handles subscription editing and updates all related future orders.
+        Occurrences of subscription rules (order.subscription set) are saved as
+        overrides ("only this") or as rule updates ("this and future").
         """
-        # Store original order data for undo if editing
-        original_order_data = None
-        original_future_orders_data = []
-        
-        if order and hasattr(self.app, 'serialize_order'):
-            try:
-                # Save the current order data
-                original_order_data = self.app.serialize_order(order)
-                print(f"Original order data saved for undo: Order ID {order.id}")
-                
-                # Also save data for all related future orders if they exist
-                if order.from_date and order.to_date and order.subscription_type > 0:
-                    # Find all future orders in this subscription (excluding the current order)
-                    today = datetime.now().date()
-                    future_orders = list(Order.select().where(
-                        (Order.from_date == order.from_date) &
-                        (Order.to_date == order.to_date) &
-                        (Order.customer == order.customer) &
-                        (Order.delivery_date > order.delivery_date)
-                    ))
-                    
-                    if future_orders:
-                        # Serialize all the future orders
-                        original_future_orders_data = self.app.collect_orders_data(future_orders)
-                        print(f"Also saved {len(original_future_orders_data)} future orders for undo")
-            except Exception as e:
-                print(f"Error serializing order data: {str(e)}")
+        rule = order.subscription if order and order.subscription_id else None
         
         edit_window = tk.Toplevel(self.parent)
         if order:
@@ -652,7 +840,7 @@ class WeeklyDeliveryView(WeeklyBaseView):
         subscription_frame = ttk.LabelFrame(edit_window, text="Subscription Settings")
         subscription_frame.pack(fill='x', padx=10, pady=5)
         
-        sub_var = tk.IntVar(value=0 if not order else order.subscription_type)
+        sub_var = tk.IntVar(value=rule.subscription_type if rule else (0 if not order else order.subscription_type))
         
         # Create frame for subscription type
         sub_type_frame = ttk.Frame(subscription_frame)
@@ -705,7 +893,10 @@ class WeeklyDeliveryView(WeeklyBaseView):
         to_date_entry.pack(side='left', padx=5)
         
         # Set current subscription dates if editing
-        if order and order.from_date and order.to_date:
+        if rule is not None:
+            from_date_entry.insert(0, rule.from_date.strftime('%d.%m.%Y'))
+            to_date_entry.insert(0, rule.to_date.strftime('%d.%m.%Y'))
+        elif order and order.from_date and order.to_date:
             from_date_entry.insert(0, order.from_date.strftime('%d.%m.%Y'))
             to_date_entry.insert(0, order.to_date.strftime('%d.%m.%Y'))
         else:
@@ -768,8 +959,10 @@ class WeeklyDeliveryView(WeeklyBaseView):
             item_rows.append(item_dict)
         
         if order:
+            # An occurrence without override shows the items of its rule
+            existing_items = order.order_items if order.id else rule.subscription_items
             # Sort order items alphabetically by item name
-            sorted_order_items = sorted(order.order_items, key=lambda item: item.item.name.lower())
+            sorted_order_items = sorted(existing_items, key=lambda item: item.item.name.lower())
             for oi in sorted_order_items:
                 add_item_row(existing_order_item=oi)
         else:
@@ -868,10 +1061,32 @@ class WeeklyDeliveryView(WeeklyBaseView):
                 else:  # scope == "future"
                     scope = "this_and_future"
 
-                with self.db.atomic():
-                    if order_obj: # Editing an existing order
+                # Validated before the undo step, no dialog may wait inside its transaction
+                if customer_cb is not None and customer_cb.get() not in self.app.customers:
+                    messagebox.showerror("Fehler", f"Ungültiger Kunde: {customer_cb.get()}")
+                    return
+
+                description = "Änderung einer Bestellung" if order_obj else "Erstellung einer Bestellung"
+                with undo_log.step(description):
+                    if rule is not None: # Editing an occurrence of a subscription rule
+                        items = [(self.app.items[item_name], amount) for item_name, amount in order_items_data]
+                        if scope == 'only_this':
+                            occurrence_dates = occurrence_order_dates(rule, order_obj)
+                            override = override_occurrence(rule, order_obj.occurrence_date, new_date, items,
+                                                           halbe_var.get())
+                            changed = OrderChanged(occurrence_dates | order_dates(override), frozenset({override.id}))
+                        else:
+                            update_subscription(rule, order_obj.occurrence_date, new_date,
+                                                sub_var.get(), from_date, to_date,
+                                                items, halbe_var.get())
+                            # Rule updates can move deliveries in any week
+                            changed = OrderChanged()
+                    
+                    elif order_obj: # Editing an existing order
                         original_delivery_date = order_obj.delivery_date
                         original_subscription_type = order_obj.subscription_type
+                        touched = set(order_dates(order_obj))
+                        order_ids = {order_obj.id}
 
                         # --- Update the current order object ---
                         order_obj.delivery_date = new_date
@@ -891,15 +1106,10 @@ class WeeklyDeliveryView(WeeklyBaseView):
                         order_obj.production_date = new_production_date
                         
                         # --- Update items for the current order ---
-                        # (Existing logic to delete and recreate items for order_obj)
-                        for oi in order_obj.order_items:
-                            oi.delete_instance()
-                        for item_name, amount in order_items_data:
-                            OrderItem.create(
-                                order=order_obj,
-                                item=self.app.items[item_name],
-                                amount=amount
-                            )
+                        new_items = [(self.app.items[item_name], amount) for item_name, amount in order_items_data]
+                        writer = SubscriptionWriter()
+                        OrderItem.delete().where(OrderItem.order == order_obj).execute()
+                        writer.add_items(order_obj, new_items)
                         
                         # --- Check if the order should be detached from subscription ---
                         should_detach = False
@@ -919,17 +1129,14 @@ class WeeklyDeliveryView(WeeklyBaseView):
                              order_obj.subscription_type = 0
                              order_obj.from_date = None
                              order_obj.to_date = None
-                             print(f"Order {order_obj.id} detached from subscription due to edit.")
 
 
                         # Save the potentially modified current order
                         order_obj.save()
+                        touched |= order_dates(order_obj)
 
                         # --- Handle future orders ONLY if scope is 'this_and_future' ---
                         if scope == 'this_and_future' and sub_var.get() > 0:
-                            
-                            print(f"Updating future orders starting from {order_obj.delivery_date}")
-
                             # 1. Delete subsequent future orders of the *original* subscription
                             future_orders_to_delete = Order.select().where(
                                 (Order.customer == order_obj.customer) &
@@ -938,55 +1145,33 @@ class WeeklyDeliveryView(WeeklyBaseView):
                                 (Order.subscription_type == original_subscription_type) & # Match original type
                                 (Order.delivery_date > order_obj.delivery_date) # Only delete orders AFTER this one
                             )
-                            deleted_count = 0
                             for future_order in future_orders_to_delete:
+                                touched |= order_dates(future_order)
+                                order_ids.add(future_order.id)
                                 future_order.delete_instance(recursive=True)
-                                deleted_count += 1
-                            print(f"Deleted {deleted_count} subsequent future orders.")
 
                             # 2. Regenerate future orders based on the *updated* current order
                             # Ensure the order has necessary subscription info before generating
                             if order_obj.subscription_type > 0 and order_obj.from_date and order_obj.to_date:
-                                new_future_orders = generate_subscription_orders(order_obj)
-                                print(f"Regenerating {len(new_future_orders)} future orders.")
-                                
-                                # Get items from the *updated* current order
-                                current_items = list(order_obj.order_items)
-
-                                # 3. Create the new future orders
-                                created_count = 0
-                                for future_data in new_future_orders:
-                                    # Ensure we don't recreate an order for the same date if it somehow exists
-                                    if not Order.select().where(
+                                # Don't recreate an order for a date that somehow still exists
+                                existing_dates = {
+                                    row[0] for row in Order.select(Order.delivery_date).where(
                                         (Order.customer == order_obj.customer) &
-                                        (Order.delivery_date == future_data['delivery_date']) &
-                                        (Order.from_date == future_data['from_date']) & # Match subscription range
-                                        (Order.to_date == future_data['to_date'])
-                                    ).exists():
-                                        new_future_order = Order.create(
-                                            **future_data,
-                                            order_id=uuid.uuid4()
-                                        )
-                                        # Copy items from the updated current order
-                                        for item_data in current_items:
-                                            OrderItem.create(
-                                                order=new_future_order,
-                                                item=item_data.item,
-                                                amount=item_data.amount
-                                            )
-                                        created_count += 1
-                                print(f"Created {created_count} new future orders.")
-                            else:
-                                print("Skipping regeneration: Order is no longer part of a subscription.")
+                                        (Order.delivery_date > order_obj.delivery_date) &
+                                        (Order.from_date == order_obj.from_date) & # Match subscription range
+                                        (Order.to_date == order_obj.to_date)
+                                    ).tuples()
+                                }
+                                # 3. Queue the new future orders with the items of the updated current order
+                                writer.add_subscription_orders(order_obj, new_items, skip_dates=existing_dates)
+                                touched.update(day for row, _ in writer.orders
+                                               for day in (row['delivery_date'], row['production_date']))
+                        
+                        order_ids.update(writer.write()['orders'])
+                        changed = OrderChanged(frozenset(touched), frozenset(order_ids))
 
                     else: # Creating a new order
-                        # Get customer from combobox if this is a new order
-                        customer_name = customer_cb.get()
-                        if customer_name not in self.app.customers:
-                            messagebox.showerror("Fehler", f"Ungültiger Kunde: {customer_name}")
-                            return
-                            
-                        customer = self.app.customers[customer_name]
+                        customer = self.app.customers[customer_cb.get()]
                         
                         # Create temporary items to calculate production date
                         temp_items = []
@@ -997,95 +1182,29 @@ class WeeklyDeliveryView(WeeklyBaseView):
                         # Calculate production date
                         new_production_date = calculate_production_date(new_date, temp_items)
                         
-                        # Create new order
-                        order_obj = Order.create(
-                            customer=customer,
-                            delivery_date=new_date,
-                            production_date=new_production_date,
-                            from_date=from_date,
-                            to_date=to_date,
-                            subscription_type=sub_var.get(),
-                            halbe_channel=halbe_var.get(),
-                            order_id=uuid.uuid4(),
-                            is_future=False
-                        )
-                        
-                        # Create order items
-                        for item_name, amount in order_items_data:
-                            OrderItem.create(
-                                order=order_obj,
-                                item=self.app.items[item_name],
-                                amount=amount
-                            )
-                            
-                        # If it's a subscription, generate future orders
                         if sub_var.get() > 0:
-                            future_orders = generate_subscription_orders(order_obj)
-                            print(f"Generating {len(future_orders)} future orders for new subscription.")
-                            
-                            for future_data in future_orders:
-                                future_order = Order.create(
-                                    **future_data,
-                                    order_id=uuid.uuid4()
-                                )
-                                
-                                # Copy items to future order
-                                for item_name, amount in order_items_data:
-                                    OrderItem.create(
-                                        order=future_order,
-                                        item=self.app.items[item_name],
-                                        amount=amount
-                                    )
+                            # Subscriptions are stored as one rule, the views expand the deliveries
+                            create_subscription(
+                                customer, sub_var.get(), new_date, from_date, to_date,
+                                [(self.app.items[item_name], amount) for item_name, amount in order_items_data],
+                                halbe_channel=halbe_var.get()
+                            )
+                            changed = OrderChanged()
+                        else:
+                            # Create new order with its items
+                            writer = SubscriptionWriter()
+                            writer.add_order(
+                                customer, new_date,
+                                [(self.app.items[item_name], amount) for item_name, amount in order_items_data],
+                                production_date=new_production_date,
+                                halbe_channel=halbe_var.get()
+                            )
+                            created = writer.write()['orders']
+                            changed = OrderChanged(frozenset({new_date, new_production_date}), frozenset(created))
 
-                # After successful save, notify the app for undo history if editing an existing order
-                if order and self.edit_callback:
-                    try:
-                        # For edited orders, get the updated data
-                        updated_order_data = self.app.serialize_order(order)
-                        
-                        # Check which scope was selected
-                        scope = update_type.get()
-                        
-                        if scope == "current":
-                            # Single order edit - just send the original and updated order data
-                            print(f"Calling edit callback for single order {order.id}")
-                            self.edit_callback(original_order_data, updated_order_data)
-                        else:  # scope == "future"
-                            # Multiple orders edit - send original order + future orders, and updated versions
-                            print(f"Calling edit callback for order {order.id} plus future orders")
-                            
-                            # Combine the original order and future orders into a single undo record
-                            combined_original_data = {
-                                'orders': [original_order_data] + original_future_orders_data
-                            }
-                            
-                            # Get all current orders in the subscription after our changes
-                            current_subscription_orders = list(Order.select().where(
-                                (Order.from_date == order.from_date) &
-                                (Order.to_date == order.to_date) &
-                                (Order.customer == order.customer)
-                            ))
-                            
-                            # Serialize the current state of all these orders
-                            updated_subscription_data = self.app.collect_orders_data(current_subscription_orders)
-                            combined_updated_data = {
-                                'orders': updated_subscription_data
-                            }
-                            
-                            # Send both the original and updated data to the callback
-                            self.edit_callback(combined_original_data, combined_updated_data)
-                    except Exception as e:
-                        print(f"Error in edit callback: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                
                 messagebox.showinfo("Erfolg", "Bestellung erfolgreich gespeichert!")
                 edit_window.destroy()
-                self.refresh() # Refresh the current view
-                
-                # Also refresh the production and transfer views if they exist
-                if hasattr(self.app, 'refresh_tables'):
-                    self.app.refresh_tables()
+                bus.publish(changed)
 
             except Exception as e:
                 messagebox.showerror("Fehler", str(e))
@@ -1116,21 +1235,29 @@ class WeeklyDeliveryView(WeeklyBaseView):
                     confirm_msg = "Sind Sie sicher, dass Sie diese Bestellung und alle zukünftigen Bestellungen mit identischen Artikeln löschen möchten?"
                 
                 if messagebox.askyesno("Bestellung löschen", confirm_msg):
-                    with self.db.atomic():  # Use transaction to ensure all operations succeed or fail together
-                        if scope == "current":
-                            # Store the order for undo
-                            if hasattr(self.app, 'record_action') and hasattr(self.app, 'serialize_order'):
-                                order_data = self.app.serialize_order(order)
-                                self.app.record_action(
-                                    "delete_order",
-                                    order_data,
-                                    None,
-                                    "Löschung einer Bestellung"
-                                )
-                            
+                    if rule is not None:
+                        description = "Löschung von Abonnement-Lieferungen"
+                    elif scope == "current":
+                        description = "Löschung einer Bestellung"
+                    else:
+                        description = "Löschung von Bestellungen"
+                    # One transaction and one undo step for all deletions
+                    with undo_log.step(description):
+                        if rule is not None:
+                            if scope == "current":
+                                # An override without items cancels the delivery
+                                dates = occurrence_order_dates(rule, order)
+                                override = override_occurrence(rule, order.occurrence_date, items=[])
+                                changed = OrderChanged(dates, frozenset({override.id}))
+                            else:
+                                end_subscription(rule, order.occurrence_date)
+                                changed = OrderChanged()
+                            message = "Abonnement-Lieferung(en) erfolgreich gelöscht!"
+                        elif scope == "current":
                             # Delete only this order
+                            changed = OrderChanged(order_dates(order), frozenset({order.id}))
                             order.delete_instance(recursive=True)  # Deletes the order and its related items
-                            messagebox.showinfo("Erfolg", "Bestellung erfolgreich gelöscht!")
+                            message = "Bestellung erfolgreich gelöscht!"
                         else:  # scope == "future"
                             # Get the weekday and items of the current order for matching
                             current_weekday = order.delivery_date.weekday()
@@ -1165,53 +1292,53 @@ class WeeklyDeliveryView(WeeklyBaseView):
                                 if order_items == current_order_items:
                                     matching_orders.append(future_order)
                             
-                            # Store for undo
-                            if hasattr(self.app, 'record_action') and hasattr(self.app, 'collect_orders_data'):
-                                deleted_orders_data = self.app.collect_orders_data(matching_orders)
-                                self.app.record_action(
-                                    "delete_order",
-                                    {'orders': deleted_orders_data},
-                                    None,
-                                    f"Löschung von {len(matching_orders)} Bestellungen"
-                                )
-                            
                             # Delete all selected orders
+                            changed = OrderChanged(order_dates(*matching_orders),
+                                                   frozenset(future_order.id for future_order in matching_orders))
                             deleted_count = 0
                             for future_order in matching_orders:
                                 future_order.delete_instance(recursive=True)
                                 deleted_count += 1
-                                
-                            messagebox.showinfo("Erfolg", f"{deleted_count} Bestellung(en) erfolgreich gelöscht!")
+                            message = f"{deleted_count} Bestellung(en) erfolgreich gelöscht!"
                     
+                    # Only after the step committed, the dialog must not hold the write transaction open
+                    messagebox.showinfo("Erfolg", message)
                     edit_window.destroy()
-                    self.refresh()
+                    bus.publish(changed)
 
             delete_btn = ttk.Button(buttons_frame, text="Delete Order", command=delete_order)
             delete_btn.pack(side='left', padx=5)
             
 class WeeklyProductionView(WeeklyBaseView):
+    journal_kind = 'production'
+    
     def __init__(self, parent, app=None, db=None):
         super().__init__(parent)
         self.app = app  # Store reference to main app
         self.db = db    # Store reference to database
-        self.last_refresh_time = 0  # To track when we last refreshed
-        self.refresh_throttle = 1000  # minimum ms between refreshes
         self.refresh()
         
     def refresh(self):
-        # Add throttling to prevent excessive refreshes
-        current_time = int(time.time() * 1000)  # Current time in ms
-        if current_time - self.last_refresh_time < self.refresh_throttle:
-            # Skip this refresh if it's too soon after the last one
-            return
-            
-        self.last_refresh_time = current_time
-        self.clear_day_frames()
-        monday = self.get_monday_of_week()
-        end_of_week = monday + timedelta(days=6)
-        
+        self.load_week(self.fetch_week, self.show_week)
+    
+    @staticmethod
+    def fetch_week(monday):
+        """Fetch phase of refresh(), runs on the loader thread"""
         # Get all production tasks for the week
-        production_data = get_production_plan(monday, end_of_week)
+        production_data = get_production_week(monday)
+        
+        # This is diagnostic data to help understand why Sundays might be empty:
+        # the production on the Sunday of the current week
+        today = datetime.now().date()
+        this_monday = today - timedelta(days=today.weekday())
+        sunday_check_date = this_monday + timedelta(days=6)  # Next Sunday
+        current_week = production_data if this_monday == monday else get_production_week(this_monday)
+        sunday_check = [prod for prod in current_week if prod['date'] == sunday_check_date]
+        return production_data, sunday_check
+    
+    def show_week(self, monday, data, dirty):
+        """Apply phase of refresh(): draw the fetched production of the dirty days"""
+        production_data, sunday_check = data
         
         # Group by day
         days = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
@@ -1228,13 +1355,18 @@ class WeeklyProductionView(WeeklyBaseView):
             if day in self.day_labels:
                 self.day_labels[day].configure(text=day_label)
             
+            # Days without changes keep their widgets
+            if date not in dirty:
+                continue
+            self.clear_day_frame(day)
+            
             # Get the frame for this day
             frame = self.day_frames[day]
             
             # Filter production items for this day
             day_production = []
             for prod in production_data:
-                if prod.order.production_date.weekday() == i:
+                if prod['date'].weekday() == i:
                     day_production.append(prod)
                     day_has_items[day] = True
             
@@ -1264,31 +1396,23 @@ class WeeklyProductionView(WeeklyBaseView):
             separator = ttk.Separator(items_frame, orient='horizontal')
             separator.grid(row=1, column=0, columnspan=2, sticky='ew', padx=3, pady=2)
             
-            # Sort items alphabetically by name
-            sorted_items = sorted(day_production, key=lambda x: x.item.name.lower())
-            
-            # Add each production item in a grid layout
+            # Add each production item (already sorted by name) in a grid layout
             row_index = 2  # Start after header and separator
-            for prod in sorted_items:
+            for prod in day_production:
                 # Item name
-                item_label = ttk.Label(items_frame, text=prod.item.name, font=('Arial', 10))
+                item_label = ttk.Label(items_frame, text=prod['item'], font=('Arial', 10))
                 item_label.grid(row=row_index, column=0, sticky='w', padx=5, pady=2)
                 
                 # Amount with right alignment
-                amount_label = ttk.Label(items_frame, text=f"{prod.total_amount:.1f}", font=('Arial', 10))
+                amount_label = ttk.Label(items_frame, text=f"{prod['amount']:.1f}", font=('Arial', 10))
                 amount_label.grid(row=row_index, column=1, sticky='e', padx=5, pady=2)
                 
                 row_index += 1
             
-        # After processing all days, check if Sunday has no items consistently
-        if not day_has_items['Sonntag']:
+        # After processing all days, check if the redrawn Sunday has no items consistently
+        if monday + timedelta(days=6) in dirty and not day_has_items['Sonntag']:
             # Check if there are any Sunday orders in the database
-            # This is diagnostic code to help understand why Sundays might be empty
-            today = datetime.now().date()
-            sunday_check_date = today - timedelta(days=today.weekday()) + timedelta(days=6)  # Next Sunday
-            sunday_check = get_production_plan(sunday_check_date, sunday_check_date)
-            
-            if not list(sunday_check):
+            if not sunday_check:
                 # If still no Sunday items, let's add a diagnostic message just for this view
                 sunday_frame = self.day_frames['Sonntag']
                 diagnostic_label = ttk.Label(sunday_frame, 
@@ -1298,28 +1422,25 @@ class WeeklyProductionView(WeeklyBaseView):
                 diagnostic_label.pack(padx=5, pady=5, anchor='w')
                     
 class WeeklyTransferView(WeeklyBaseView):
+    journal_kind = 'transfer'
+    
     def __init__(self, parent, app=None, db=None):
         super().__init__(parent)
         self.app = app  # Store reference to main app
         self.db = db    # Store reference to database
-        self.last_refresh_time = 0  # To track when we last refreshed
-        self.refresh_throttle = 1000  # minimum ms between refreshes
         self.refresh()
         
     def refresh(self):
-        # Add throttling to prevent excessive refreshes
-        current_time = int(time.time() * 1000)  # Current time in ms
-        if current_time - self.last_refresh_time < self.refresh_throttle:
-            # Skip this refresh if it's too soon after the last one
-            return
-            
-        self.last_refresh_time = current_time
-        self.clear_day_frames()
-        monday = self.get_monday_of_week()
-        end_of_week = monday + timedelta(days=6)
-        
+        self.load_week(self.fetch_week, self.show_week)
+    
+    @staticmethod
+    def fetch_week(monday):
+        """Fetch phase of refresh(), runs on the loader thread"""
         # Get all transfers for the week
-        transfer_data = get_transfer_schedule(monday, end_of_week)
+        return get_transfer_schedule(monday, monday + timedelta(days=6))
+    
+    def show_week(self, monday, transfer_data, dirty):
+        """Apply phase of refresh(): draw the fetched transfers of the dirty days"""
         
         # Group by day
         days = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
@@ -1333,6 +1454,11 @@ class WeeklyTransferView(WeeklyBaseView):
             if day in self.day_labels:
                 self.day_labels[day].configure(text=day_label)
             
+            # Days without changes keep their widgets
+            if date not in dirty:
+                continue
+            self.clear_day_frame(day)
+            
             # Get the frame for this day
             frame = self.day_frames[day]
             